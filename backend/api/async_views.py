@@ -0,0 +1,74 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from api import metrics
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.ASYNC_VIEW_WORKERS,
+                thread_name_prefix='api-view'
+            )
+        return _executor
+
+
+def run_view(view, request, *args, **kwargs):
+    """
+    Выполняет синхронное представление в потоке пула.
+
+    Соединения с базой данных принадлежат потоку, поэтому устаревшие
+    соединения закрываются до и после обработки запроса, а SQL-запросы
+    учитываются в метриках запроса (MetricsMiddleware) в этом же потоке.
+    Потоковый ответ собирается здесь же: ASGIHandler перебирает его
+    синхронно в цикле событий, где обращения к базе данных запрещены.
+    """
+    close_old_connections()
+    try:
+        request_metrics = getattr(request, 'metrics', None)
+        with metrics.record_queries(
+            request_metrics or metrics.RequestMetrics()
+        ):
+            response = view(request, *args, **kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+            if response.streaming:
+                response.streaming_content = list(response.streaming_content)
+        return response
+    finally:
+        close_old_connections()
+
+
+def async_view(view):
+    """
+    Асинхронная обертка синхронного представления.
+
+    Django 3.2 не поддерживает асинхронные запросы ORM, поэтому
+    представление выполняется в пуле из ASYNC_VIEW_WORKERS потоков,
+    а цикл событий ASGI-сервера продолжает принимать запросы.
+    Без обертки ASGIHandler выполняет все синхронные представления
+    процесса в одном потоке. Представление выполняется в копии контекста
+    (contextvars) запроса, как при asyncio.to_thread.
+    """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(
+            get_executor(),
+            functools.partial(
+                context.run, run_view, view, request, *args, **kwargs
+            )
+        )
+    return wrapper
@@ -0,0 +1,56 @@
+from bisect import bisect_left
+
+from api import constants as c
+from api.cache import get_local
+from api.serializers import FoodstuffSerializer
+from recipes.models import Foodstuff
+
+
+class PrefixIndex:
+    """
+    Индекс для поиска по началу строки без учета регистра.
+
+    Хранит отсортированный массив ключей (наименований, приведенных
+    методом casefold) и соответствующих им сериализованных объектов.
+    Поиск выполняется бинарным поиском за O(log n + k), где k - количество
+    возвращаемых объектов. Точные совпадения с запросом всегда
+    предшествуют остальным, так как ключ, равный префиксу, меньше любого
+    ключа, начинающегося с этого префикса.
+    """
+
+    def __init__(self, items, key):
+        entries = sorted(
+            ((item[key].casefold(), item['id']), item) for item in items
+        )
+        self.keys = [entry[0][0] for entry in entries]
+        self.items = [entry[1] for entry in entries]
+
+    def search(self, prefix, limit=None):
+        prefix = prefix.strip().casefold()
+        start = bisect_left(self.keys, prefix)
+        result = []
+        for index in range(start, len(self.keys)):
+            if limit is not None and len(result) >= limit:
+                break
+            if not self.keys[index].startswith(prefix):
+                break
+            result.append(self.items[index])
+        return result
+
+
+def build_foodstuff_index(version):
+    items = FoodstuffSerializer(Foodstuff.objects.all(), many=True).data
+    return PrefixIndex(items, 'name')
+
+
+def get_foodstuff_index():
+    """
+    Возвращает индекс продуктов для автодополнения.
+
+    Индекс строится в памяти процесса при первом обращении и
+    перестраивается после изменения таблицы продуктов.
+    """
+    return get_local(
+        ('index', c.FOODSTUFF_SNAPSHOT), c.FOODSTUFF_SNAPSHOT,
+        build_foodstuff_index
+    )
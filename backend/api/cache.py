@@ -0,0 +1,151 @@
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from api.models import DataVersion
+from backend.db.router import use_primary
+
+CATALOG = 'catalog'
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+# набор данных: (версия, время проверки версии)
+_versions = {}
+_local = {}
+_local_lock = threading.Lock()
+# наборы данных, версии которых обновляются после фиксации транзакции
+_pending = threading.local()
+
+
+def get_cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def get_version(name):
+    """
+    Возвращает версию набора данных name.
+
+    Версии хранятся в таблице DataVersion основной базы данных и общие
+    для всех процессов сервера. Процесс перечитывает версию не чаще
+    одного раза в DATA_VERSION_CHECK_INTERVAL секунд: изменение,
+    сделанное другим процессом, становится видно не позже чем через
+    этот интервал. Версия - время последнего изменения данных
+    в наносекундах.
+    """
+    now = time.monotonic()
+    checked = _versions.get(name)
+    if (
+        checked is not None
+        and now - checked[1] < settings.DATA_VERSION_CHECK_INTERVAL
+    ):
+        return checked[0]
+    versions = DataVersion.objects.using(DEFAULT_DB_ALIAS)
+    version = versions.filter(name=name).values_list(
+        'version', flat=True
+    ).first()
+    if version is None:
+        version = versions.get_or_create(
+            name=name, defaults={'version': time.time_ns()}
+        )[0].version
+    _versions[name] = (version, now)
+    return version
+
+
+def get_pending_versions():
+    """
+    Возвращает множество наборов данных, версии которых ожидают
+    обновления после фиксации транзакции текущего потока.
+    """
+    if not hasattr(_pending, 'names'):
+        _pending.names = set()
+    return _pending.names
+
+
+def discard_pending_versions():
+    """Отменяет ожидающие обновления версий (транзакция отменена)."""
+    _pending.names = set()
+
+
+def flush_versions():
+    names = get_pending_versions()
+    if not names:
+        return
+    discard_pending_versions()
+    version = time.time_ns()
+    versions = DataVersion.objects.using(DEFAULT_DB_ALIAS)
+    updated = versions.filter(name__in=names).update(version=version)
+    if updated < len(names):
+        for missing in names:
+            versions.update_or_create(
+                name=missing, defaults={'version': version}
+            )
+    now = time.monotonic()
+    for changed in names:
+        _versions[changed] = (version, now)
+
+
+def bump_version(name):
+    """
+    Обновляет версию набора данных name после фиксации транзакции.
+
+    Ранее сохраненные данные становятся недоступны без перебора ключей.
+    Версии всех наборов данных, измененных в транзакции, обновляются
+    одним запросом: первый обработчик фиксации обновляет все ожидающие
+    версии, остальные обработчики транзакции ничего не делают.
+    Обработчик регистрируется при каждом вызове, поэтому после отмены
+    транзакции обновление не теряется: ожидающие версии отмененной
+    транзакции обновляются при следующей фиксации.
+    """
+    get_pending_versions().add(name)
+    transaction.on_commit(flush_versions)
+
+
+def get_local(key, name, build, update=None):
+    """
+    Возвращает объект, построенный для текущей версии набора данных name.
+
+    Объект хранится в памяти процесса под ключом key и пересобирается
+    функцией build(version) только после изменения версии. Если задана
+    функция update(obj, version), после изменения версии она возвращает
+    объект, обновленный по изменившимся данным, вместо полной сборки.
+    Данные читаются из основной базы данных: реплика может еще
+    не содержать изменение, обновившее версию.
+    """
+    version = get_version(name)
+    local = _local.get(key)
+    if local is None or local[0] != version:
+        with _local_lock:
+            local = _local.get(key)
+            if local is None or local[0] != version:
+                with use_primary():
+                    if local is None or update is None:
+                        obj = build(version)
+                    else:
+                        obj = update(local[1], version)
+                local = (version, obj)
+                _local[key] = local
+    return local[1]
+
+
+def get_catalog_version():
+    return get_version(CATALOG)
+
+
+def bump_catalog_version():
+    bump_version(CATALOG)
+
+
+def count_request(hit):
+    with _stats_lock:
+        _stats['hits' if hit else 'misses'] += 1
+
+
+def get_cache_stats():
+    """Возвращает счетчики попаданий и промахов кэша ответов процесса."""
+    with _stats_lock:
+        return {'hits': _stats['hits'], 'misses': _stats['misses']}
@@ -1,2 +1,50 @@
 # pagination
 PAGE_SIZE = 6
+
+# filters
+TAGS_MODE_ANY = 'any'
+TAGS_MODE_ALL = 'all'
+TAGS_MODE_CHOICES = (
+    (TAGS_MODE_ANY, 'Любой из тегов'),
+    (TAGS_MODE_ALL, 'Все теги'),
+)
+INGREDIENTS_MODE_ALL = 'all'
+INGREDIENTS_MODE_ANY = 'any'
+INGREDIENTS_MODE_MISSING = 'missing'
+INGREDIENTS_MODE_CHOICES = (
+    (INGREDIENTS_MODE_ALL, 'Все продукты'),
+    (INGREDIENTS_MODE_ANY, 'Любой из продуктов'),
+    (INGREDIENTS_MODE_MISSING, 'Недостает не более missing продуктов'),
+)
+RECIPE_ORDERING_POPULAR = 'popular'
+RECIPE_ORDERING_CHOICES = (
+    (RECIPE_ORDERING_POPULAR, 'По популярности'),
+)
+
+# snapshots
+TAGS_SNAPSHOT = 'tags'
+FOODSTUFF_SNAPSHOT = 'ingredients'
+INGREDIENT_INDEX = 'ingredient_index'
+# индекс ингредиентов: полная перестройка после массовой загрузки
+# рецептов; рецепты, измененные не раньше чем за OVERLAP секунд
+# до предыдущего обновления (транзакция, расхождение часов серверов),
+# читаются повторно; индекс перестраивается полностью не реже чем
+# раз в TTL секунд при очередном изменении
+INGREDIENT_INDEX_REBUILD = 'ingredient_index_rebuild'
+INGREDIENT_INDEX_OVERLAP = 60
+INGREDIENT_INDEX_TTL = 60 * 60
+
+# replicas: cookie закрепления клиента за основной базой данных
+REPLICA_COOKIE = 'primary_reads'
+
+# metrics
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# batch: максимальное количество идентификаторов в запросе
+BATCH_MAX_SIZE = 100
+
+# сортировка рецептов при выводе по курсору, последнее поле уникально
+RECIPE_CURSOR_ORDERING = ('-pub_date', '-id')
+SEARCH_CURSOR_ORDERING = ('-search_rank', '-id')
+MISSING_CURSOR_ORDERING = ('missing_ingredients', '-id')
+POPULAR_CURSOR_ORDERING = ('-popularity', '-id')
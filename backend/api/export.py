@@ -0,0 +1,101 @@
+import csv
+import io
+import json
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from rest_framework.negotiation import DefaultContentNegotiation
+
+from recipes.shopping_list import get_items
+
+TITLE = 'Список продуктов:'
+CSV_HEADER = ('name', 'measurement_unit', 'amount')
+PDF_CHUNK_SIZE = 64 * 1024
+PDF_FONT_NAME = 'ShoppingCartFont'
+
+
+class ExportContentNegotiation(DefaultContentNegotiation):
+    """
+    Выбор рендерера без учета параметра запроса format.
+
+    В выгрузке списка покупок параметр format задает формат файла,
+    ответы с ошибками возвращаются первым рендерером представления.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+class Echo:
+    """Объект с методом write, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def iter_shopping_cart(user):
+    """
+    Возвращает итератор строк списка покупок (продукт, единица, количество).
+
+    Строки читаются из списка покупок пользователя, который обновляется
+    при изменении корзины (recipes.shopping_list).
+    """
+    return get_items(user)
+
+
+def export_txt(rows):
+    yield f'{TITLE} \r\n'
+    yield '-' * 40 + '\r\n'
+    for row in rows:
+        yield '- {0} ({1}) - {2}\r\n'.format(*row)
+
+
+def export_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def export_json(rows):
+    yield '['
+    for index, row in enumerate(rows):
+        item = json.dumps(dict(zip(CSV_HEADER, row)), ensure_ascii=False)
+        yield item if index == 0 else ',' + item
+    yield ']'
+
+
+def export_pdf(rows):
+    # PDF формируется целиком, ответ передается частями
+    font_name = PDF_FONT_NAME
+    if font_name not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(
+            TTFont(font_name, settings.SHOPPING_CART_PDF_FONT)
+        )
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    _, height = A4
+    margin, line_height = 50, 18
+    y = height - margin
+    for line in export_txt(rows):
+        if y < margin:
+            pdf.showPage()
+            y = height - margin
+        pdf.setFont(font_name, 12)
+        pdf.drawString(margin, y, line.strip())
+        y -= line_height
+    pdf.save()
+    buffer.seek(0)
+    yield from iter(lambda: buffer.read(PDF_CHUNK_SIZE), b'')
+
+
+# формат: (функция выгрузки, content-type, расширение файла)
+EXPORT_FORMATS = {
+    'txt': (export_txt, 'text/plain; charset=utf-8', 'txt'),
+    'csv': (export_csv, 'text/csv; charset=utf-8', 'csv'),
+    'json': (export_json, 'application/json', 'json'),
+    'pdf': (export_pdf, 'application/pdf', 'pdf'),
+}
@@ -1,29 +1,156 @@
+from django import forms
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
+from django_filters.widgets import QueryArrayWidget
 
-from recipes.models import Recipe
+from api import constants as c
+from api.ingredient_index import (annotate_values, filter_ids,
+                                  get_ingredient_index)
+from recipes.models import Recipe, RecipeTag
+from recipes.search import search_recipes
+
+
+class IntegerListField(forms.Field):
+    """Список целых чисел: повторяющийся параметр или через запятую."""
+    widget = QueryArrayWidget
+    default_error_messages = {
+        'invalid': 'Введите список целых чисел.',
+    }
+
+    def to_python(self, value):
+        try:
+            return [
+                int(item) for items in value or () for item in
+                items.split(',') if item.strip()
+            ]
+        except (TypeError, ValueError):
+            raise forms.ValidationError(
+                self.error_messages['invalid'], code='invalid'
+            )
+
+
+class IntegerListFilter(filters.Filter):
+    field_class = IntegerListField
+
+
+class IntegerFilter(filters.Filter):
+    field_class = forms.IntegerField
 
 
 class RecipeFilter(filters.FilterSet):
     """
     Фильтр представления RecipeViewSet.
 
-    Возможна фильтрация по нескольким tags по условию ИЛИ.
+    Возможна фильтрация по нескольким tags, условие задает tags_mode:
+    any (по умолчанию) - ИЛИ, all - И. Фильтр по тегам выполняется
+    подзапросами EXISTS, без соединения таблиц и DISTINCT.
+    ingredients - идентификаторы продуктов, условие задает
+    ingredients_mode: all (по умолчанию) - рецепты со всеми продуктами,
+    any - хотя бы с одним, missing - рецепты, для которых недостает не
+    более missing продуктов (по умолчанию 0), упорядоченные по количеству
+    недостающих продуктов. exclude_ingredients исключает рецепты
+    с указанными продуктами. Фильтры по продуктам выполняются по
+    инвертированному индексу (api.ingredient_index), без соединения
+    таблиц.
     is_favorited вернет рецепты, находящиеся в избранном.
     is_in_shopping_cart - рецепты, находящиеся в списке покупок.
     Возможные значения: 1, True. При других значениях фильтр отключен.
+    search - полнотекстовый поиск по названию и тексту рецепта,
+    результаты упорядочены по релевантности.
+    ordering=popular упорядочивает рецепты по популярности
+    (recipes.popularity) вместо порядка по умолчанию, релевантности
+    и количества недостающих продуктов.
     """
     author = filters.NumberFilter(field_name='author')
     tags = filters.CharFilter(method='filter_tags')
+    tags_mode = filters.ChoiceFilter(
+        choices=c.TAGS_MODE_CHOICES, method='filter_tags_mode'
+    )
+    ingredients = IntegerListFilter(method='filter_ingredients')
+    ingredients_mode = filters.ChoiceFilter(
+        choices=c.INGREDIENTS_MODE_CHOICES, method='filter_ingredients_mode'
+    )
+    missing = IntegerFilter(
+        min_value=0, method='filter_ingredients_mode'
+    )
+    exclude_ingredients = IntegerListFilter(
+        method='filter_exclude_ingredients'
+    )
     is_favorited = filters.BooleanFilter(method='filter_favorited')
     is_in_shopping_cart = filters.BooleanFilter(method='filter_shopping_cart')
+    search = filters.CharFilter(method='filter_search')
+    # объявлен последним: сортировка заменяет сортировку других фильтров
+    ordering = filters.ChoiceFilter(
+        choices=c.RECIPE_ORDERING_CHOICES, method='filter_ordering'
+    )
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.kwargs = kwargs
 
+    @property
+    def cursor_ordering(self):
+        """
+        Порядок вывода по курсору, заданный примененными фильтрами.
+
+        Определяется по проверенным значениям параметров: фильтр с пустым
+        значением (search из пробелов, ingredients без идентификаторов)
+        не применяется и не добавляет поле сортировки в queryset.
+        """
+        data = self.form.cleaned_data
+        if data.get('ordering') == c.RECIPE_ORDERING_POPULAR:
+            return c.POPULAR_CURSOR_ORDERING
+        if data.get('search'):
+            return c.SEARCH_CURSOR_ORDERING
+        if (
+            data.get('ingredients')
+            and data.get('ingredients_mode') == c.INGREDIENTS_MODE_MISSING
+        ):
+            return c.MISSING_CURSOR_ORDERING
+        return c.RECIPE_CURSOR_ORDERING
+
     def filter_tags(self, queryset, field, value):
-        list_tags = dict(self.kwargs['data'])['tags']
-        return queryset.filter(tags__slug__in=list_tags).distinct()
+        list_tags = set(self.data.getlist('tags'))
+        recipe_tags = RecipeTag.objects.filter(recipe=OuterRef('pk'))
+        if self.data.get('tags_mode') == c.TAGS_MODE_ALL:
+            for slug in list_tags:
+                queryset = queryset.filter(
+                    Exists(recipe_tags.filter(tag__slug=slug))
+                )
+            return queryset
+        return queryset.filter(
+            Exists(recipe_tags.filter(tag__slug__in=list_tags))
+        )
+
+    def filter_tags_mode(self, queryset, field, value):
+        # значение используется в filter_tags
+        return queryset
+
+    def filter_ingredients(self, queryset, field, value):
+        index = get_ingredient_index()
+        mode = self.form.cleaned_data.get('ingredients_mode')
+        if mode == c.INGREDIENTS_MODE_ANY:
+            return filter_ids(queryset, index.any(value))
+        if mode == c.INGREDIENTS_MODE_MISSING:
+            missing = index.missing(
+                value, self.form.cleaned_data.get('missing') or 0
+            )
+            queryset = annotate_values(
+                queryset, 'missing_ingredients', missing
+            )
+            return filter_ids(queryset, missing).order_by(
+                'missing_ingredients', '-pub_date', '-id'
+            )
+        return filter_ids(queryset, index.all(value))
+
+    def filter_ingredients_mode(self, queryset, field, value):
+        # значение используется в filter_ingredients
+        return queryset
+
+    def filter_exclude_ingredients(self, queryset, field, value):
+        return filter_ids(
+            queryset, get_ingredient_index().any(value), exclude=True
+        )
 
     def filter_favorited(self, queryset, field, value):
         is_favorited = self.kwargs['data']['is_favorited']
@@ -37,6 +164,14 @@ class RecipeFilter(filters.FilterSet):
             return queryset.filter(basket__user=self.request.user)
         return queryset
 
+    def filter_search(self, queryset, field, value):
+        return search_recipes(queryset, value).order_by(
+            '-search_rank', '-pub_date', '-id'
+        )
+
+    def filter_ordering(self, queryset, field, value):
+        return queryset.order_by(*c.POPULAR_CURSOR_ORDERING)
+
     class Meta:
         model = Recipe
         fields = ('author', 'tags',)
@@ -0,0 +1,143 @@
+import io
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from PIL import Image, ImageOps
+
+from api.cache import bump_catalog_version
+from recipes.models import Recipe
+from recipes.storage import recipe_image_variant_storage
+
+logger = logging.getLogger(__name__)
+
+# формат: (формат Pillow, расширение файла)
+VARIANT_FORMATS = {
+    'webp': ('WEBP', 'webp'),
+    'jpeg': ('JPEG', 'jpg'),
+}
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def render_variants(data, sizes, quality):
+    """
+    Создает уменьшенные копии изображения во всех форматах VARIANT_FORMATS.
+
+    Изображение декодируется один раз, копии сохраняются без метаданных
+    (EXIF, ICC) с учетом ориентации из EXIF. Функция не обращается
+    к Django и может выполняться в отдельном процессе.
+    Возвращает словарь {(размер, формат): содержимое файла}.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        result = {}
+        for size, box in sizes.items():
+            thumbnail = image.copy()
+            thumbnail.thumbnail(box, Image.LANCZOS)
+            for variant_format, (pil_format, _) in VARIANT_FORMATS.items():
+                buffer = io.BytesIO()
+                thumbnail.save(buffer, pil_format, quality=quality)
+                result[size, variant_format] = buffer.getvalue()
+    return result
+
+
+def get_executor(kind):
+    with _executors_lock:
+        if kind not in _executors:
+            executor_class = (
+                ProcessPoolExecutor if kind == 'process'
+                else ThreadPoolExecutor
+            )
+            _executors[kind] = executor_class(
+                max_workers=settings.IMAGE_PIPELINE_WORKERS
+            )
+        return _executors[kind]
+
+
+def get_variant_names(variants):
+    for formats in variants.get('sizes', {}).values():
+        yield from formats.values()
+
+
+def delete_variant_files(variants):
+    for name in get_variant_names(variants):
+        recipe_image_variant_storage.delete(name)
+
+
+def process_recipe_image(recipe_id):
+    """
+    Создает уменьшенные копии изображения рецепта и сохраняет их адреса.
+
+    Копии сохраняются под именами, вычисленными по содержимому
+    (recipe_image_variant_storage): одинаковые копии, например копии
+    общего изображения нескольких рецептов, хранятся в одном экземпляре.
+    Если изображение рецепта изменилось во время обработки, созданные файлы
+    удаляются. Файлы копий предыдущего изображения удаляются после
+    сохранения новых. Файлы, на которые ссылаются другие рецепты,
+    не удаляются: блокировки имен файлов копий удерживаются до фиксации
+    их адресов в рецепте.
+    """
+    recipe = Recipe.objects.filter(pk=recipe_id).only(
+        'image', 'image_variants'
+    ).first()
+    if recipe is None or not recipe.image:
+        return
+    source = recipe.image.name
+    if recipe.image_variants.get('source') == source:
+        return
+    with recipe.image.open('rb') as file:
+        data = file.read()
+    args = (
+        data, settings.IMAGE_VARIANT_SIZES, settings.IMAGE_VARIANT_QUALITY
+    )
+    if settings.IMAGE_PIPELINE_MODE == 'process':
+        rendered = get_executor('process').submit(
+            render_variants, *args
+        ).result()
+    else:
+        rendered = render_variants(*args)
+    variants = {'source': source, 'sizes': {}}
+    with transaction.atomic():
+        for (size, variant_format), content in rendered.items():
+            extension = VARIANT_FORMATS[variant_format][1]
+            name = recipe_image_variant_storage.save(
+                f'{settings.IMAGE_VARIANTS_DIR}/{size}.{extension}',
+                ContentFile(content)
+            )
+            variants['sizes'].setdefault(size, {})[variant_format] = name
+        updated = Recipe.objects.filter(pk=recipe_id, image=source).update(
+            image_variants=variants
+        )
+    if not updated:
+        delete_variant_files(variants)
+        return
+    delete_variant_files(recipe.image_variants)
+    bump_catalog_version()
+
+
+def run_image_job(recipe_id):
+    try:
+        process_recipe_image(recipe_id)
+    except Exception:
+        logger.exception('Ошибка обработки изображения рецепта %s', recipe_id)
+    finally:
+        connections.close_all()
+
+
+def schedule_image_processing(recipe_id):
+    """
+    Ставит обработку изображения рецепта в очередь пула потоков.
+
+    Режим задается настройкой IMAGE_PIPELINE_MODE: thread - обработка
+    в потоке, process - декодирование и кодирование копий в пуле
+    процессов, sync - обработка сразу в текущем потоке.
+    """
+    if settings.IMAGE_PIPELINE_MODE == 'sync':
+        process_recipe_image(recipe_id)
+        return
+    get_executor('thread').submit(run_image_job, recipe_id)
@@ -0,0 +1,215 @@
+import copy
+import json
+import time
+from array import array
+from collections import Counter
+from datetime import timedelta
+from itertools import chain
+
+from django.db import connections
+from django.db.models import BooleanField, Case, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from api import constants as c
+from api.cache import get_local, get_version
+from recipes.models import Ingredient, Recipe
+
+
+class IngredientIndex:
+    """
+    Инвертированный индекс продукт -> рецепты.
+
+    Для каждого продукта хранится компактный массив идентификаторов
+    рецептов (array), для каждого рецепта - его продукты.
+    Пересечение, объединение и подсчет совпадений выполняются операциями
+    над множествами и Counter, реализованными на C, без перебора
+    рецептов в Python и без соединения таблиц в базе данных.
+    """
+
+    def __init__(self, pairs):
+        postings = {}
+        recipes = {}
+        for foodstuff_id, recipe_id in pairs:
+            posting = postings.get(foodstuff_id)
+            if posting is None:
+                posting = postings[foodstuff_id] = array('q')
+            posting.append(recipe_id)
+            recipes.setdefault(recipe_id, []).append(foodstuff_id)
+        self.postings = postings
+        self.recipes = {pk: tuple(ids) for pk, ids in recipes.items()}
+
+    def updated(self, pairs, recipe_ids):
+        """
+        Возвращает копию индекса, в которой продукты рецептов recipe_ids
+        заменены продуктами из pairs.
+
+        Копируются только массивы измененных продуктов, индекс,
+        используемый другими потоками, не изменяется.
+        """
+        changed = set(recipe_ids)
+        foodstuffs = {}
+        for foodstuff_id, recipe_id in pairs:
+            foodstuffs.setdefault(recipe_id, []).append(foodstuff_id)
+        index = copy.copy(self)
+        index.postings = dict(self.postings)
+        index.recipes = {
+            pk: ids for pk, ids in self.recipes.items() if pk not in changed
+        }
+        touched = set(chain.from_iterable(
+            self.recipes.get(pk, ()) for pk in changed
+        ))
+        for foodstuff_id in touched:
+            index.postings[foodstuff_id] = array('q', (
+                pk for pk in self.postings[foodstuff_id] if pk not in changed
+            ))
+        for recipe_id, ids in foodstuffs.items():
+            index.recipes[recipe_id] = tuple(ids)
+            for foodstuff_id in ids:
+                posting = index.postings.get(foodstuff_id)
+                if foodstuff_id not in touched:
+                    touched.add(foodstuff_id)
+                    posting = index.postings[foodstuff_id] = array(
+                        'q', posting or ()
+                    )
+                posting.append(recipe_id)
+        return index
+
+    def get_postings(self, foodstuff_ids):
+        empty = array('q')
+        return [self.postings.get(pk, empty) for pk in set(foodstuff_ids)]
+
+    def all(self, foodstuff_ids):
+        """Рецепты, содержащие все продукты foodstuff_ids."""
+        postings = sorted(self.get_postings(foodstuff_ids), key=len)
+        if not postings:
+            return set()
+        return set(postings[0]).intersection(*postings[1:])
+
+    def any(self, foodstuff_ids):
+        """Рецепты, содержащие хотя бы один из продуктов foodstuff_ids."""
+        return set().union(*self.get_postings(foodstuff_ids))
+
+    def missing(self, foodstuff_ids, limit):
+        """
+        Рецепты, для которых недостает не более limit продуктов.
+
+        Возвращает словарь {рецепт: количество недостающих продуктов}
+        для рецептов, содержащих хотя бы один из продуктов foodstuff_ids.
+        """
+        matched = Counter(chain.from_iterable(
+            self.get_postings(foodstuff_ids)
+        ))
+        result = {}
+        for recipe_id, count in matched.items():
+            missing = len(self.recipes[recipe_id]) - count
+            if missing <= limit:
+                result[recipe_id] = missing
+        return result
+
+
+def build_ingredient_index(version):
+    rebuild_version = get_version(c.INGREDIENT_INDEX_REBUILD)
+    refreshed = timezone.now()
+    index = IngredientIndex(
+        Ingredient.objects.order_by().values_list(
+            'foodstuff_id', 'recipe_id'
+        ).iterator()
+    )
+    index.rebuild_version = rebuild_version
+    index.built = time.monotonic()
+    index.refreshed = refreshed
+    return index
+
+
+def update_ingredient_index(index, version):
+    """
+    Обновляет индекс по рецептам, ингредиенты которых изменились после
+    предыдущего обновления (Recipe.ingredients_modified).
+
+    Удаленные рецепты остаются в индексе до полной перестройки:
+    фильтры применяются к queryset рецептов, в котором их нет.
+    """
+    if (
+        index.rebuild_version != get_version(c.INGREDIENT_INDEX_REBUILD)
+        or time.monotonic() - index.built > c.INGREDIENT_INDEX_TTL
+    ):
+        return build_ingredient_index(version)
+    refreshed = timezone.now()
+    since = index.refreshed - timedelta(seconds=c.INGREDIENT_INDEX_OVERLAP)
+    recipe_ids = Recipe.objects.filter(
+        ingredients_modified__gte=since
+    ).order_by().values_list('id', flat=True)
+    pairs = Ingredient.objects.filter(
+        recipe__ingredients_modified__gte=since
+    ).order_by().values_list('foodstuff_id', 'recipe_id')
+    index = index.updated(pairs, recipe_ids)
+    index.refreshed = refreshed
+    return index
+
+
+def get_ingredient_index():
+    """
+    Возвращает инвертированный индекс ингредиентов рецептов.
+
+    Индекс строится в памяти процесса при первом обращении, после
+    изменения ингредиентов в него вносятся только изменившиеся рецепты
+    (update_ingredient_index).
+    """
+    return get_local(
+        ('index', c.INGREDIENT_INDEX), c.INGREDIENT_INDEX,
+        build_ingredient_index, update_ingredient_index
+    )
+
+
+def filter_ids(queryset, ids, exclude=False):
+    """
+    Оставляет (исключает при exclude) в queryset объекты с ids.
+
+    Список передается одним параметром запроса (массив PostgreSQL или
+    JSON для SQLite), размер запроса не зависит от количества ids.
+    """
+    table = queryset.model._meta.db_table
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        condition = RawSQL(
+            f'{table}.id = ANY(%s::bigint[])', (list(ids),),
+            output_field=BooleanField()
+        )
+    elif vendor == 'sqlite':
+        condition = RawSQL(
+            f'{table}.id IN (SELECT value FROM json_each(%s))',
+            (json.dumps(list(ids)),), output_field=BooleanField()
+        )
+    else:
+        condition = Q(id__in=ids)
+    if exclude:
+        return queryset.exclude(condition)
+    return queryset.filter(condition)
+
+
+def annotate_values(queryset, name, values):
+    """Добавляет в queryset аннотацию name со значениями {id: число}."""
+    table = queryset.model._meta.db_table
+    vendor = connections[queryset.db].vendor
+    data = json.dumps(values)
+    if vendor == 'postgresql':
+        expression = RawSQL(
+            f'(%s::jsonb ->> {table}.id::text)::integer', (data,),
+            output_field=IntegerField()
+        )
+    elif vendor == 'sqlite':
+        expression = RawSQL(
+            f"""json_extract(%s, '$."' || {table}.id || '"')""", (data,),
+            output_field=IntegerField()
+        )
+    else:
+        groups = {}
+        for pk, value in values.items():
+            groups.setdefault(value, []).append(pk)
+        expression = Case(
+            *(When(id__in=ids, then=Value(value))
+              for value, ids in groups.items()),
+            output_field=IntegerField()
+        )
+    return queryset.annotate(**{name: expression})
@@ -0,0 +1,335 @@
+import json
+import logging
+import platform
+import statistics
+import time
+import tracemalloc
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from api import metrics, urls
+from recipes.models import (Basket, Favorite, Foodstuff, Recipe, Subscription,
+                            Tag)
+
+User = get_user_model()
+
+# дополнительные строки запроса маршрутов, подстановки - из get_samples
+ROUTE_QUERIES = {
+    'recipes-list': (
+        '?page=2', '?limit=50', '?cursor=', '?tags={tag}',
+        '?author={author}', '?is_favorited=1', '?is_in_shopping_cart=1',
+    ),
+    'users-subscriptions': ('?recipes_limit=3',),
+    'recipes-download-shopping-cart': ('?format=csv', '?format=json'),
+    'ingredients-list': ('?name={prefix}',),
+}
+# маршруты, доступные только пользователю
+USER_ONLY_QUERIES = ('is_favorited', 'is_in_shopping_cart')
+DETAIL_SAMPLES = {
+    'users': 'author',
+    'recipes': 'recipe',
+    'ingredients': 'foodstuff',
+    'tags': 'tag_id',
+}
+# изменения меньше порогов не считаются регрессией (шум измерений)
+MIN_LATENCY_DELTA = 0.002
+MIN_MEMORY_DELTA = 64 * 1024
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = round(percent / 100 * (len(values) - 1))
+    return values[index]
+
+
+def get_routes():
+    """Возвращает имена и параметры маршрутов api.urls с методом GET."""
+    for pattern in urls.urlpatterns:
+        kwargs = set(pattern.pattern.regex.groupindex)
+        if 'format' in kwargs:
+            continue
+        actions = getattr(pattern.callback, 'actions', None)
+        view_class = getattr(pattern.callback, 'cls', None)
+        if actions is not None and 'get' not in actions:
+            continue
+        if actions is None and not hasattr(view_class, 'get'):
+            continue
+        yield pattern.name, kwargs
+
+
+class Command(BaseCommand):
+    """
+    Измеряет производительность маршрутов API.
+
+    Каждый маршрут api.urls с методом GET (и дополнительные строки
+    запроса ROUTE_QUERIES) запрашивается в процессе через тестовый
+    клиент Django от имени анонимного пользователя и пользователя
+    с наибольшим количеством подписок. Для каждого запроса выводятся
+    задержка p50/p95/p99, количество SQL-запросов и пиковый объем памяти,
+    выделенной при обработке (tracemalloc).
+    Результаты сравниваются с базовыми (--baseline): увеличение
+    количества SQL-запросов, задержки p95 или памяти более чем на
+    --threshold считается регрессией, при наличии регрессий команда
+    завершается с ошибкой. --save-baseline сохраняет результаты как
+    базовые.
+    """
+    help = 'Измеряет производительность маршрутов API.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=50,
+            help='Количество измеряемых запросов каждого маршрута'
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=5,
+            help='Количество запросов прогрева каждого маршрута'
+        )
+        parser.add_argument(
+            '--baseline',
+            default=settings.BASE_DIR / 'benchmarks' / 'baseline.json',
+            help='Файл базовых результатов'
+        )
+        parser.add_argument(
+            '--save-baseline', action='store_true',
+            help='Сохранить результаты как базовые'
+        )
+        parser.add_argument(
+            '--output', help='Файл для сохранения результатов'
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=0.2,
+            help='Допустимое относительное ухудшение задержки и памяти'
+        )
+        parser.add_argument(
+            '--user', help='Имя пользователя для авторизованных запросов'
+        )
+        parser.add_argument(
+            '--route', action='append', default=[],
+            help='Измерять только указанные маршруты (recipes-list)'
+        )
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('requests должен быть больше нуля.')
+        self.options = options
+        user = self.get_user()
+        samples = self.get_samples(user)
+        clients = {
+            'anonymous': Client(),
+            'user': Client(HTTP_AUTHORIZATION=(
+                f'Token {Token.objects.get_or_create(user=user)[0].key}'
+            )),
+        }
+        self.stdout.write(
+            f'Измерение маршрутов API, пользователь {user.username}:'
+        )
+        self.stdout.write('-' * 60)
+        # ответы с ошибками (401 для анонимного пользователя) выводятся
+        # в результатах, журнал django.request не нужен
+        request_logger = logging.getLogger('django.request')
+        log_level = request_logger.level
+        request_logger.setLevel(logging.ERROR)
+        try:
+            results = self.run(clients, samples)
+        finally:
+            request_logger.setLevel(log_level)
+        report = {
+            'created': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'data': self.get_data_volume(),
+            'results': results,
+        }
+        if options['output']:
+            self.write_json(options['output'], report)
+        regressions = self.compare(report)
+        if options['save_baseline']:
+            self.write_json(options['baseline'], report)
+            self.stdout.write(f'Базовые результаты сохранены: '
+                              f'{options["baseline"]}')
+        self.stdout.write(
+            f'Измерено маршрутов: {len(results)}, '
+            f'регрессий: {len(regressions)} \n\n'
+        )
+        if regressions and not options['save_baseline']:
+            raise CommandError(f'Обнаружены регрессии: {len(regressions)}')
+
+    def run(self, clients, samples):
+        results = {}
+        allowed_hosts = [*settings.ALLOWED_HOSTS, 'testserver']
+        with override_settings(ALLOWED_HOSTS=allowed_hosts):
+            for url in self.get_urls(samples):
+                for client_name, client in clients.items():
+                    if client_name == 'anonymous' and any(
+                        query in url for query in USER_ONLY_QUERIES
+                    ):
+                        continue
+                    key = f'GET {url} [{client_name}]'
+                    results[key] = self.measure(client, url)
+                    self.stdout.write(self.format_result(key, results[key]))
+        return results
+
+    def get_user(self):
+        if self.options['user']:
+            user = User.objects.filter(username=self.options['user']).first()
+            if user is None:
+                raise CommandError(
+                    f'Пользователь {self.options["user"]} не найден.'
+                )
+            return user
+        user = User.objects.annotate(
+            subscriptions=Count('signed')
+        ).order_by('-subscriptions', 'id').first()
+        if user is None:
+            raise CommandError(
+                'Нет пользователей, создайте данные командой generatedata.'
+            )
+        return user
+
+    def get_samples(self, user):
+        recipe = Recipe.objects.order_by('-favorites_count', 'id').first()
+        tag = Tag.objects.order_by('id').first()
+        foodstuff = Foodstuff.objects.order_by('id').first()
+        if recipe is None or tag is None or foodstuff is None:
+            raise CommandError(
+                'Нет рецептов, тегов или продуктов, '
+                'создайте данные командой generatedata.'
+            )
+        return {
+            'recipe': recipe.id,
+            'author': recipe.author_id,
+            'tag': tag.slug,
+            'tag_id': tag.id,
+            'foodstuff': foodstuff.id,
+            'prefix': foodstuff.name[:2],
+            'user': user.id,
+        }
+
+    def get_urls(self, samples):
+        only = self.options['route']
+        for name, kwargs in get_routes():
+            if only and name not in only:
+                continue
+            basename = name.split('-')[0]
+            url_kwargs = {}
+            if kwargs:
+                sample = DETAIL_SAMPLES.get(basename)
+                if sample is None:
+                    continue
+                url_kwargs = {kwarg: samples[sample] for kwarg in kwargs}
+            url = reverse(f'api:{name}', kwargs=url_kwargs)
+            yield url
+            for query in ROUTE_QUERIES.get(name, ()):
+                yield url + query.format(**samples)
+
+    def request(self, client, url):
+        response = client.get(url)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    def measure(self, client, url):
+        for _ in range(self.options['warmup']):
+            self.request(client, url)
+        durations, queries = [], []
+        for _ in range(self.options['requests']):
+            request_metrics = metrics.RequestMetrics()
+            with metrics.record_queries(request_metrics):
+                start = time.perf_counter()
+                response = self.request(client, url)
+                durations.append(time.perf_counter() - start)
+            queries.append(request_metrics.query_count)
+        # память измеряется отдельным запросом: tracemalloc замедляет
+        # обработку и искажает задержку
+        tracemalloc.start()
+        try:
+            self.request(client, url)
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return {
+            'status': response.status_code,
+            'p50': percentile(durations, 50),
+            'p95': percentile(durations, 95),
+            'p99': percentile(durations, 99),
+            'mean': statistics.mean(durations),
+            'queries': max(queries),
+            'peak_memory': peak_memory,
+        }
+
+    def format_result(self, key, result):
+        return (
+            f'{key}: {result["status"]}, '
+            f'p50 {result["p50"] * 1000:.1f} мс, '
+            f'p95 {result["p95"] * 1000:.1f} мс, '
+            f'p99 {result["p99"] * 1000:.1f} мс, '
+            f'SQL {result["queries"]}, '
+            f'память {result["peak_memory"] / 1024:.0f} КБ'
+        )
+
+    def get_data_volume(self):
+        return {
+            model._meta.model_name: model.objects.count()
+            for model in (
+                User, Recipe, Tag, Foodstuff, Favorite, Basket, Subscription
+            )
+        }
+
+    def compare(self, report):
+        path = Path(self.options['baseline'])
+        if not path.exists():
+            self.stdout.write(f'Базовые результаты не найдены: {path}')
+            return []
+        with open(path, encoding='utf-8') as file:
+            baseline = json.load(file)
+        if baseline.get('data') != report['data']:
+            self.stdout.write(
+                'Объем данных отличается от базового, '
+                'сравнение может быть неточным.'
+            )
+        threshold = 1 + self.options['threshold']
+        regressions = []
+        for key, result in report['results'].items():
+            base = baseline['results'].get(key)
+            if base is None:
+                continue
+            if result['queries'] > base['queries']:
+                regressions.append(
+                    f'{key}: SQL {base["queries"]} -> {result["queries"]}'
+                )
+            if (
+                result['p95'] > base['p95'] * threshold
+                and result['p95'] - base['p95'] > MIN_LATENCY_DELTA
+            ):
+                regressions.append(
+                    f'{key}: p95 {base["p95"] * 1000:.1f} -> '
+                    f'{result["p95"] * 1000:.1f} мс'
+                )
+            if (
+                result['peak_memory'] > base['peak_memory'] * threshold
+                and result['peak_memory'] - base['peak_memory']
+                > MIN_MEMORY_DELTA
+            ):
+                regressions.append(
+                    f'{key}: память {base["peak_memory"] / 1024:.0f} -> '
+                    f'{result["peak_memory"] / 1024:.0f} КБ'
+                )
+        for regression in regressions:
+            self.stdout.write(f'Регрессия: {regression}')
+        return regressions
+
+    def write_json(self, file_name, data):
+        path = Path(file_name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(data, file, ensure_ascii=False, indent=2)
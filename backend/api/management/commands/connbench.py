@@ -0,0 +1,160 @@
+import json
+import statistics
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from django.db.backends.signals import connection_created
+from django.test import Client
+from rest_framework.authtoken.models import Token
+
+from api.management.commands.benchmark import Command as BenchmarkCommand
+from api.management.commands.benchmark import percentile
+from backend.db.pool import close_pool, get_pool_stats
+from backend.db.postgresql.base import DatabaseWrapper
+
+URL = '/api/tags/'
+# режим: настройки базы данных
+CONNECTION_MODES = {
+    'none': {'CONN_MAX_AGE': 0, 'POOL_SIZE': 0},
+    'persistent': {'CONN_MAX_AGE': 600, 'POOL_SIZE': 0},
+    'pool': {'CONN_MAX_AGE': 0, 'POOL_SIZE': 1},
+}
+
+
+class Command(BaseCommand):
+    """
+    Измеряет задержку запроса при разных режимах соединений с базой данных.
+
+    Список тегов запрашивается через тестовый клиент Django от имени
+    пользователя: список отдается из снимка, и к базе данных выполняется
+    один SQL-запрос проверки токена. Тестовый клиент не закрывает
+    соединения после запроса, поэтому close_old_connections вызывается
+    явно, как при обработке запроса сервером, и время закрытия или
+    возврата соединения в пул входит в задержку.
+    Режимы: none - новое соединение на каждый запрос, persistent -
+    постоянное соединение потока (CONN_MAX_AGE), pool - пул соединений
+    процесса. Для каждого режима выводятся средняя задержка, p50/p95,
+    количество открытых соединений и экономия относительно режима none.
+    """
+    help = 'Измеряет задержку запроса при разных режимах соединений.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--mode', action='append', choices=CONNECTION_MODES,
+            help='Режим соединений (по умолчанию все)'
+        )
+        parser.add_argument(
+            '--requests', type=int, default=500,
+            help='Количество запросов в каждом режиме'
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=20,
+            help='Количество запросов прогрева'
+        )
+        parser.add_argument('--database', default='default')
+        parser.add_argument(
+            '--user', help='Имя пользователя для авторизованных запросов'
+        )
+        parser.add_argument(
+            '--output', help='Файл для сохранения результатов'
+        )
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('requests должно быть больше нуля.')
+        alias = options['database']
+        connection = connections[alias]
+        modes = options['mode'] or list(CONNECTION_MODES)
+        if (
+            'pool' in modes
+            and not isinstance(connection, DatabaseWrapper)
+        ):
+            raise CommandError(
+                f'Бэкенд {connection.settings_dict["ENGINE"]} '
+                f'не поддерживает пул соединений.'
+            )
+        benchmark = BenchmarkCommand()
+        benchmark.options = {'user': options['user']}
+        user = benchmark.get_user()
+        token = Token.objects.get_or_create(user=user)[0].key
+        self.client = Client(HTTP_AUTHORIZATION=f'Token {token}')
+        self.stdout.write(
+            f'Запрос {URL}, {options["requests"]} запросов на режим:'
+        )
+        self.stdout.write('-' * 60)
+        saved = dict(connection.settings_dict)
+        results = {}
+        try:
+            for mode in modes:
+                self.switch(alias, CONNECTION_MODES[mode])
+                results[mode] = self.measure(
+                    alias, options['warmup'], options['requests']
+                )
+                self.stdout.write(self.format_result(
+                    mode, results[mode], results.get('none')
+                ))
+        finally:
+            self.switch(alias, saved)
+        if options['output']:
+            path = Path(options['output'])
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as file:
+                json.dump(results, file, ensure_ascii=False, indent=2)
+        self.stdout.write(f'Измерено режимов: {len(results)} \n\n')
+
+    def switch(self, alias, settings_dict):
+        connection = connections[alias]
+        connection.close()
+        close_pool(alias)
+        connection.settings_dict.update(settings_dict)
+
+    def run(self, count):
+        durations = []
+        for _ in range(count):
+            start = time.perf_counter()
+            close_old_connections()
+            response = self.client.get(URL)
+            close_old_connections()
+            durations.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                raise CommandError(
+                    f'{URL}: статус ответа {response.status_code}.'
+                )
+        return durations
+
+    def measure(self, alias, warmup, count):
+        created = []
+
+        def receiver(connection, **kwargs):
+            if connection.alias == alias:
+                created.append(connection)
+        connection_created.connect(receiver, weak=False)
+        try:
+            self.run(warmup)
+            durations = self.run(count)
+        finally:
+            connection_created.disconnect(receiver)
+        pool = get_pool_stats().get(alias)
+        return {
+            'mean': statistics.mean(durations),
+            'p50': percentile(durations, 50),
+            'p95': percentile(durations, 95),
+            # соединение из пула отправляет connection_created при выдаче
+            'opened': pool['opened'] if pool else len(created),
+        }
+
+    def format_result(self, mode, result, base):
+        line = (
+            f'{mode}: среднее {result["mean"] * 1000:.2f} мс, '
+            f'p50 {result["p50"] * 1000:.2f} мс, '
+            f'p95 {result["p95"] * 1000:.2f} мс, '
+            f'соединений {result["opened"]}'
+        )
+        if base is not None and base is not result:
+            line += (
+                f', экономия {(base["mean"] - result["mean"]) * 1000:.2f} '
+                f'мс на запрос'
+            )
+        return line
@@ -0,0 +1,237 @@
+import http.client
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from api.management.commands.benchmark import Command as BenchmarkCommand
+from api.management.commands.benchmark import percentile
+
+# режим: (приложение, класс процесса gunicorn)
+SERVER_MODES = {
+    'wsgi': ('backend.wsgi:application', 'sync'),
+    'asgi': ('backend.asgi:application', 'uvicorn.workers.UvicornWorker'),
+}
+# маршруты чтения, подстановки - из BenchmarkCommand.get_samples
+URLS = (
+    '/api/recipes/', '/api/recipes/{recipe}/', '/api/tags/',
+    '/api/ingredients/?name={prefix}',
+)
+USER_URLS = ('/api/users/subscriptions/', '/api/recipes/feed/')
+HOST = '127.0.0.1'
+STARTUP_TIMEOUT = 30
+
+
+class Command(BaseCommand):
+    """
+    Сравнивает пропускную способность режимов сервера wsgi и asgi.
+
+    Для каждого режима запускается gunicorn с одинаковым количеством
+    процессов (--workers), закрепленных за одинаковым количеством ядер
+    процессора (--cpus, только Linux). Сервер нагружается --concurrency
+    параллельными клиентами в течение --duration секунд, запросы чтения
+    рецептов, тегов, продуктов, подписок и ленты распределяются по кругу.
+    Для каждого режима выводятся количество запросов в секунду,
+    задержка p50/p95/p99 и количество ошибок.
+    Генератор нагрузки работает в процессе команды, для точных
+    результатов его лучше запускать на ядрах, не занятых сервером.
+    """
+    help = 'Сравнивает пропускную способность режимов сервера wsgi и asgi.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--mode', action='append', choices=SERVER_MODES,
+            help='Режим сервера (по умолчанию все)'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Количество процессов gunicorn'
+        )
+        parser.add_argument(
+            '--cpus', type=int,
+            help='Количество ядер процессора для сервера'
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=32,
+            help='Количество параллельных клиентов'
+        )
+        parser.add_argument(
+            '--duration', type=float, default=10,
+            help='Длительность нагрузки в секундах'
+        )
+        parser.add_argument(
+            '--warmup', type=float, default=2,
+            help='Длительность прогрева в секундах'
+        )
+        parser.add_argument('--port', type=int, default=8100)
+        parser.add_argument(
+            '--user', help='Имя пользователя для авторизованных запросов'
+        )
+        parser.add_argument(
+            '--output', help='Файл для сохранения результатов'
+        )
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['concurrency'] < 1:
+            raise CommandError(
+                'workers и concurrency должны быть больше нуля.'
+            )
+        self.options = options
+        benchmark = BenchmarkCommand()
+        benchmark.options = {'user': options['user']}
+        user = benchmark.get_user()
+        samples = benchmark.get_samples(user)
+        token = Token.objects.get_or_create(user=user)[0].key
+        requests = [
+            (quote(url.format(**samples), safe='/?=&'), {}) for url in URLS
+        ] + [
+            (url, {'Authorization': f'Token {token}'}) for url in USER_URLS
+        ]
+        modes = options['mode'] or list(SERVER_MODES)
+        self.stdout.write(
+            f'Нагрузка: процессов {options["workers"]}, '
+            f'клиентов {options["concurrency"]}, '
+            f'{options["duration"]:.0f} с на режим:'
+        )
+        self.stdout.write('-' * 60)
+        results = {}
+        for mode in modes:
+            with self.run_server(mode):
+                self.load(requests, options['warmup'])
+                results[mode] = self.load(requests, options['duration'])
+            self.stdout.write(self.format_result(mode, results[mode]))
+        if options['output']:
+            path = Path(options['output'])
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as file:
+                json.dump(results, file, ensure_ascii=False, indent=2)
+        self.stdout.write(f'Измерено режимов: {len(results)} \n\n')
+
+    def run_server(self, mode):
+        app, worker_class = SERVER_MODES[mode]
+        env = {**os.environ, 'SERVER_MODE': mode}
+        cpus = self.options['cpus']
+        preexec_fn = None
+        if cpus:
+            available = sorted(os.sched_getaffinity(0))
+            if cpus > len(available):
+                raise CommandError(f'Доступно ядер: {len(available)}.')
+
+            def preexec_fn():
+                os.sched_setaffinity(0, available[:cpus])
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', app,
+             '--bind', f'{HOST}:{self.options["port"]}',
+             '--workers', str(self.options['workers']),
+             '--worker-class', worker_class, '--log-level', 'warning'],
+            cwd=settings.BASE_DIR, env=env, preexec_fn=preexec_fn
+        )
+        return ServerProcess(process, self.options['port'])
+
+    def load(self, requests, duration):
+        deadline = time.monotonic() + duration
+        durations, statuses = [], Counter()
+        lock = threading.Lock()
+
+        def client(offset):
+            connection = http.client.HTTPConnection(
+                HOST, self.options['port'], timeout=30
+            )
+            local_durations, local_statuses = [], Counter()
+            index = offset
+            while time.monotonic() < deadline:
+                url, headers = requests[index % len(requests)]
+                index += 1
+                start = time.perf_counter()
+                try:
+                    connection.request('GET', url, headers=headers)
+                    response = connection.getresponse()
+                    response.read()
+                    status = response.status
+                except (OSError, http.client.HTTPException):
+                    connection.close()
+                    status = 'error'
+                local_durations.append(time.perf_counter() - start)
+                local_statuses[status] += 1
+            connection.close()
+            with lock:
+                durations.extend(local_durations)
+                statuses.update(local_statuses)
+
+        threads = [
+            threading.Thread(target=client, args=(number,))
+            for number in range(self.options['concurrency'])
+        ]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - start
+        if not durations:
+            raise CommandError('Не выполнено ни одного запроса.')
+        return {
+            'requests': len(durations),
+            'rps': len(durations) / elapsed,
+            'p50': percentile(durations, 50),
+            'p95': percentile(durations, 95),
+            'p99': percentile(durations, 99),
+            'errors': sum(
+                count for status, count in statuses.items()
+                if status == 'error' or status >= 400
+            ),
+        }
+
+    def format_result(self, mode, result):
+        return (
+            f'{mode}: {result["rps"]:.1f} запросов/с, '
+            f'p50 {result["p50"] * 1000:.1f} мс, '
+            f'p95 {result["p95"] * 1000:.1f} мс, '
+            f'p99 {result["p99"] * 1000:.1f} мс, '
+            f'ошибок {result["errors"]} из {result["requests"]}'
+        )
+
+
+class ServerProcess:
+    """Процесс gunicorn, остановка при выходе из контекста."""
+
+    def __init__(self, process, port):
+        self.process = process
+        self.port = port
+
+    def __enter__(self):
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise CommandError('Сервер завершился при запуске.')
+            try:
+                connection = http.client.HTTPConnection(
+                    HOST, self.port, timeout=1
+                )
+                connection.request('GET', '/api/tags/')
+                connection.getresponse().read()
+                connection.close()
+                return self
+            except OSError:
+                time.sleep(0.2)
+        self.stop()
+        raise CommandError('Сервер не запустился.')
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=STARTUP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
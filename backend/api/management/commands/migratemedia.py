@@ -0,0 +1,55 @@
+import posixpath
+
+from django.core.management.base import BaseCommand
+
+from api.cache import bump_catalog_version
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """
+    Переносит изображения рецептов в хранилище с адресацией по содержимому.
+
+    Для каждого рецепта, имя изображения которого не совпадает с именем,
+    вычисленным по содержимому, файл сохраняется под новым именем
+    (одинаковые файлы - в одном экземпляре), ссылка в рецепте обновляется,
+    старый файл удаляется при отсутствии других ссылок на него.
+    """
+    help = 'Переносит изображения рецептов в хранилище по содержимому.'
+
+    def handle(self, *args, **kwargs):
+        self.stdout.write('Перенос изображений рецептов:')
+        self.stdout.write('-' * 60)
+        field = Recipe._meta.get_field('image')
+        storage = field.storage
+        moved = skipped = errors = 0
+        recipes = Recipe.objects.only('image', 'image_variants').iterator()
+        for recipe in recipes:
+            old_name = recipe.image.name
+            try:
+                upload_name = posixpath.join(
+                    field.upload_to, posixpath.basename(old_name)
+                )
+                with storage.open(old_name, 'rb') as file:
+                    new_name = storage.get_content_name(upload_name, file)
+                    if new_name == old_name:
+                        skipped += 1
+                        continue
+                    new_name = storage.save(upload_name, file)
+            except (OSError, ValueError) as e:
+                self.stdout.write(f'Ошибка переноса рецепта {recipe.pk}: {e}')
+                errors += 1
+                continue
+            variants = recipe.image_variants
+            if variants.get('source') == old_name:
+                variants['source'] = new_name
+            Recipe.objects.filter(pk=recipe.pk, image=old_name).update(
+                image=new_name, image_variants=variants
+            )
+            storage.delete(old_name)
+            moved += 1
+        bump_catalog_version()
+        self.stdout.write(
+            f'Перенесено изображений: {moved}, без изменений: {skipped}, '
+            f'ошибок: {errors} \n\n'
+        )
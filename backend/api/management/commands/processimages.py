@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from api.images import process_recipe_image
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """
+    Создает уменьшенные копии изображений рецептов.
+
+    Обрабатывает рецепты, для текущего изображения которых копии
+    отсутствуют, например, после прерывания фоновой обработки.
+    """
+    help = 'Создает уменьшенные копии изображений рецептов.'
+
+    def handle(self, *args, **kwargs):
+        self.stdout.write('Обработка изображений рецептов:')
+        self.stdout.write('-' * 60)
+        processed = errors = 0
+        recipes = Recipe.objects.only('image', 'image_variants').iterator()
+        for recipe in recipes:
+            if recipe.image_variants.get('source') == recipe.image.name:
+                continue
+            try:
+                process_recipe_image(recipe.pk)
+                processed += 1
+            except Exception as e:
+                self.stdout.write(f'Ошибка обработки рецепта {recipe.pk}: {e}')
+                errors += 1
+        self.stdout.write(
+            f'Обработано изображений: {processed}, ошибок: {errors} \n\n'
+        )
@@ -0,0 +1,50 @@
+from django.utils.functional import cached_property
+
+from recipes.models import Basket, Favorite, Subscription
+
+
+class Membership:
+    """
+    Связи текущего пользователя с рецептами и авторами.
+
+    Множества идентификаторов рецептов в избранном, рецептов в корзине и
+    авторов, на которых подписан пользователь, загружаются одним запросом
+    каждое при первом обращении и далее проверяются за O(1).
+    Для анонимного пользователя множества пусты, запросы не выполняются.
+    """
+
+    def __init__(self, user=None):
+        if user is not None and not user.is_authenticated:
+            user = None
+        self.user = user
+
+    def get_ids(self, model, field):
+        if self.user is None:
+            return frozenset()
+        return frozenset(
+            model.objects.filter(user=self.user).order_by().
+            values_list(field, flat=True)
+        )
+
+    @cached_property
+    def favorites(self):
+        return self.get_ids(Favorite, 'recipe_id')
+
+    @cached_property
+    def baskets(self):
+        return self.get_ids(Basket, 'recipe_id')
+
+    @cached_property
+    def subscriptions(self):
+        return self.get_ids(Subscription, 'author_id')
+
+
+def get_membership(request):
+    """Возвращает объект Membership, единый для всего запроса."""
+    if request is None:
+        return Membership()
+    membership = getattr(request, '_membership', None)
+    if membership is None:
+        membership = Membership(request.user)
+        request._membership = membership
+    return membership
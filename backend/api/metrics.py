@@ -0,0 +1,249 @@
+import bisect
+import re
+import threading
+import time
+from collections import Counter as ShapeCounter
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+
+from api.cache import get_cache_stats
+from backend.db.pool import get_pool_stats
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (
+    256, 1024, 4 * 1024, 16 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024,
+    4 * 1024 * 1024
+)
+
+IN_LIST = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+SPACES = re.compile(r'\s+')
+
+
+def format_labels(names, values):
+    return ','.join(
+        '{}="{}"'.format(
+            name, str(value).replace('\\', r'\\').replace('"', r'\"')
+        )
+        for name, value in zip(names, values)
+    )
+
+
+class Metric:
+    """Метрика с метками, хранящаяся в памяти процесса."""
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def header(self):
+        return [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.kind}',
+        ]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, value=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + value
+
+    def expose(self):
+        lines = self.header()
+        with self.lock:
+            for labels, value in sorted(self.values.items()):
+                lines.append(
+                    f'{self.name}{{{format_labels(self.labels, labels)}}} '
+                    f'{value}'
+                )
+        return lines
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=()):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, *labels, value):
+        with self.lock:
+            counts, total = self.values.get(
+                labels, ([0] * (len(self.buckets) + 1), 0)
+            )
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.values[labels] = (counts, total + value)
+
+    def expose(self):
+        lines = self.header()
+        with self.lock:
+            items = sorted(
+                (labels, list(counts), total)
+                for labels, (counts, total) in self.values.items()
+            )
+        for labels, counts, total in items:
+            prefix = format_labels(self.labels, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append(
+                    f'{self.name}_bucket{{{prefix},le="{bound}"}} '
+                    f'{cumulative}'
+                )
+            lines.append(f'{self.name}_sum{{{prefix}}} {total}')
+            lines.append(f'{self.name}_count{{{prefix}}} {cumulative}')
+        return lines
+
+
+REQUEST_LATENCY = Histogram(
+    'foodgram_http_request_duration_seconds',
+    'Время обработки запроса.', ('route', 'method'), LATENCY_BUCKETS
+)
+REQUESTS = Counter(
+    'foodgram_http_requests_total',
+    'Количество запросов.', ('route', 'method', 'status')
+)
+RESPONSE_SIZE = Histogram(
+    'foodgram_http_response_size_bytes',
+    'Размер тела ответа.', ('route',), SIZE_BUCKETS
+)
+SQL_QUERIES = Histogram(
+    'foodgram_db_queries_per_request',
+    'Количество SQL-запросов при обработке запроса.', ('route',),
+    QUERY_COUNT_BUCKETS
+)
+SQL_DURATION = Histogram(
+    'foodgram_db_duration_seconds_per_request',
+    'Время выполнения SQL-запросов при обработке запроса.', ('route',),
+    LATENCY_BUCKETS
+)
+SERIALIZER_DURATION = Histogram(
+    'foodgram_serializer_duration_seconds',
+    'Время сериализации данных ответа.', ('route',), LATENCY_BUCKETS
+)
+REPEATED_QUERIES = Counter(
+    'foodgram_repeated_queries_requests_total',
+    'Запросы с многократно повторяющимся SQL-запросом (N+1).', ('route',)
+)
+CACHE_REQUESTS = Counter(
+    'foodgram_response_cache_requests_total',
+    'Обращения к кэшу ответов.', ('result',)
+)
+DB_POOL_CONNECTIONS = Gauge(
+    'foodgram_db_pool_connections',
+    'Соединения пула базы данных.', ('database', 'state')
+)
+DB_POOL_WAITS = Counter(
+    'foodgram_db_pool_waits_total',
+    'Ожидания свободного соединения пула.', ('database',)
+)
+DB_POOL_WAIT_SECONDS = Counter(
+    'foodgram_db_pool_wait_seconds_total',
+    'Время ожидания свободного соединения пула.', ('database',)
+)
+DB_POOL_EVENTS = Counter(
+    'foodgram_db_pool_events_total',
+    'События пула базы данных.', ('database', 'event')
+)
+POOL_EVENTS = ('opened', 'closed', 'timeouts', 'health_check_failures')
+
+METRICS = (
+    REQUEST_LATENCY, REQUESTS, RESPONSE_SIZE, SQL_QUERIES, SQL_DURATION,
+    SERIALIZER_DURATION, REPEATED_QUERIES, CACHE_REQUESTS,
+    DB_POOL_CONNECTIONS, DB_POOL_WAITS, DB_POOL_WAIT_SECONDS, DB_POOL_EVENTS,
+)
+
+
+def get_query_shape(sql):
+    """Приводит SQL-запрос к общему виду: списки IN (%s, ...) сворачиваются."""
+    return IN_LIST.sub('(%s, ...)', SPACES.sub(' ', sql))
+
+
+class RequestMetrics:
+    """Данные одного запроса: SQL-запросы, время сериализации, маршрут."""
+
+    def __init__(self):
+        self.route = None
+        self.query_count = 0
+        self.query_duration = 0.0
+        self.serializer_duration = 0.0
+        self.shapes = ShapeCounter()
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.query_duration += time.perf_counter() - start
+            self.query_count += 1
+            self.shapes[get_query_shape(sql)] += 1
+
+    @contextmanager
+    def serializer_timer(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.serializer_duration += time.perf_counter() - start
+
+    def most_repeated_query(self):
+        """Возвращает (SQL-запрос, количество) самого частого запроса."""
+        if not self.shapes:
+            return None, 0
+        return self.shapes.most_common(1)[0]
+
+
+def record_queries(request_metrics):
+    """Контекст учета SQL-запросов ко всем базам данных в request_metrics."""
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(
+            connection.execute_wrapper(request_metrics.record_query)
+        )
+    return stack
+
+
+def expose():
+    """Возвращает метрики процесса в текстовом формате Prometheus."""
+    stats = get_cache_stats()
+    with CACHE_REQUESTS.lock:
+        CACHE_REQUESTS.values = {
+            ('hit',): stats['hits'], ('miss',): stats['misses'],
+        }
+    pools = get_pool_stats()
+    for metric, values in (
+        (DB_POOL_CONNECTIONS, {
+            (alias, state): pool[state]
+            for alias, pool in pools.items()
+            for state in ('in_use', 'idle')
+        }),
+        (DB_POOL_WAITS, {
+            (alias,): pool['waits'] for alias, pool in pools.items()
+        }),
+        (DB_POOL_WAIT_SECONDS, {
+            (alias,): pool['wait_seconds'] for alias, pool in pools.items()
+        }),
+        (DB_POOL_EVENTS, {
+            (alias, event): pool[event]
+            for alias, pool in pools.items() for event in POOL_EVENTS
+        }),
+    ):
+        with metric.lock:
+            metric.values = values
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.expose())
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,179 @@
+import asyncio
+import logging
+import time
+
+from django.conf import settings
+
+from api import constants as c
+from api import metrics
+from backend.db import router
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def get_route_name(request, view_func):
+    """
+    Возвращает имя маршрута для меток метрик.
+
+    Для представлений DRF - имя класса и action (RecipeViewSet.list,
+    UserViewSet.subscriptions) или метод HTTP, для остальных - имя
+    маршрута Django.
+    """
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return request.resolver_match.view_name
+    method = request.method.lower()
+    actions = getattr(view_func, 'actions', None) or {}
+    return f'{view_class.__name__}.{actions.get(method, method)}'
+
+
+class MetricsMiddleware:
+    """
+    Собирает метрики запросов для экспорта в формате Prometheus.
+
+    Для каждого запроса учитываются время обработки, количество и время
+    SQL-запросов, время сериализации (SerializerMetricsMixin) и размер
+    ответа. Если один SQL-запрос (с точностью до параметров) повторяется
+    не менее METRICS_REPEATED_QUERY_THRESHOLD раз, запрос отмечается
+    как вероятная проблема N+1 и записывается в журнал.
+    Метрики хранятся в памяти процесса, каждый процесс gunicorn
+    отдает свои значения.
+    В асинхронном режиме (ASGI) SQL-запросы представления учитываются
+    в потоке, выполняющем представление (api.async_views).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # признак асинхронного middleware для обработчика Django
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        request_metrics = request.metrics = metrics.RequestMetrics()
+        start = time.perf_counter()
+        with metrics.record_queries(request_metrics):
+            response = self.get_response(request)
+        return self.finish(request, response, start)
+
+    async def __acall__(self, request):
+        request.metrics = metrics.RequestMetrics()
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        return self.finish(request, response, start)
+
+    def finish(self, request, response, start):
+        if response.streaming:
+            response.streaming_content = self.stream(
+                request, response, start, response.streaming_content
+            )
+        else:
+            self.observe(request, response, start, len(response.content))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics.route = get_route_name(request, view_func)
+
+    def stream(self, request, response, start, content):
+        # запросы к базе данных и время передачи потокового ответа
+        # учитываются до отправки последней части
+        size = 0
+        try:
+            with metrics.record_queries(request.metrics):
+                for chunk in content:
+                    size += len(chunk)
+                    yield chunk
+        finally:
+            self.observe(request, response, start, size)
+
+    def observe(self, request, response, start, size):
+        request_metrics = request.metrics
+        route = request_metrics.route or 'unmatched'
+        metrics.REQUEST_LATENCY.observe(
+            route, request.method, value=time.perf_counter() - start
+        )
+        metrics.REQUESTS.inc(route, request.method, response.status_code)
+        metrics.RESPONSE_SIZE.observe(route, value=size)
+        metrics.SQL_QUERIES.observe(route, value=request_metrics.query_count)
+        metrics.SQL_DURATION.observe(
+            route, value=request_metrics.query_duration
+        )
+        if request_metrics.serializer_duration:
+            metrics.SERIALIZER_DURATION.observe(
+                route, value=request_metrics.serializer_duration
+            )
+        sql, count = request_metrics.most_repeated_query()
+        if count >= settings.METRICS_REPEATED_QUERY_THRESHOLD:
+            metrics.REPEATED_QUERIES.inc(route)
+            logger.warning(
+                '%s: SQL-запрос выполнен %s раз (N+1): %s', route, count, sql
+            )
+
+
+class ReplicaMiddleware:
+    """
+    Выбирает базу данных для чтения в запросе (backend.db.router).
+
+    Запросы безопасными методами читают из случайной реплики
+    DATABASE_REPLICAS, остальные - из основной базы данных. После
+    успешного изменяющего запроса клиенту устанавливается подписанная
+    cookie REPLICA_COOKIE: DB_REPLICA_STICKY_SECONDS секунд его запросы
+    читают из основной базы данных и видят внесенные изменения до их
+    репликации. Срок проверяется по времени подписи, поэтому закрепление
+    не зависит от процесса, обработавшего запрос.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # признак асинхронного middleware для обработчика Django
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        token = router.set_read_database(self.get_read_database(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            router.reset_read_database(token)
+        return self.finish(request, response)
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+        token = router.set_read_database(self.get_read_database(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            router.reset_read_database(token)
+        return self.finish(request, response)
+
+    def get_read_database(self, request):
+        if request.method not in SAFE_METHODS:
+            return None
+        sticky = request.get_signed_cookie(
+            c.REPLICA_COOKIE, default=None, salt=c.REPLICA_COOKIE,
+            max_age=settings.DB_REPLICA_STICKY_SECONDS
+        )
+        if sticky is not None:
+            return None
+        return router.choose_replica()
+
+    def finish(self, request, response):
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_signed_cookie(
+                c.REPLICA_COOKIE, '1', salt=c.REPLICA_COOKIE,
+                max_age=settings.DB_REPLICA_STICKY_SECONDS,
+                secure=request.is_secure(), httponly=True, samesite='Lax'
+            )
+        return response
@@ -1,4 +1,17 @@
-from rest_framework import exceptions, viewsets
+import hashlib
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from rest_framework import exceptions, status, viewsets
+from rest_framework.response import Response
+
+from api.async_views import async_view
+from api.cache import count_request, get_cache, get_catalog_version
+from api.snapshots import get_snapshot, get_snapshot_headers
+from backend.db.router import is_recent, use_primary
+from recipes import batch
 
 
 class ExcludePutViewSet(viewsets.ModelViewSet):
@@ -8,3 +21,190 @@ class ExcludePutViewSet(viewsets.ModelViewSet):
         if self.request.method == 'PUT':
             raise exceptions.MethodNotAllowed(method='PUT')
         return super().update(request, *args, **kwargs)
+
+
+class AnonymousCacheMixin:
+    """
+    Кэширует ответы list и retrieve для неаутентифицированных пользователей.
+
+    Ключ включает адрес сервера, action, параметры пути, нормализованную строку
+    запроса и версию каталога, поэтому после изменения данных старые
+    записи не используются и удаляются кэшем по истечении срока.
+    Запросы с параметрами, не перечисленными в cache_query_params,
+    не кэшируются. Заголовок X-Cache сообщает о попадании в кэш.
+    Если каталог изменился недавно (DB_REPLICA_STICKY_SECONDS), ответ
+    для кэша собирается из основной базы данных, а не из реплики.
+    """
+    cache_query_params = ()
+
+    def get_response_cache_key(self, request):
+        params = request.query_params
+        if not set(params).issubset(self.cache_query_params):
+            return None
+        query = '&'.join(
+            f'{name}={value}'
+            for name in sorted(params)
+            for value in sorted(params.getlist(name))
+        )
+        kwargs = '&'.join(
+            f'{name}={value}' for name, value in sorted(self.kwargs.items())
+        )
+        digest = hashlib.md5(
+            f'{request.build_absolute_uri("/")}:{self.basename}:'
+            f'{self.action}:{kwargs}:{query}'.encode()
+        ).hexdigest()
+        return f'response:{get_catalog_version()}:{digest}'
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        key = None
+        if not request.user.is_authenticated:
+            key = self.get_response_cache_key(request)
+        if key is None:
+            return handler(request, *args, **kwargs)
+        cache = get_cache()
+        data = cache.get(key)
+        count_request(hit=data is not None)
+        if data is not None:
+            return Response(data, headers={'X-Cache': 'HIT'})
+        recent = is_recent(get_catalog_version())
+        with use_primary() if recent else nullcontext():
+            response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+        response['X-Cache'] = 'MISS'
+        return response
+
+
+class SnapshotListMixin:
+    """
+    Отдает list из снимка всей таблицы, сериализованного заранее.
+
+    Снимок пересобирается только после изменения версии snapshot_name.
+    Ответ содержит заголовки ETag и Last-Modified, на условные запросы
+    с актуальными If-None-Match или If-Modified-Since возвращается 304.
+    """
+    snapshot_name = None
+
+    def get_snapshot_data(self):
+        return self.get_serializer(self.get_queryset(), many=True).data
+
+    def list(self, request, *args, **kwargs):
+        snapshot = get_snapshot(self.snapshot_name, self.get_snapshot_data)
+        response = get_conditional_response(
+            request, etag=snapshot.etag,
+            last_modified=snapshot.last_modified
+        )
+        if response is None:
+            response = HttpResponse(
+                snapshot.content, content_type='application/json'
+            )
+        for header, value in get_snapshot_headers(snapshot).items():
+            response[header] = value
+        patch_cache_control(response, public=True, no_cache=True)
+        return response
+
+
+class BatchRelationsMixin:
+    """
+    Пакетное добавление и удаление записей избранного, корзины и подписок
+    текущего пользователя (recipes.batch).
+
+    Тело запроса содержит список ids (BatchSerializer из
+    get_serializer_class). Ответ - список результатов {id, status, detail}
+    в порядке ids: status - код ответа, который вернул бы запрос
+    с одним идентификатором, detail - описание ошибки.
+    """
+
+    def batch_interface(self, model, request, exists_message, errors=None):
+        """
+        errors - {идентификатор: описание ошибки} для идентификаторов,
+        которые нельзя добавить.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        pks = serializer.validated_data['ids']
+        not_found = str(exceptions.NotFound.default_detail)
+        if request.method == 'DELETE':
+            removed = batch.remove(model, request.user, pks)
+            return Response([
+                get_batch_result(pk, status.HTTP_204_NO_CONTENT)
+                if pk in removed else
+                get_batch_result(pk, status.HTTP_404_NOT_FOUND, not_found)
+                for pk in pks
+            ])
+        errors = errors or {}
+        existing, added = batch.add(
+            model, request.user, [pk for pk in pks if pk not in errors]
+        )
+        results = []
+        for pk in pks:
+            if pk in errors:
+                result = get_batch_result(
+                    pk, status.HTTP_400_BAD_REQUEST, errors[pk]
+                )
+            elif pk not in existing:
+                result = get_batch_result(
+                    pk, status.HTTP_404_NOT_FOUND, not_found
+                )
+            elif pk in added:
+                result = get_batch_result(pk, status.HTTP_201_CREATED)
+            else:
+                result = get_batch_result(
+                    pk, status.HTTP_400_BAD_REQUEST, exists_message
+                )
+            results.append(result)
+        return Response(results)
+
+
+def get_batch_result(pk, code, detail=None):
+    result = {'id': pk, 'status': code}
+    if detail is not None:
+        result['detail'] = detail
+    return result
+
+
+class SerializerMetricsMixin:
+    """
+    Учитывает время сериализации данных ответа в метриках запроса.
+
+    Время to_representation сериализаторов get_serializer добавляется
+    к данным запроса MetricsMiddleware.
+    """
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        request_metrics = getattr(self.request, 'metrics', None)
+        if request_metrics is None:
+            return serializer
+        to_representation = serializer.to_representation
+
+        def timed_to_representation(instance):
+            with request_metrics.serializer_timer():
+                return to_representation(instance)
+
+        serializer.to_representation = timed_to_representation
+        return serializer
+
+
+class AsyncViewMixin:
+    """
+    Асинхронный режим представления для ASGI-сервера.
+
+    При ASYNC_VIEWS as_view возвращает асинхронное представление,
+    выполняющее обработку запроса в пуле потоков (api.async_views).
+    """
+
+    @classmethod
+    def as_view(cls, *args, **kwargs):
+        view = super().as_view(*args, **kwargs)
+        if settings.ASYNC_VIEWS:
+            return async_view(view)
+        return view
@@ -0,0 +1,21 @@
+from django.db import models
+
+
+class DataVersion(models.Model):
+    """
+    Модель таблицы версий наборов данных.
+
+    Версия - время последнего изменения набора данных в наносекундах,
+    таблица общая для всех процессов сервера (api.cache).
+    """
+    name = models.CharField(
+        max_length=64, primary_key=True, verbose_name='Набор данных'
+    )
+    version = models.BigIntegerField(verbose_name='Версия')
+
+    class Meta:
+        verbose_name = 'Версия набора данных'
+        verbose_name_plural = 'Версии наборов данных'
+
+    def __str__(self):
+        return f'{self.name}:{self.version}'
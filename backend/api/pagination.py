@@ -1,4 +1,13 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 from api import constants as c
 
@@ -12,3 +21,151 @@ class PageLimitPagination(PageNumberPagination):
     """
     page_size = c.PAGE_SIZE
     page_size_query_param = 'limit'
+
+
+class KeysetPagination(BasePagination):
+    """
+    Паджинатор по ключу сортировки (keyset).
+
+    Следующая страница выбирается условием по значениям полей сортировки
+    последнего объекта текущей страницы, поэтому запросы COUNT и OFFSET
+    не выполняются и время ответа не зависит от номера страницы.
+    Порядок задается атрибутом представления cursor_ordering, последнее поле
+    сортировки должно быть уникальным.
+    cursor - параметр запроса, содержит позицию начала страницы.
+    limit - количество объектов на странице, по умолчанию page_size.
+    """
+    page_size = c.PAGE_SIZE
+    page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    ordering = ('-pub_date', '-id')
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def prepare(self, model, request, view=None):
+        """Возвращает позицию начала страницы из параметра cursor."""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = getattr(view, 'cursor_ordering', self.ordering)
+        self.model = model
+        return self.decode_cursor(request)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        position = self.prepare(queryset.model, request, view)
+        queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            queryset = queryset.filter(self.get_keyset_filter(position))
+        page = list(queryset[:self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        self.page = page[:self.page_size]
+        return self.page
+
+    def paginate_ids(self, get_ids, queryset, request, view=None):
+        """
+        Возвращает страницу объектов queryset, идентификаторы которых
+        в порядке сортировки возвращает get_ids(position, size), а не
+        выборка из queryset (лента подписок).
+        """
+        position = self.prepare(queryset.model, request, view)
+        ids = get_ids(position, self.page_size + 1)
+        self.has_next = len(ids) > self.page_size
+        ids = ids[:self.page_size]
+        objs = queryset.in_bulk(ids)
+        self.page = [objs[pk] for pk in ids if pk in objs]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return page_size if page_size > 0 else self.page_size
+
+    def get_keyset_filter(self, position):
+        """
+        Возвращает условие выборки объектов, следующих за position.
+
+        Для сортировки (a, b) условие имеет вид a < x OR (a = x AND b < y).
+        """
+        keyset_filter = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            keyset_filter |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return keyset_filter
+
+    def get_model_field(self, name):
+        try:
+            return self.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            if len(values) != len(self.ordering):
+                raise ValueError
+            position = []
+            for field, value in zip(self.ordering, values):
+                model_field = self.get_model_field(field.lstrip('-'))
+                if model_field is not None:
+                    value = model_field.to_python(value)
+                position.append(value)
+            return position
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, obj):
+        values = []
+        for field in self.ordering:
+            name = field.lstrip('-')
+            model_field = self.get_model_field(name)
+            values.append(
+                getattr(obj, name) if model_field is None
+                else model_field.value_to_string(obj)
+            )
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param,
+            self.encode_cursor(self.page[-1])
+        )
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data)
+        ]))
+
+
+class PageLimitCursorPagination(PageLimitPagination):
+    """
+    Паджинатор с двумя режимами.
+
+    По умолчанию работает как PageLimitPagination. При наличии в запросе
+    параметра cursor (в том числе пустого - первая страница) переключается
+    в режим KeysetPagination.
+    """
+    cursor_pagination_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        cursor_query_param = self.cursor_pagination_class.cursor_query_param
+        if cursor_query_param in request.query_params:
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -1,3 +1,4 @@
+from django.conf import settings
 from rest_framework import permissions
 
 
@@ -23,3 +24,16 @@ class AuthorAdminOrReadOnly(permissions.BasePermission):
             request.method in permissions.SAFE_METHODS
             or request.user == obj.author or request.user.is_staff
         )
+
+
+class IsStaffOrLocalhost(permissions.BasePermission):
+    """
+    Доступ администраторам и запросам с локального адреса.
+
+    Используется для служебных эндпоинтов (метрики).
+    """
+    def has_permission(self, request, view):
+        return (
+            request.user.is_staff
+            or request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+        )
@@ -1,23 +1,141 @@
 import base64
 
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
 from djoser.serializers import UserCreateSerializer as BaseUserCreateSerializer
 from djoser.serializers import UserSerializer as BaseUserSerializer
 from rest_framework import serializers, validators
+from rest_framework.relations import MANY_RELATION_KWARGS
 
+from api import constants as c
+from api.cache import bump_catalog_version
+from api.membership import get_membership
+from api.utils import get_recipes_limit
 from recipes.models import (Basket, Favorite, Foodstuff, Ingredient, Recipe,
-                            Subscription, Tag)
+                            RecipeTag, Subscription, Tag)
+from recipes.signals import ingredients_changed
 
 User = get_user_model()
 
 
+def set_prefetched(instance, name, objects):
+    """
+    Заполняет кэш prefetch_related связи name объекта instance, чтобы
+    сохраненные связанные объекты выводились без повторного запроса.
+    """
+    cache = instance.__dict__.setdefault('_prefetched_objects_cache', {})
+    cache.pop(name, None)
+    queryset = getattr(instance, name).get_queryset()
+    queryset._result_cache = list(objects)
+    queryset._prefetch_done = True
+    cache[name] = queryset
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """
+    Адреса уменьшенных копий изображения рецепта.
+
+    Возвращает словарь {размер: {формат: адрес}}, пустой до завершения
+    обработки изображения.
+    """
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        result = {}
+        for size, formats in value.get('sizes', {}).items():
+            result[size] = {}
+            for variant_format, name in formats.items():
+                url = default_storage.url(name)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                result[size][variant_format] = url
+        return result
+
+
 class RecipesMinifiedSerializer(serializers.ModelSerializer):
     """Сериализатор модели Recipe с ограниченным набором полей."""
+    thumbnails = ImageVariantsField(source='image_variants')
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'thumbnails', 'cooking_time')
+
+
+class BatchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Поле связанного объекта, загружаемого пакетно по первичному ключу.
+
+    to_internal_value проверяет только формат ключа, объекты всех ключей
+    списка загружаются методом resolve одним запросом. Используется
+    в списках: many=True (BatchedManyRelatedField) или в элементах
+    BatchedListSerializer.
+    """
+    default_error_messages = {
+        'does_not_exist_many': 'Объекты с id {pk_values} не существуют.',
+    }
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BatchedManyRelatedField(**list_kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return self.get_queryset().model._meta.pk.to_python(data)
+        except (DjangoValidationError, TypeError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+    def resolve(self, pks):
+        """Возвращает словарь {ключ: объект}, отсутствующие ключи - ошибка."""
+        objects = self.get_queryset().in_bulk(set(pks))
+        missing = [pk for pk in dict.fromkeys(pks) if pk not in objects]
+        if missing:
+            self.fail(
+                'does_not_exist_many',
+                pk_values=', '.join(str(pk) for pk in missing)
+            )
+        return objects
+
+
+class BatchedManyRelatedField(serializers.ManyRelatedField):
+    """Список связанных объектов, загружаемых одним запросом."""
+
+    def to_internal_value(self, data):
+        pks = super().to_internal_value(data)
+        objects = self.child_relation.resolve(pks)
+        return [objects[pk] for pk in pks]
+
+
+class BatchedListSerializer(serializers.ListSerializer):
+    """
+    Список вложенных объектов с пакетной загрузкой связанных объектов.
+
+    Для каждого поля BatchedPrimaryKeyRelatedField элементов связанные
+    объекты всех элементов загружаются одним запросом.
+    """
+
+    def to_internal_value(self, data):
+        items = super().to_internal_value(data)
+        for field in self.child._writable_fields:
+            if not isinstance(field, BatchedPrimaryKeyRelatedField):
+                continue
+            source = field.source
+            objects = field.resolve(
+                [item[source] for item in items if source in item]
+            )
+            for item in items:
+                if source in item:
+                    item[source] = objects[item[source]]
+        return items
 
 
 class UserSerializer(BaseUserSerializer):
@@ -34,9 +152,8 @@ class UserSerializer(BaseUserSerializer):
                   'last_name', 'is_subscribed')
 
     def get_is_subscribed(self, obj):
-        return self.context.get('request').user.id in (
-            subscriber.user_id for subscriber in obj.subscribers.all()
-        )
+        membership = get_membership(self.context.get('request'))
+        return obj.id in membership.subscriptions
 
 
 class UserSubscriptionSerializer(UserSerializer):
@@ -48,27 +165,18 @@ class UserSubscriptionSerializer(UserSerializer):
     объект в случае передачи в запрос фильтра 'recipes_limit'
     """
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.ReadOnlyField()
 
     class Meta(UserSerializer.Meta):
         fields = ('email', 'id', 'username', 'first_name', 'last_name',
                   'is_subscribed', 'recipes', 'recipes_count')
 
     def get_recipes(self, obj):
-        limit = self.context['request'].query_params.get('recipes_limit')
-        if limit is not None:
-            try:
-                limit = int(limit)
-                limit = limit if limit >= 0 else None
-            except ValueError:
-                limit = None
+        limit = get_recipes_limit(self.context['request'])
         return RecipesMinifiedSerializer(
             obj.recipes.all()[:limit], context=self.context, many=True
         ).data
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
 
 class UserCreateSerializer(BaseUserCreateSerializer):
     """
@@ -118,14 +226,20 @@ class IngregientSerializer(serializers.ModelSerializer):
 
 
 class IngredientCreateSerializer(serializers.ModelSerializer):
-    """Сериализатор модели Ingredient."""
-    id = serializers.PrimaryKeyRelatedField(
+    """
+    Сериализатор модели Ingredient.
+
+    Продукты всех ингредиентов рецепта загружаются одним запросом
+    (BatchedListSerializer).
+    """
+    id = BatchedPrimaryKeyRelatedField(
         source='foodstuff', queryset=Foodstuff.objects.all()
     )
 
     class Meta:
         model = Ingredient
         fields = ('id', 'amount')
+        list_serializer_class = BatchedListSerializer
 
 
 class RecipeReadOnlySerializer(serializers.ModelSerializer):
@@ -137,14 +251,23 @@ class RecipeReadOnlySerializer(serializers.ModelSerializer):
     tags = TagSerializer(read_only=True, many=True)
     author = UserSerializer(read_only=True)
     ingredients = IngregientSerializer(read_only=True, many=True)
-    is_favorited = serializers.BooleanField(read_only=True)
-    is_in_shopping_cart = serializers.BooleanField(read_only=True)
+    is_favorited = serializers.SerializerMethodField()
+    is_in_shopping_cart = serializers.SerializerMethodField()
+    thumbnails = ImageVariantsField(source='image_variants')
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart',
-                  'name', 'image', 'text', 'cooking_time',)
+                  'name', 'image', 'thumbnails', 'text', 'cooking_time',)
+
+    def get_is_favorited(self, obj):
+        membership = get_membership(self.context.get('request'))
+        return obj.id in membership.favorites
+
+    def get_is_in_shopping_cart(self, obj):
+        membership = get_membership(self.context.get('request'))
+        return obj.id in membership.baskets
 
 
 class Base64ImageField(serializers.ImageField):
@@ -168,7 +291,7 @@ class RecipeSerializer(serializers.ModelSerializer):
     Возвращает данные используя сериализатор RecipeReadOnlySerializer.
     """
     author = serializers.HiddenField(default=serializers.CurrentUserDefault())
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = BatchedPrimaryKeyRelatedField(
         queryset=Tag.objects.all(),
         many=True, allow_empty=False
     )
@@ -199,17 +322,21 @@ class RecipeSerializer(serializers.ModelSerializer):
         return value
 
     def save_ingredients(self, data, recipe, is_update=False):
+        """Сохраняет изменения ингредиентов, возвращает True при изменении."""
         ingredients = []
         if is_update:
             ingredients = recipe.ingredients.all()
-        objs_mapping = {obj.foodstuff: obj for obj in ingredients}
-        data_mapping = {item['foodstuff']: item for item in data}
+        objs_mapping = {obj.foodstuff_id: obj for obj in ingredients}
+        data_mapping = {item['foodstuff'].id: item for item in data}
         objs_create, objs_update = [], []
         for obj_id, item in data_mapping.items():
             obj = objs_mapping.pop(obj_id, None)
             if obj is None:
                 objs_create.append(Ingredient(recipe=recipe, **item))
             else:
+                # продукты получены при проверке данных, они не
+                # запрашиваются для ответа (RecipeViewSet.get_queryset)
+                obj.foodstuff = item['foodstuff']
                 if obj.amount != item['amount']:
                     obj.amount = item['amount']
                     objs_update.append(obj)
@@ -221,32 +348,119 @@ class RecipeSerializer(serializers.ModelSerializer):
             Ingredient.objects.filter(
                 recipe=recipe, foodstuff__in=objs_mapping.keys()
             ).delete()
+        set_prefetched(recipe, 'ingredients', [
+            obj for obj in ingredients if obj.foodstuff_id in data_mapping
+        ] + objs_create)
+        foodstuffs_changed = bool(objs_create or objs_mapping)
+        if is_update and foodstuffs_changed:
+            # сохраняется вместе с полями рецепта (update)
+            recipe.ingredients_modified = timezone.now()
+        changed = bool(objs_create or objs_update or objs_mapping)
+        if changed:
+            ingredients_changed.send(
+                sender=Recipe, instance=recipe, created=not is_update,
+                foodstuffs_changed=foodstuffs_changed
+            )
+        return changed
 
+    def save_tags(self, tags, recipe, is_update=False):
+        """Сохраняет изменения тегов, возвращает True при изменении."""
+        current = set()
+        if is_update:
+            current = {tag.id for tag in recipe.tags.all()}
+        new = {tag.id for tag in tags}
+        set_prefetched(recipe, 'tags', sorted(tags, key=lambda tag: tag.name))
+        if new == current:
+            return False
+        if current - new:
+            RecipeTag.objects.filter(
+                recipe=recipe, tag__in=current - new
+            ).delete()
+        if new - current:
+            RecipeTag.objects.bulk_create(
+                [RecipeTag(recipe=recipe, tag_id=tag_id)
+                 for tag_id in new - current]
+            )
+        return True
+
+    def is_same_image(self, instance, image):
+        """
+        Проверяет, совпадает ли загруженное изображение с сохраненным.
+
+        Для хранилища с адресацией по содержимому имя файла вычисляется
+        по содержимому без записи на диск.
+        """
+        field = Recipe._meta.get_field('image')
+        get_content_name = getattr(field.storage, 'get_content_name', None)
+        if get_content_name is None or not instance.image:
+            return False
+        name = field.generate_filename(instance, image.name)
+        return get_content_name(name, image) == instance.image.name
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(**validated_data)
-        recipe.tags.set(tags)
+        self.save_tags(tags, recipe)
         self.save_ingredients(ingredients, recipe)
+        bump_catalog_version()
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
+        """
+        Обновляет рецепт, сохраняя только изменившиеся данные.
+
+        Поля рецепта сохраняются с update_fields, теги и ингредиенты
+        сравниваются с сохраненными, неизмененное изображение
+        не перезаписывается. Если изменений нет, запись в базу данных
+        не выполняется.
+        """
+        changed = False
+        ingredients_modified = instance.ingredients_modified
         ingredients = validated_data.get('ingredients')
         if ingredients is not None:
-            self.save_ingredients(ingredients, instance, is_update=True)
+            changed |= self.save_ingredients(
+                ingredients, instance, is_update=True
+            )
         tags = validated_data.get('tags')
         if tags is not None:
-            instance.tags.set(tags)
-        instance.image = validated_data.get('image', instance.image)
-        instance.name = validated_data.get('name', instance.name)
-        instance.text = validated_data.get('text', instance.text)
-        instance.cooking_time = validated_data.get(
-            'cooking_time', instance.cooking_time
+            changed |= self.save_tags(tags, instance, is_update=True)
+        update_fields = [
+            field for field in ('name', 'text', 'cooking_time')
+            if field in validated_data
+            and getattr(instance, field) != validated_data[field]
+        ]
+        image = validated_data.get('image')
+        if image is not None and not self.is_same_image(instance, image):
+            update_fields.append('image')
+        for field in update_fields:
+            setattr(instance, field, validated_data[field])
+        if instance.ingredients_modified != ingredients_modified:
+            update_fields.append('ingredients_modified')
+        if update_fields:
+            instance.save(update_fields=update_fields)
+            changed = True
+        if changed:
+            bump_catalog_version()
+        return instance
+
+    def save(self, **kwargs):
+        instance = super().save(**kwargs)
+        # UpdateModelMixin.update сбрасывает кэш prefetch_related после
+        # сохранения, теги и ингредиенты в кэше актуальны: заполнены
+        # get_queryset или сохраненными объектами (save_tags,
+        # save_ingredients)
+        self.prefetched = dict(
+            getattr(instance, '_prefetched_objects_cache', {})
         )
-        instance.save()
         return instance
 
     def to_representation(self, instance):
+        cache = instance.__dict__.setdefault('_prefetched_objects_cache', {})
+        for name, queryset in getattr(self, 'prefetched', {}).items():
+            cache.setdefault(name, queryset)
         return (RecipeReadOnlySerializer(context=self.context).
                 to_representation(instance))
 
@@ -338,3 +552,18 @@ class FavoriteSerializer(serializers.ModelSerializer):
     def to_representation(self, instance):
         instance = self.validated_data['recipe']
         return RecipesMinifiedSerializer().to_representation(instance)
+
+
+class BatchSerializer(serializers.Serializer):
+    """
+    Список идентификаторов рецептов или авторов для пакетного добавления
+    и удаления записей избранного, корзины и подписок.
+    """
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False, max_length=c.BATCH_MAX_SIZE
+    )
+
+    def validate_ids(self, value):
+        # повторяющиеся идентификаторы обрабатываются один раз
+        return list(dict.fromkeys(value))
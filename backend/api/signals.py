@@ -0,0 +1,96 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from api import constants as c
+from api.cache import bump_catalog_version, bump_version
+from api.images import delete_variant_files, schedule_image_processing
+from recipes.models import Foodstuff, Recipe, Tag
+from recipes.signals import (foodstuff_bulk_loaded, ingredients_changed,
+                             recipes_bulk_loaded)
+
+User = get_user_model()
+
+# поля автора в ответах каталога (UserSerializer)
+AUTHOR_FIELDS = frozenset(('username', 'first_name', 'last_name', 'email'))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Foodstuff)
+@receiver(post_delete, sender=Foodstuff)
+@receiver(recipes_bulk_loaded, sender=Recipe)
+def catalog_changed(sender, **kwargs):
+    # ингредиенты и теги рецепта изменяются вместе с рецептом
+    # (RecipeSerializer, админ-зона), отсутствие обработчиков для
+    # Ingredient и RecipeTag позволяет удалять их одним запросом
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, created, update_fields=None, **kwargs):
+    # данные автора входят в ответы каталога, изменение других полей
+    # (last_login при входе, пароль) не сбрасывает кэш
+    if created:
+        return
+    if update_fields is None or AUTHOR_FIELDS & update_fields:
+        bump_catalog_version()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tags_changed(sender, **kwargs):
+    bump_version(c.TAGS_SNAPSHOT)
+
+
+@receiver(post_save, sender=Foodstuff)
+@receiver(post_delete, sender=Foodstuff)
+@receiver(foodstuff_bulk_loaded, sender=Foodstuff)
+def foodstuff_changed(sender, **kwargs):
+    bump_version(c.FOODSTUFF_SNAPSHOT)
+
+
+@receiver(ingredients_changed, sender=Recipe)
+@receiver(post_delete, sender=Foodstuff)
+@receiver(recipes_bulk_loaded, sender=Recipe)
+def ingredient_index_changed(sender, foodstuffs_changed=True, **kwargs):
+    # индекс не зависит от количества продуктов, удаленные рецепты
+    # исключаются из результатов фильтров queryset рецептов
+    if foodstuffs_changed:
+        bump_version(c.INGREDIENT_INDEX)
+
+
+@receiver(recipes_bulk_loaded, sender=Recipe)
+def ingredient_index_loaded(sender, **kwargs):
+    # транзакция загрузки может быть дольше INGREDIENT_INDEX_OVERLAP
+    bump_version(c.INGREDIENT_INDEX_REBUILD)
+
+
+@receiver(pre_delete, sender=Foodstuff)
+def ingredient_foodstuff_deleted(sender, instance, **kwargs):
+    # ингредиенты с продуктом удаляются каскадно, индекс обновляется
+    # по дате изменения ингредиентов рецептов
+    Recipe.objects.filter(ingredients__foodstuff=instance).update(
+        ingredients_modified=timezone.now()
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_saved(sender, instance, raw=False, **kwargs):
+    if raw or not instance.image:
+        return
+    if instance.image_variants.get('source') != instance.image.name:
+        transaction.on_commit(
+            lambda: schedule_image_processing(instance.pk)
+        )
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_image_deleted(sender, instance, **kwargs):
+    transaction.on_commit(
+        lambda: delete_variant_files(instance.image_variants)
+    )
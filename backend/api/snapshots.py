@@ -0,0 +1,41 @@
+import hashlib
+from collections import namedtuple
+
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+
+from api.cache import get_local
+
+Snapshot = namedtuple(
+    'Snapshot', ('version', 'content', 'etag', 'last_modified')
+)
+
+
+def build_snapshot(version, data):
+    content = JSONRenderer().render(data)
+    return Snapshot(
+        version=version,
+        content=content,
+        etag=f'"{hashlib.sha256(content).hexdigest()[:32]}"',
+        last_modified=version // 10 ** 9,
+    )
+
+
+def get_snapshot(name, get_data):
+    """
+    Возвращает снимок набора данных name, сериализованный в JSON.
+
+    Снимок хранится в памяти процесса и пересобирается функцией get_data
+    только после изменения версии набора данных (см. api.cache.bump_version).
+    """
+    return get_local(
+        ('snapshot', name), name,
+        lambda version: build_snapshot(version, get_data())
+    )
+
+
+def get_snapshot_headers(snapshot):
+    return {
+        'ETag': snapshot.etag,
+        'Last-Modified': http_date(snapshot.last_modified),
+    }
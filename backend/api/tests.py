@@ -0,0 +1,830 @@
+import base64
+import io
+import json
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, transaction
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITestCase
+
+from api import constants as c
+from api.cache import CATALOG, discard_pending_versions, get_cache
+from api.images import get_variant_names, process_recipe_image
+from api.ingredient_index import get_ingredient_index
+from api.middleware import ReplicaMiddleware
+from api.models import DataVersion
+from backend.db.router import ReplicaRouter
+from recipes import batch, popularity
+from recipes.models import (Basket, Foodstuff, Ingredient, Recipe, RecipeTag,
+                            ShoppingListItem, Subscription, Tag)
+from recipes.storage import recipe_image_variant_storage
+
+User = get_user_model()
+
+
+def create_user(username):
+    return User.objects.create_user(
+        username=username, email=f'{username}@example.com', password='pass',
+        first_name=username, last_name=username
+    )
+
+
+def create_recipe(author, name='рецепт'):
+    return Recipe.objects.create(
+        author=author, name=name, text='текст', cooking_time=5,
+        image='recipes/images/image.png'
+    )
+
+
+def get_image(color='red'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (40, 30), color).save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()
+    ).decode()
+
+
+def get_client(user=None):
+    client = APIClient()
+    if user is not None:
+        token, _ = Token.objects.get_or_create(user=user)
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    return client
+
+
+@override_settings(DATA_VERSION_CHECK_INTERVAL=0)
+class DataVersionTest(APITestCase):
+    """Версии наборов данных общие для процессов (api.cache)."""
+
+    def get_tags(self):
+        response = self.client.get('/api/tags/')
+        self.assertEqual(response.status_code, 200)
+        return [tag['slug'] for tag in response.json()]
+
+    def test_version_changed_by_other_process(self):
+        Tag.objects.create(name='завтрак', color='#E26C2D', slug='breakfast')
+        self.assertEqual(self.get_tags(), ['breakfast'])
+        # другой процесс изменил теги и версию снимка: обработчики
+        # сигналов текущего процесса не вызываются
+        Tag.objects.bulk_create(
+            [Tag(name='обед', color='#49B64E', slug='lunch')]
+        )
+        DataVersion.objects.filter(name=c.TAGS_SNAPSHOT).update(
+            version=F('version') + 1
+        )
+        self.assertEqual(sorted(self.get_tags()), ['breakfast', 'lunch'])
+
+    def test_bump_version(self):
+        self.get_tags()
+        version = DataVersion.objects.get(name=c.TAGS_SNAPSHOT).version
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='ужин', color='#8775D2', slug='dinner')
+        self.assertGreater(
+            DataVersion.objects.get(name=c.TAGS_SNAPSHOT).version, version
+        )
+        self.assertEqual(self.get_tags(), ['dinner'])
+
+    def test_bump_once_per_transaction(self):
+        self.get_tags()
+        DataVersion.objects.create(name=CATALOG, version=0)
+        with self.captureOnCommitCallbacks() as callbacks:
+            Tag.objects.create(name='ужин', color='#8775D2', slug='dinner')
+            Tag.objects.create(name='обед', color='#49B64E', slug='lunch')
+        # версии каталога и снимка тегов обновляются одним запросом
+        with self.assertNumQueries(1):
+            for callback in callbacks:
+                callback()
+        self.assertEqual(
+            DataVersion.objects.filter(
+                name__in=(c.TAGS_SNAPSHOT, CATALOG)
+            ).values('version').distinct().count(), 1
+        )
+        self.assertEqual(sorted(self.get_tags()), ['dinner', 'lunch'])
+
+    def test_bump_after_rollback(self):
+        self.get_tags()
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    Tag.objects.create(
+                        name='ужин', color='#8775D2', slug='dinner'
+                    )
+                    raise DatabaseError
+            except DatabaseError:
+                pass
+            # обработчик отмененной точки сохранения удален, обновление
+            # версии следующего изменения не теряется
+            Tag.objects.create(name='обед', color='#49B64E', slug='lunch')
+        self.assertEqual(self.get_tags(), ['lunch'])
+
+
+@override_settings(DATA_VERSION_CHECK_INTERVAL=0)
+class SnapshotListTest(APITestCase):
+    """Условные запросы к спискам из снимков (SnapshotListMixin)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tag = Tag.objects.create(
+            name='завтрак', color='#E26C2D', slug='breakfast'
+        )
+        cls.foodstuff = Foodstuff.objects.create(
+            name='соль', measurement_unit='г'
+        )
+
+    def get(self, url, etag=None):
+        if etag is None:
+            return self.client.get(url)
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_not_modified(self):
+        for url in ('/api/tags/', '/api/ingredients/'):
+            etag = self.get(url)['ETag']
+            response = self.get(url, etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b'')
+            self.assertEqual(response['ETag'], etag)
+
+    def test_changed_after_write(self):
+        tags_etag = self.get('/api/tags/')['ETag']
+        foodstuff_etag = self.get('/api/ingredients/')['ETag']
+        # изменения обоих наборов данных в одной транзакции
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.name = 'обед'
+            self.tag.save()
+            self.foodstuff.name = 'перец'
+            self.foodstuff.save()
+        response = self.get('/api/tags/', tags_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], tags_etag)
+        self.assertEqual(response.json()[0]['name'], 'обед')
+        response = self.get('/api/ingredients/', foodstuff_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], foodstuff_etag)
+        self.assertEqual(response.json()[0]['name'], 'перец')
+
+
+class AuthorChangedTest(APITestCase):
+    """Версия каталога обновляется только при изменении данных автора."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('author')
+
+    def test_login_keeps_catalog(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(
+                '/api/auth/token/login/',
+                {'email': self.user.email, 'password': 'pass'}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.last_login)
+        self.assertEqual(callbacks, [])
+
+    def test_author_fields_bump_catalog(self):
+        self.user.first_name = 'новое имя'
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.user.save(update_fields=['first_name'])
+        self.assertEqual(len(callbacks), 1)
+
+    def test_save_bumps_catalog(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.user.save()
+        self.assertEqual(len(callbacks), 1)
+
+
+class SubscriptionsTest(APITestCase):
+    """Подписки текущего пользователя: рецепты авторов и recipes_limit."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('reader')
+        cls.authors = [create_user(f'author{i}') for i in range(3)]
+        cls.recipes = {
+            author.pk: [
+                create_recipe(author, f'{author.username}-{i}')
+                for i in range(4)
+            ]
+            for author in cls.authors
+        }
+        Subscription.objects.bulk_create(
+            Subscription(user=cls.user, author=author)
+            for author in cls.authors
+        )
+
+    def setUp(self):
+        self.client = get_client(self.user)
+
+    def test_recipes_limit(self):
+        response = self.client.get(
+            '/api/users/subscriptions/', {'recipes_limit': 2}
+        )
+        self.assertEqual(response.status_code, 200)
+        for author in response.json()['results']:
+            latest = self.recipes[author['id']][::-1][:2]
+            self.assertEqual(
+                [recipe['id'] for recipe in author['recipes']],
+                [recipe.pk for recipe in latest]
+            )
+
+    def test_recipes_limit_queries(self):
+        # токен, количество авторов, страница авторов, рецепты авторов
+        # страницы, подписки текущего пользователя (is_subscribed)
+        with self.assertNumQueries(5):
+            response = self.client.get(
+                '/api/users/subscriptions/', {'recipes_limit': 1}
+            )
+        self.assertEqual(len(response.json()['results']), 3)
+
+    def test_recipes_limit_zero(self):
+        response = self.client.get(
+            '/api/users/subscriptions/', {'recipes_limit': 0}
+        )
+        for author in response.json()['results']:
+            self.assertEqual(author['recipes'], [])
+
+    def test_no_subscriptions(self):
+        response = get_client(self.authors[0]).get(
+            '/api/users/subscriptions/', {'recipes_limit': 2}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [])
+
+    def test_subscriptions_order(self):
+        response = self.client.get(
+            '/api/users/subscriptions/', {'limit': 2, 'page': 2}
+        )
+        self.assertEqual(
+            [author['id'] for author in response.json()['results']],
+            [self.authors[2].pk]
+        )
+
+
+@mock.patch('api.signals.schedule_image_processing')
+class RecipeQueriesTest(APITestCase):
+    """
+    Количество SQL-запросов при создании, изменении и удалении рецепта.
+
+    Учитываются запросы после фиксации транзакции (обновление версий
+    каталога). В тесте транзакция заменяется точкой сохранения
+    (SAVEPOINT и RELEASE SAVEPOINT), которая добавляет запрос.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.media = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.reader = create_user('reader')
+        DataVersion.objects.bulk_create(
+            DataVersion(name=name, version=0)
+            for name in (CATALOG, c.INGREDIENT_INDEX)
+        )
+        cls.tags = [
+            Tag.objects.create(name=f'тег{i}', color='#FFFFFF', slug=f't{i}')
+            for i in range(3)
+        ]
+        cls.foodstuffs = [
+            Foodstuff.objects.create(name=f'продукт{i}', measurement_unit='г')
+            for i in range(3)
+        ]
+        cls.recipe = create_recipe(cls.author)
+        RecipeTag.objects.bulk_create(
+            RecipeTag(recipe=cls.recipe, tag=tag) for tag in cls.tags[:2]
+        )
+        Ingredient.objects.bulk_create(
+            Ingredient(recipe=cls.recipe, foodstuff=foodstuff, amount=10)
+            for foodstuff in cls.foodstuffs[:2]
+        )
+
+    def setUp(self):
+        self.client = get_client(self.author)
+        # обработчики фиксации транзакции setUpTestData не выполняются:
+        # транзакция теста не фиксируется, а ожидающие версии
+        # обновлялись бы вместе с версиями теста (api.cache.bump_version)
+        discard_pending_versions()
+
+    def get_data(self, tags, foodstuffs, amount=10):
+        return {
+            'tags': [tag.pk for tag in tags],
+            'ingredients': [
+                {'id': foodstuff.pk, 'amount': amount}
+                for foodstuff in foodstuffs
+            ],
+        }
+
+    def request(self, queries, method, url, data=None, status=200):
+        with (
+            self.assertNumQueries(queries),
+            self.captureOnCommitCallbacks(execute=True)
+        ):
+            response = getattr(self.client, method)(url, data, format='json')
+        self.assertEqual(response.status_code, status, response.content)
+        return response
+
+    def test_create(self, schedule):
+        data = self.get_data(self.tags[:2], self.foodstuffs)
+        data.update(
+            name='новый', text='текст', cooking_time=5, image=get_image()
+        )
+        # токен, продукты, теги, рецепт, счетчик автора, ленты
+        # подписчиков, теги рецепта, ингредиенты, подписки, избранное
+        # и корзина текущего пользователя, версии; теги и ингредиенты
+        # ответа не запрашиваются повторно
+        response = self.request(14, 'post', '/api/recipes/', data, 201)
+        self.assertEqual(len(response.json()['ingredients']), 3)
+        self.assertEqual(
+            [tag['id'] for tag in response.json()['tags']],
+            [tag.pk for tag in self.tags[:2]]
+        )
+
+    def test_update_text(self, schedule):
+        # токен, рецепт с тегами и ингредиентами, изменение рецепта,
+        # подписки, избранное и корзина текущего пользователя, версии
+        response = self.request(
+            12, 'patch', f'/api/recipes/{self.recipe.pk}/', {'text': 'новый'}
+        )
+        self.assertEqual(response.json()['text'], 'новый')
+        self.assertEqual(len(response.json()['ingredients']), 2)
+
+    def test_update_unchanged(self, schedule):
+        data = self.get_data(self.tags[:2], self.foodstuffs[:2])
+        # изменений нет: запросы записи и обновление версий
+        # не выполняются, продукты ингредиентов получены при проверке
+        self.request(11, 'patch', f'/api/recipes/{self.recipe.pk}/', data)
+
+    def test_update_tags_and_ingredients(self, schedule):
+        data = self.get_data(self.tags[1:], self.foodstuffs[1:], amount=20)
+        # продукты и теги, добавление, изменение и удаление ингредиентов,
+        # удаление и добавление тегов, дата изменения ингредиентов
+        response = self.request(
+            18, 'patch', f'/api/recipes/{self.recipe.pk}/', data
+        )
+        self.assertEqual(
+            [tag['id'] for tag in response.json()['tags']],
+            [tag.pk for tag in self.tags[1:]]
+        )
+        self.assertEqual(
+            [(item['id'], item['amount'])
+             for item in response.json()['ingredients']],
+            [(foodstuff.pk, 20) for foodstuff in self.foodstuffs[1:]]
+        )
+
+    def test_destroy(self, schedule):
+        self.request(
+            13, 'delete', f'/api/recipes/{self.recipe.pk}/', status=204
+        )
+
+    def test_destroy_in_baskets(self, schedule):
+        users = [create_user(f'user{i}') for i in range(5)]
+        Basket.objects.bulk_create(
+            Basket(user=user, recipe=self.recipe) for user in users
+        )
+        Recipe.objects.filter(pk=self.recipe.pk).update(
+            in_baskets_count=len(users)
+        )
+        # списки покупок всех пользователей изменяются вместе
+        self.request(
+            18, 'delete', f'/api/recipes/{self.recipe.pk}/', status=204
+        )
+
+    def test_favorite_batch(self, schedule):
+        recipes = [create_recipe(self.author, f'рецепт{i}') for i in range(5)]
+        data = {'ids': [recipe.pk for recipe in recipes]}
+        # токен, рецепты, точка сохранения, добавление записей, счетчики
+        # рецептов, освобождение точки сохранения
+        self.request(6, 'post', '/api/recipes/favorite/batch/', data)
+        self.request(5, 'delete', '/api/recipes/favorite/batch/', data)
+
+    def test_shopping_cart_batch(self, schedule):
+        recipes = [create_recipe(self.author, f'рецепт{i}') for i in range(5)]
+        data = {'ids': [self.recipe.pk, *(recipe.pk for recipe in recipes)]}
+        # и продукты рецептов, изменение списков покупок
+        self.request(8, 'post', '/api/recipes/shopping_cart/batch/', data)
+        # рецепты не запрашиваются, продукты с нулевым количеством
+        # удаляются из списков покупок
+        self.request(8, 'delete', '/api/recipes/shopping_cart/batch/', data)
+        self.assertFalse(ShoppingListItem.objects.exists())
+
+
+@mock.patch('api.signals.schedule_image_processing', mock.Mock())
+class ImageVariantsTest(APITestCase):
+    """Копии изображений хранятся по содержимому в одном экземпляре."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def create_recipe(self, name):
+        buffer = io.BytesIO()
+        Image.new('RGB', (40, 30), 'red').save(buffer, 'PNG')
+        recipe = Recipe.objects.create(
+            author=self.author, name=name, text='текст', cooking_time=5,
+            image=ContentFile(buffer.getvalue(), 'image.png')
+        )
+        process_recipe_image(recipe.pk)
+        recipe.refresh_from_db()
+        return recipe
+
+    def delete_recipe(self, recipe):
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+
+    def test_shared_variants(self):
+        first = self.create_recipe('первый')
+        second = self.create_recipe('второй')
+        names = list(get_variant_names(first.image_variants))
+        self.assertEqual(names, list(get_variant_names(second.image_variants)))
+        for name in names:
+            self.assertRegex(
+                name, r'^recipes/images/variants/([0-9a-f]{2}/){2}'
+                      r'[0-9a-f]{64}\.(webp|jpg)$'
+            )
+        self.delete_recipe(first)
+        self.assertTrue(all(
+            recipe_image_variant_storage.exists(name) for name in names
+        ))
+        self.delete_recipe(second)
+        self.assertFalse(any(
+            recipe_image_variant_storage.exists(name) for name in names
+        ))
+
+
+@override_settings(DATA_VERSION_CHECK_INTERVAL=0)
+@mock.patch('api.signals.schedule_image_processing', mock.Mock())
+class IngredientIndexTest(APITestCase):
+    """Фильтры рецептов по продуктам и обновление индекса ингредиентов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.foodstuffs = [
+            Foodstuff.objects.create(name=f'продукт{i}', measurement_unit='г')
+            for i in range(4)
+        ]
+        cls.recipes = [
+            create_recipe(cls.author, f'рецепт{i}') for i in range(3)
+        ]
+        for recipe, foodstuffs in zip(cls.recipes, (
+            cls.foodstuffs[:2], cls.foodstuffs[:3], cls.foodstuffs[3:]
+        )):
+            Ingredient.objects.bulk_create(
+                Ingredient(recipe=recipe, foodstuff=foodstuff, amount=10)
+                for foodstuff in foodstuffs
+            )
+
+    def setUp(self):
+        self.client = get_client(self.author)
+        # см. RecipeQueriesTest.setUp
+        discard_pending_versions()
+
+    def get_ids(self, **params):
+        response = self.client.get('/api/recipes/', params)
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def get_foodstuffs(self, *indexes):
+        return ','.join(str(self.foodstuffs[i].pk) for i in indexes)
+
+    def test_missing_ranking(self):
+        # рецепт со всеми продуктами выводится раньше рецепта,
+        # которому недостает продукта
+        self.assertEqual(
+            self.get_ids(
+                ingredients=self.get_foodstuffs(0, 1),
+                ingredients_mode=c.INGREDIENTS_MODE_MISSING, missing=1
+            ),
+            [self.recipes[0].pk, self.recipes[1].pk]
+        )
+
+    def test_missing_without_ingredients(self):
+        # пустой список продуктов не применяется, рецепты выводятся
+        # по курсору в порядке по умолчанию
+        self.assertEqual(
+            self.get_ids(
+                cursor='', ingredients=',',
+                ingredients_mode=c.INGREDIENTS_MODE_MISSING
+            ),
+            [recipe.pk for recipe in self.recipes[::-1]]
+        )
+
+    def test_all_any_exclude(self):
+        self.assertEqual(
+            sorted(self.get_ids(ingredients=self.get_foodstuffs(0, 1))),
+            [self.recipes[0].pk, self.recipes[1].pk]
+        )
+        self.assertEqual(
+            sorted(self.get_ids(
+                ingredients=self.get_foodstuffs(2, 3),
+                ingredients_mode=c.INGREDIENTS_MODE_ANY
+            )),
+            [self.recipes[1].pk, self.recipes[2].pk]
+        )
+        self.assertEqual(
+            self.get_ids(exclude_ingredients=self.get_foodstuffs(0)),
+            [self.recipes[2].pk]
+        )
+
+    def test_incremental_update(self):
+        index = get_ingredient_index()
+        recipe = self.recipes[2]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f'/api/recipes/{recipe.pk}/',
+                {'ingredients': [
+                    {'id': self.foodstuffs[0].pk, 'amount': 5}
+                ]},
+                format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        updated = get_ingredient_index()
+        # индекс обновлен без полной перестройки, прежний не изменился
+        self.assertIsNot(updated, index)
+        self.assertEqual(updated.built, index.built)
+        self.assertEqual(index.recipes[recipe.pk], (self.foodstuffs[3].pk,))
+        self.assertEqual(updated.recipes[recipe.pk], (self.foodstuffs[0].pk,))
+        self.assertEqual(updated.any([self.foodstuffs[3].pk]), set())
+        self.assertEqual(
+            updated.all([self.foodstuffs[0].pk]),
+            {recipe.pk for recipe in self.recipes}
+        )
+
+
+class IngredientSearchTest(APITestCase):
+    """Поиск продуктов по началу наименования (api.autocomplete)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('морская соль', 'соль морская', 'Соль', 'солод'):
+            Foodstuff.objects.create(name=name, measurement_unit='г')
+
+    def search(self, name, **params):
+        response = self.client.get(
+            '/api/ingredients/', {'name': name, **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        return [item['name'] for item in response.json()]
+
+    def test_prefix_ranking(self):
+        # точное совпадение выводится первым, наименования, содержащие
+        # строку не в начале, не выводятся
+        self.assertEqual(self.search('соль'), ['Соль', 'соль морская'])
+        self.assertEqual(self.search('СОЛ', limit=2), ['солод', 'Соль'])
+        self.assertEqual(self.search('морская'), ['морская соль'])
+
+
+class RecipeSearchTest(APITestCase):
+    """Полнотекстовый поиск рецептов при выводе по курсору."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.recipes = [
+            create_recipe(cls.author, f'суп {i}') for i in range(3)
+        ] + [create_recipe(cls.author, 'каша')]
+
+    def setUp(self):
+        self.client = get_client(self.author)
+
+    def get_pages(self, **params):
+        ids = []
+        response = self.client.get('/api/recipes/', {'cursor': '', **params})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            ids += [recipe['id'] for recipe in response.json()['results']]
+            if response.json()['next'] is None:
+                return ids
+            response = self.client.get(response.json()['next'])
+
+    def test_search_pages(self):
+        self.assertEqual(
+            sorted(self.get_pages(search='суп', limit=1)),
+            [recipe.pk for recipe in self.recipes[:3]]
+        )
+
+    def test_blank_search(self):
+        # поиск из пробелов не применяется, рецепты выводятся в порядке
+        # по умолчанию
+        self.assertEqual(
+            self.get_pages(search=' ', limit=2),
+            [recipe.pk for recipe in self.recipes[::-1]]
+        )
+
+
+@override_settings(FEED_FANOUT_THRESHOLD=2)
+class FeedTest(APITestCase):
+    """Лента подписок: таблица лент и рецепты популярных авторов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = create_user('reader')
+        cls.author = create_user('author')
+        cls.popular = create_user('popular')
+        for author in (cls.author, cls.popular):
+            Subscription.objects.create(user=cls.reader, author=author)
+        cls.recipes = [
+            create_recipe(cls.author, 'a1'), create_recipe(cls.popular, 'p1')
+        ]
+        # автор стал популярным: его новые рецепты выбираются при чтении,
+        # p1 остается в таблице лент
+        Subscription.objects.create(
+            user=create_user('other'), author=cls.popular
+        )
+        for name in ('p2', 'a2', 'p3', 'a3'):
+            author = cls.popular if name[0] == 'p' else cls.author
+            cls.recipes.append(create_recipe(author, name))
+
+    def setUp(self):
+        self.client = get_client(self.reader)
+
+    def get_feed(self, url='/api/recipes/feed/', **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return [recipe['name'] for recipe in data['results']], data['next']
+
+    def test_feed_pages(self):
+        # токен, страница таблицы лент, популярные авторы и их рецепты,
+        # рецепты страницы с тегами и ингредиентами (у рецептов теста нет
+        # ингредиентов), подписки, избранное и корзина пользователя
+        with self.assertNumQueries(10):
+            names, next_url = self.get_feed(limit=4)
+        self.assertEqual(names, ['a3', 'p3', 'a2', 'p2'])
+        names, next_url = self.get_feed(next_url)
+        self.assertEqual(names, ['p1', 'a1'])
+        self.assertIsNone(next_url)
+
+    def test_feed_filters(self):
+        names, _ = self.get_feed(author=self.popular.pk)
+        self.assertEqual(names, ['p3', 'p2', 'p1'])
+
+
+@override_settings(
+    DATABASE_REPLICAS=['replica_1'], DB_REPLICA_STICKY_SECONDS=5
+)
+class ReplicaTest(SimpleTestCase):
+    """Выбор базы данных для чтения (ReplicaMiddleware, ReplicaRouter)."""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.middleware = ReplicaMiddleware(self.get_response)
+
+    def get_response(self, request):
+        self.read_database = ReplicaRouter().db_for_read(Recipe)
+        return HttpResponse(status=getattr(request, 'status', 200))
+
+    def request(self, method, cookies=None, status=200):
+        request = getattr(self.factory, method)('/api/recipes/')
+        request.COOKIES.update(cookies or {})
+        request.status = status
+        response = self.middleware(request)
+        return self.read_database, response.cookies
+
+    def test_sticky_window(self):
+        self.assertEqual(self.request('get')[0], 'replica_1')
+        database, cookies = self.request('post', status=201)
+        self.assertEqual(database, DEFAULT_DB_ALIAS)
+        sticky = {c.REPLICA_COOKIE: cookies[c.REPLICA_COOKIE].value}
+        # другой процесс проверяет подпись cookie без общего кэша
+        self.assertEqual(self.request('get', sticky)[0], DEFAULT_DB_ALIAS)
+        expired = time.time() + 6
+        with mock.patch('django.core.signing.time.time', return_value=expired):
+            self.assertEqual(self.request('get', sticky)[0], 'replica_1')
+        forged = {c.REPLICA_COOKIE: '1'}
+        self.assertEqual(self.request('get', forged)[0], 'replica_1')
+
+    def test_failed_write_not_sticky(self):
+        _, cookies = self.request('post', status=400)
+        self.assertNotIn(c.REPLICA_COOKIE, cookies)
+
+    def test_atomic_reads_primary(self):
+        self.request('get')
+        self.assertEqual(self.read_database, 'replica_1')
+        with mock.patch.object(
+            connections[DEFAULT_DB_ALIAS], 'in_atomic_block', True
+        ):
+            self.request('get')
+        self.assertEqual(self.read_database, DEFAULT_DB_ALIAS)
+
+
+@override_settings(POPULARITY_VIEW_FLUSH_INTERVAL=60 * 60)
+class RecipeViewsTest(APITestCase):
+    """Просмотры рецептов учитываются в популярности (recipes.popularity)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('reader')
+        cls.recipe = create_recipe(cls.user)
+
+    def setUp(self):
+        self.client = get_client(self.user)
+        popularity._views.clear()
+        self.addCleanup(popularity._views.clear)
+
+    def test_view_recorded(self):
+        response = self.client.get(f'/api/recipes/{self.recipe.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(popularity._views, {self.recipe.pk: 1})
+
+    def test_missing_recipe_not_recorded(self):
+        response = self.client.get(f'/api/recipes/{self.recipe.pk + 1}/')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(popularity._views, {})
+
+    def test_cached_view_recorded(self):
+        url = f'/api/recipes/{self.recipe.pk}/'
+        self.addCleanup(get_cache().clear)
+        self.client.get(url)
+        self.assertEqual(APIClient().get(url)['X-Cache'], 'MISS')
+        self.assertEqual(APIClient().get(url)['X-Cache'], 'HIT')
+        self.assertEqual(popularity._views, {self.recipe.pk: 3})
+
+
+class ShoppingCartExportTest(APITestCase):
+    """Выгрузка списка покупок в форматах EXPORT_FORMATS."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('reader')
+        foodstuffs = [
+            Foodstuff.objects.create(name=name, measurement_unit='г')
+            for name in ('соль', 'мука')
+        ]
+        recipes = [create_recipe(cls.user, f'рецепт{i}') for i in range(2)]
+        Ingredient.objects.bulk_create(
+            Ingredient(recipe=recipe, foodstuff=foodstuff, amount=10)
+            for recipe in recipes for foodstuff in foodstuffs
+        )
+        batch.add(Basket, cls.user, [recipe.pk for recipe in recipes])
+
+    def setUp(self):
+        self.client = get_client(self.user)
+
+    def download(self, file_format, content_type):
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/', {'format': file_format}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], content_type)
+        self.assertEqual(
+            response['Content-Disposition'],
+            f'attachment; filename="Ingredients.{file_format}"'
+        )
+        return b''.join(response.streaming_content)
+
+    def test_txt(self):
+        content = self.download('txt', 'text/plain; charset=utf-8')
+        self.assertEqual(content.decode().splitlines()[2:], [
+            '- мука (г) - 20', '- соль (г) - 20'
+        ])
+
+    def test_csv(self):
+        content = self.download('csv', 'text/csv; charset=utf-8')
+        self.assertEqual(content.decode().splitlines(), [
+            'name,measurement_unit,amount', 'мука,г,20', 'соль,г,20'
+        ])
+
+    def test_json(self):
+        content = self.download('json', 'application/json')
+        self.assertEqual(json.loads(content), [
+            {'name': 'мука', 'measurement_unit': 'г', 'amount': 20},
+            {'name': 'соль', 'measurement_unit': 'г', 'amount': 20},
+        ])
+
+    def test_pdf(self):
+        content = self.download('pdf', 'application/pdf')
+        self.assertTrue(content.startswith(b'%PDF-'))
+        self.assertTrue(content.rstrip().endswith(b'%%EOF'))
+
+    def test_unknown_format(self):
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/', {'format': 'xml'}
+        )
+        self.assertEqual(response.status_code, 400)
@@ -1,6 +1,8 @@
+from django.urls import re_path
 from rest_framework import routers
 
-from api.views import FoodstuffViewSet, RecipeViewSet, TagViewSet, UserViewSet
+from api.views import (FoodstuffViewSet, MetricsView, RecipeViewSet,
+                       TagViewSet, UserViewSet)
 
 app_name = 'api'
 
@@ -10,4 +12,6 @@ router.register(r'recipes', RecipeViewSet, basename='recipes')
 router.register(r'ingredients', FoodstuffViewSet, basename='ingredients')
 router.register(r'tags', TagViewSet, basename='tags')
 
-urlpatterns = router.urls
+urlpatterns = [
+    re_path(r'^_metrics/?$', MetricsView.as_view(), name='metrics'),
+] + router.urls
@@ -1,17 +1,22 @@
-from django.db.models import Sum
+def get_positive_int(value, allow_zero=False):
+    """
+    Преобразует значение параметра запроса в положительное целое число.
 
-from recipes.models import Ingredient
+    При отсутствии значения или некорректном значении возвращает None.
+    """
+    if value is None:
+        return None
+    try:
+        value = int(value)
+    except ValueError:
+        return None
+    if value > 0 or allow_zero and value == 0:
+        return value
+    return None
 
 
-def create_shopping_cart(request):
-    """Создает результирующий список ингредиентов."""
-    query = (
-        Ingredient.objects.filter(recipe__basket__user=request.user).
-        values('foodstuff__name', 'foodstuff__measurement_unit').
-        annotate(amount=Sum('amount')).order_by()
+def get_recipes_limit(request):
+    """Возвращает значение параметра запроса 'recipes_limit'."""
+    return get_positive_int(
+        request.query_params.get('recipes_limit'), allow_zero=True
     )
-    file = 'Список продуктов: \r\n' + '-' * 40 + '\r\n'
-    for obj in query:
-        line = '- {0} ({1}) - {2}'.format(*obj.values())
-        file += line + '\r\n'
-    return file
@@ -1,37 +1,58 @@
 from django.contrib.auth import get_user_model
-from django.db.models import Exists, OuterRef
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import F, Prefetch, Window, prefetch_related_objects
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser import views
-from rest_framework import filters, permissions, status, viewsets
+from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
 
+from api import constants as c
+from api import metrics
+from api.autocomplete import get_foodstuff_index
+from api.export import (CSV_HEADER, EXPORT_FORMATS, ExportContentNegotiation,
+                        iter_shopping_cart)
 from api.filters import RecipeFilter
-from api.mixins import ExcludePutViewSet
-from api.pagination import PageLimitPagination
-from api.permissions import AuthorAdminOrReadOnly
-from api.serializers import (BasketSerializer, FavoriteSerializer,
-                             FoodstuffSerializer, RecipeSerializer,
-                             SubscriptionSerializer, TagSerializer,
-                             UserSubscriptionSerializer)
-from api.utils import create_shopping_cart
+from api.mixins import (AnonymousCacheMixin, AsyncViewMixin,
+                        BatchRelationsMixin, ExcludePutViewSet,
+                        SerializerMetricsMixin, SnapshotListMixin)
+from api.pagination import (KeysetPagination, PageLimitCursorPagination,
+                            PageLimitPagination)
+from api.permissions import AuthorAdminOrReadOnly, IsStaffOrLocalhost
+from api.serializers import (BasketSerializer, BatchSerializer,
+                             FavoriteSerializer, FoodstuffSerializer,
+                             RecipeSerializer, SubscriptionSerializer,
+                             TagSerializer, UserSubscriptionSerializer)
+from api.utils import get_positive_int, get_recipes_limit
+from recipes.feed import get_feed_ids
 from recipes.models import (Basket, Favorite, Foodstuff, Recipe, Subscription,
                             Tag)
+from recipes.popularity import record_view
+from recipes.signals import deleting
 
 User = get_user_model()
 
 
-class UserViewSet(views.UserViewSet):
+class UserViewSet(
+    AsyncViewMixin, SerializerMetricsMixin, BatchRelationsMixin,
+    views.UserViewSet
+):
     """
     Представление обрабатывает ендпоинт 'users'.
 
     Наследует djoser UserViewSet. Добавлены actions:
     - subscriptions - возвращает подписки текущего пользователя
     - subscribe - добавление и удаление подписок
+    - subscribe_batch - добавление и удаление подписок на авторов из списка
+        ids одним запросом (BatchRelationsMixin)
     """
-    queryset = User.objects.prefetch_related('subscribers').all()
+    queryset = User.objects.all()
     pagination_class = PageLimitPagination
 
     def get_serializer_class(self, *args, **kwargs):
@@ -39,19 +60,57 @@ class UserViewSet(views.UserViewSet):
             return UserSubscriptionSerializer
         if self.action == 'subscribe':
             return SubscriptionSerializer
+        if self.action == 'subscribe_batch':
+            return BatchSerializer
         return super().get_serializer_class(*args, **kwargs)
 
+    def get_limited_recipes(self, authors):
+        """
+        Возвращает queryset рецептов авторов authors для prefetch
+        в subscriptions.
+
+        Выбираются только поля сериализатора RecipesMinifiedSerializer.
+        При наличии 'recipes_limit' рецепты нумеруются оконной функцией
+        ROW_NUMBER() в разрезе автора (индекс (author, -pub_date))
+        и выбираются первые limit рецептов каждого автора: один проход
+        по рецептам авторов страницы вместо подзапроса на каждого автора.
+        """
+        recipes = Recipe.objects.only(
+            'author', 'name', 'image', 'image_variants', 'cooking_time'
+        )
+        limit = get_recipes_limit(self.request)
+        if limit is None:
+            return recipes
+        if limit == 0 or not authors:
+            return recipes.none()
+        # Django 3.2 не фильтрует по оконным функциям, поэтому нумерация
+        # выполняется во вложенном запросе
+        ranked = Recipe.objects.filter(author__in=authors).annotate(
+            position=Window(
+                RowNumber(), partition_by=F('author'),
+                order_by=(F('pub_date').desc(), F('id').desc())
+            )
+        ).values('id', 'position').order_by()
+        sql, params = ranked.query.sql_with_params()
+        return recipes.filter(pk__in=RawSQL(
+            f'SELECT id FROM ({sql}) AS ranked WHERE position <= %s',
+            (*params, limit)
+        ))
+
     @action(detail=False)
     def subscriptions(self, request):
-        queryset = (
-            User.objects.all().prefetch_related('subscribers', 'recipes').
-            filter(subscribers__user=request.user.id)
-        )
+        # подписки по порядку оформления: стабильный порядок страниц
+        queryset = User.objects.filter(
+            subscribers__user=request.user.id
+        ).order_by('subscribers__id')
         page = self.paginate_queryset(queryset)
+        authors = list(queryset) if page is None else page
+        prefetch_related_objects(authors, Prefetch(
+            'recipes', queryset=self.get_limited_recipes(authors)
+        ))
+        serializer = self.get_serializer(authors, many=True)
         if page is not None:
-            serializer = self.get_serializer(page, many=True)
             return self.get_paginated_response(serializer.data)
-        serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
     @action(methods=['post', 'delete'], detail=True)
@@ -69,63 +128,145 @@ class UserViewSet(views.UserViewSet):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(
+        methods=['post', 'delete'], detail=False, url_path='subscribe/batch',
+        permission_classes=(permissions.IsAuthenticated,)
+    )
+    def subscribe_batch(self, request):
+        return self.batch_interface(
+            Subscription, request,
+            SubscriptionSerializer.Meta.validators[0].message,
+            errors={request.user.pk: 'Нельзя подписаться на себя!'}
+        )
+
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
-    """Представление обрабатывает ендпоинт 'tags'."""
+class TagViewSet(
+    AsyncViewMixin, SerializerMetricsMixin, SnapshotListMixin,
+    viewsets.ReadOnlyModelViewSet
+):
+    """
+    Представление обрабатывает ендпоинт 'tags'.
+
+    Список тегов отдается из снимка (SnapshotListMixin).
+    """
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
     permission_classes = (permissions.AllowAny,)
+    snapshot_name = c.TAGS_SNAPSHOT
 
 
-class FoodstuffViewSet(viewsets.ReadOnlyModelViewSet):
-    """Представление обрабатывает эндпоинт 'ingredients'."""
+class FoodstuffViewSet(
+    AsyncViewMixin, SerializerMetricsMixin, SnapshotListMixin,
+    viewsets.ReadOnlyModelViewSet
+):
+    """
+    Представление обрабатывает эндпоинт 'ingredients'.
+
+    Список продуктов без параметра поиска отдается из снимка
+    (SnapshotListMixin).
+    name - параметр запроса, возвращает продукты, наименование которых
+    начинается с указанной строки без учета регистра. Поиск выполняется
+    по индексу в памяти процесса, точные совпадения выводятся первыми.
+    limit - ограничивает количество найденных продуктов.
+    """
     queryset = Foodstuff.objects.all()
     serializer_class = FoodstuffSerializer
-    filter_backends = (filters.SearchFilter,)
-    search_fields = ('^name',)
     pagination_class = None
     permission_classes = (permissions.AllowAny,)
+    snapshot_name = c.FOODSTUFF_SNAPSHOT
 
+    def list(self, request, *args, **kwargs):
+        prefix = request.query_params.get(api_settings.SEARCH_PARAM)
+        if prefix is None:
+            return super().list(request, *args, **kwargs)
+        limit = get_positive_int(request.query_params.get('limit'))
+        return Response(get_foodstuff_index().search(prefix, limit))
 
-class RecipeViewSet(ExcludePutViewSet):
+
+class RecipeViewSet(
+    AsyncViewMixin, SerializerMetricsMixin, AnonymousCacheMixin,
+    BatchRelationsMixin, ExcludePutViewSet
+):
     """
     Представление обрабатывает ендпоинт 'recipes'.
 
     actions:
     - shopping_cart - добавляет или удаляет рецепт из списка покупок.
     - favorite - добавляет или удаляет рецепт из избранного.
-    - download_shopping_cart - отправляет пользователю файл Ingredients.txt
-        со списком ингредиентов.
+    - shopping_cart_batch, favorite_batch - добавляют или удаляют рецепты
+        из списка ids одним запросом (BatchRelationsMixin).
+    - feed - лента подписок: рецепты авторов, на которых подписан
+        пользователь, по курсору в порядке публикации (recipes.feed).
+    - shopping_list - список покупок пользователя в формате JSON:
+        суммарное количество каждого продукта в рецептах корзины.
+    - download_shopping_cart - отправляет пользователю файл Ingredients
+        со списком ингредиентов, параметр запроса format задает формат
+        файла: txt (по умолчанию), csv, json, pdf.
+    Параметр запроса cursor включает постраничный вывод по курсору
+    в порядке cursor_ordering без подсчета общего количества рецептов.
+    Параметр запроса search включает полнотекстовый поиск, рецепты
+    упорядочиваются по релевантности (в том числе при выводе по курсору).
+    Параметры ingredients, ingredients_mode, missing, exclude_ingredients
+    фильтруют рецепты по продуктам (RecipeFilter).
+    Параметр запроса ordering=popular упорядочивает рецепты по
+    популярности, просмотры рецептов (retrieve) учитываются в ней.
+    Ответы list и retrieve для неаутентифицированных пользователей
+    кэшируются (AnonymousCacheMixin).
+    Количество SQL-запросов при создании, изменении и удалении рецепта
+    ограничено тестами RecipeQueriesTest (api/tests.py).
     """
     serializer_class = RecipeSerializer
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
-    pagination_class = PageLimitPagination
+    pagination_class = PageLimitCursorPagination
+    cache_query_params = (
+        'page', 'limit', 'cursor', 'tags', 'tags_mode', 'author', 'search',
+        'ingredients', 'ingredients_mode', 'missing', 'exclude_ingredients',
+        'ordering'
+    )
     permission_classes = (AuthorAdminOrReadOnly,)
 
-    def get_queryset(self):
-        current_user = self.request.user
-        if not isinstance(current_user, User):
-            current_user = None
-        favorites = Favorite.objects.filter(
-            user=current_user, recipe=OuterRef('pk')
-        )
-        shoppings = Basket.objects.filter(
-            user=current_user, recipe=OuterRef('pk')
-        )
-        return (
-            Recipe.objects.select_related('author').prefetch_related(
-                'tags', 'ingredients__foodstuff', 'author__subscribers'
-            ).annotate(is_favorited=Exists(favorites),
-                       is_in_shopping_cart=Exists(shoppings))
+    @property
+    def cursor_ordering(self):
+        # параметры запроса уже проверены в filter_queryset
+        filterset = self.filter_backends[0]().get_filterset(
+            self.request, self.get_queryset(), self
         )
+        filterset.is_valid()
+        return filterset.cursor_ordering
+
+    def get_queryset(self):
+        queryset = Recipe.objects.select_related('author')
+        if self.action == 'destroy':
+            return queryset
+        if (
+            self.action == 'partial_update'
+            and 'ingredients' in self.request.data
+        ):
+            # продукты ингредиентов ответа берутся из проверенных данных
+            # запроса (RecipeSerializer.save_ingredients)
+            return queryset.prefetch_related('tags', 'ingredients')
+        return queryset.prefetch_related('tags', 'ingredients__foodstuff')
+
+    def retrieve(self, request, *args, **kwargs):
+        response = super().retrieve(request, *args, **kwargs)
+        # просмотр учитывается после get_object (рецепт найден, иначе
+        # Http404) или ответа из кэша анонимных запросов
+        record_view(kwargs['pk'])
+        return response
+
+    def perform_destroy(self, instance):
+        with transaction.atomic(), deleting(instance):
+            instance.delete()
 
     def get_serializer_class(self, *args, **kwargs):
         if self.action == 'shopping_cart':
             return BasketSerializer
         if self.action == 'favorite':
             return FavoriteSerializer
+        if self.action in ('shopping_cart_batch', 'favorite_batch'):
+            return BatchSerializer
         return super().get_serializer_class(*args, **kwargs)
 
     def user_interfase(self, model, request, pk):
@@ -147,11 +288,83 @@ class RecipeViewSet(ExcludePutViewSet):
     def favorite(self, request, pk):
         return self.user_interfase(Favorite, request, pk)
 
+    @action(
+        methods=['post', 'delete'], detail=False,
+        url_path='shopping_cart/batch',
+        permission_classes=(permissions.IsAuthenticated,)
+    )
+    def shopping_cart_batch(self, request):
+        return self.batch_interface(
+            Basket, request, BasketSerializer.Meta.validators[0].message
+        )
+
+    @action(
+        methods=['post', 'delete'], detail=False, url_path='favorite/batch',
+        permission_classes=(permissions.IsAuthenticated,)
+    )
+    def favorite_batch(self, request):
+        return self.batch_interface(
+            Favorite, request, FavoriteSerializer.Meta.validators[0].message
+        )
+
+    @action(detail=False, permission_classes=(permissions.IsAuthenticated,))
+    def feed(self, request):
+        queryset = self.get_queryset()
+        # фильтры рецептов ограничивают ленту подзапросом, без них
+        # страница выбирается только из таблицы лент
+        recipes = None
+        if set(request.query_params) & set(self.filterset_class.base_filters):
+            recipes = self.filter_queryset(queryset)
+        paginator = KeysetPagination()
+        page = paginator.paginate_ids(
+            lambda position, size: get_feed_ids(
+                request.user, size, position, recipes
+            ),
+            queryset, request
+        )
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
     @action(detail=False, permission_classes=(permissions.IsAuthenticated,))
+    def shopping_list(self, request):
+        return Response([
+            dict(zip(CSV_HEADER, row))
+            for row in iter_shopping_cart(request.user)
+        ])
+
+    @action(
+        detail=False, permission_classes=(permissions.IsAuthenticated,),
+        content_negotiation_class=ExportContentNegotiation
+    )
     def download_shopping_cart(self, request):
-        file = create_shopping_cart(request)
-        response = HttpResponse(file, content_type='text/plain')
+        file_format = request.query_params.get('format', 'txt')
+        if file_format not in EXPORT_FORMATS:
+            return Response(
+                {'format': f'Доступные форматы: {", ".join(EXPORT_FORMATS)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        export, content_type, extension = EXPORT_FORMATS[file_format]
+        response = StreamingHttpResponse(
+            export(iter_shopping_cart(request.user)),
+            content_type=content_type
+        )
         response['Content-Disposition'] = (
-            'attachment; filename="Ingredients.txt"'
+            f'attachment; filename="Ingredients.{extension}"'
         )
         return response
+
+
+class MetricsView(APIView):
+    """
+    Представление обрабатывает ендпоинт '_metrics'.
+
+    Возвращает метрики запросов процесса (MetricsMiddleware) в текстовом
+    формате Prometheus. Доступно администраторам и с адресов
+    METRICS_ALLOWED_IPS.
+    """
+    permission_classes = (IsStaffOrLocalhost,)
+
+    def get(self, request):
+        return HttpResponse(
+            metrics.expose(), content_type=c.METRICS_CONTENT_TYPE
+        )
@@ -0,0 +1,153 @@
+import threading
+import time
+from collections import Counter, deque
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """
+    Пул соединений с базой данных в памяти процесса.
+
+    Одновременно выдается не более size соединений, остальные потоки
+    ждут освобождения соединения не дольше timeout секунд. Свободные
+    соединения выдаются в обратном порядке (последнее возвращенное -
+    первым), соединение, простаивавшее не меньше check_interval секунд,
+    перед выдачей проверяется функцией is_usable. Функция reset
+    вызывается при возврате соединения и возвращает False, если
+    соединение нельзя использовать повторно.
+    """
+
+    def __init__(self, size, timeout, check_interval, is_usable, reset):
+        self.size = size
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self.is_usable = is_usable
+        self.reset = reset
+        self.slots = threading.BoundedSemaphore(size)
+        self.idle = deque()
+        self.in_use = 0
+        self.stats = Counter()
+        self.closed = False
+        self.lock = threading.Lock()
+
+    def getconn(self, connect):
+        """Выдает свободное соединение или новое, созданное connect()."""
+        if not self.slots.acquire(blocking=False):
+            start = time.perf_counter()
+            acquired = self.slots.acquire(timeout=self.timeout)
+            with self.lock:
+                self.stats['waits'] += 1
+                self.stats['wait_seconds'] += time.perf_counter() - start
+                if not acquired:
+                    self.stats['timeouts'] += 1
+            if not acquired:
+                raise PoolTimeout(
+                    f'Все соединения пула ({self.size}) заняты дольше '
+                    f'{self.timeout} с.'
+                )
+        try:
+            conn = self.take_idle()
+            if conn is None:
+                conn = connect()
+                with self.lock:
+                    self.stats['opened'] += 1
+        except BaseException:
+            self.slots.release()
+            raise
+        with self.lock:
+            self.in_use += 1
+        return conn
+
+    def take_idle(self):
+        while True:
+            with self.lock:
+                if not self.idle:
+                    return None
+                conn, returned_at = self.idle.pop()
+            idle_time = time.monotonic() - returned_at
+            if (
+                self.check_interval is None
+                or idle_time < self.check_interval
+                or self.is_usable(conn)
+            ):
+                return conn
+            with self.lock:
+                self.stats['health_check_failures'] += 1
+            self.discard(conn)
+
+    def putconn(self, conn):
+        """Возвращает соединение в пул, неисправное соединение закрывается."""
+        try:
+            usable = self.reset(conn)
+        except Exception:
+            usable = False
+        with self.lock:
+            self.in_use -= 1
+            usable = usable and not self.closed
+            if usable:
+                self.idle.append((conn, time.monotonic()))
+        if not usable:
+            self.discard(conn)
+        self.slots.release()
+
+    def discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self.lock:
+            self.stats['closed'] += 1
+
+    def close(self):
+        """Закрывает свободные соединения, занятые - при возврате."""
+        with self.lock:
+            self.closed = True
+            idle, self.idle = self.idle, deque()
+        for conn, returned_at in idle:
+            self.discard(conn)
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'size': self.size,
+                'in_use': self.in_use,
+                'idle': len(self.idle),
+                **{
+                    name: self.stats[name] for name in (
+                        'opened', 'closed', 'waits', 'wait_seconds',
+                        'timeouts', 'health_check_failures',
+                    )
+                },
+            }
+
+
+def get_pool(alias, create):
+    """Возвращает пул соединений базы данных alias, создавая его create()."""
+    pool = _pools.get(alias)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(alias)
+            if pool is None:
+                pool = _pools[alias] = create()
+    return pool
+
+
+def close_pool(alias):
+    """Закрывает и удаляет пул соединений базы данных alias."""
+    with _pools_lock:
+        pool = _pools.pop(alias, None)
+    if pool is not None:
+        pool.close()
+
+
+def get_pool_stats():
+    """Возвращает состояние пулов соединений процесса по базам данных."""
+    with _pools_lock:
+        pools = list(_pools.items())
+    return {alias: pool.get_stats() for alias, pool in pools}
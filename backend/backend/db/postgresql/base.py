@@ -0,0 +1,92 @@
+import functools
+
+from django.db.backends.postgresql import base
+from psycopg2 import extensions
+
+from backend.db.pool import ConnectionPool, PoolTimeout, get_pool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    Бэкенд PostgreSQL с пулом соединений и проверкой соединений.
+
+    Django 3.2 не поддерживает пул соединений и CONN_HEALTH_CHECKS.
+    Дополнительные ключи настроек базы данных:
+    POOL_SIZE - количество соединений пула процесса, 0 - без пула;
+    POOL_TIMEOUT - ожидание свободного соединения пула в секундах;
+    CONN_HEALTH_CHECKS - проверка соединения перед использованием:
+    соединение пула проверяется, если простаивало не меньше
+    POOL_CHECK_INTERVAL секунд, постоянное соединение (CONN_MAX_AGE) -
+    при первом обращении в каждом запросе.
+    """
+    health_check_done = False
+
+    def get_connection_pool(self):
+        settings = self.settings_dict
+        return get_pool(self.alias, lambda: ConnectionPool(
+            size=settings['POOL_SIZE'],
+            timeout=settings.get('POOL_TIMEOUT', 10),
+            check_interval=(
+                settings.get('POOL_CHECK_INTERVAL', 10)
+                if settings.get('CONN_HEALTH_CHECKS') else None
+            ),
+            is_usable=self.check_connection,
+            reset=self.reset_connection,
+        ))
+
+    def get_new_connection(self, conn_params):
+        if not self.settings_dict.get('POOL_SIZE'):
+            return super().get_new_connection(conn_params)
+        try:
+            return self.get_connection_pool().getconn(
+                functools.partial(super().get_new_connection, conn_params)
+            )
+        except PoolTimeout as error:
+            raise self.Database.OperationalError(str(error)) from error
+
+    def _close(self):
+        if self.connection is None or not self.settings_dict.get('POOL_SIZE'):
+            return super()._close()
+        self.get_connection_pool().putconn(self.connection)
+
+    def connect(self):
+        super().connect()
+        self.health_check_done = True
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
+
+    def ensure_connection(self):
+        if (
+            self.connection is not None
+            and not self.health_check_done
+            and not self.in_atomic_block
+            and self.settings_dict.get('CONN_HEALTH_CHECKS')
+            and not self.settings_dict.get('POOL_SIZE')
+        ):
+            self.health_check_done = True
+            if not self.check_connection(self.connection):
+                self.close()
+        super().ensure_connection()
+
+    @staticmethod
+    def check_connection(conn):
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except base.Database.Error:
+            return False
+        return True
+
+    @staticmethod
+    def reset_connection(conn):
+        """Откатывает незавершенную транзакцию возвращаемого соединения."""
+        if conn.closed:
+            return False
+        status = conn.info.transaction_status
+        if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if status != extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+        return True
@@ -0,0 +1,71 @@
+import contextvars
+import random
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# база данных для чтения в текущем запросе, None - основная
+_read_database = contextvars.ContextVar('read_database', default=None)
+
+
+class ReplicaRouter:
+    """
+    Направляет чтение в реплику, выбранную для запроса, запись - в основную
+    базу данных.
+
+    Реплика выбирается ReplicaMiddleware для запросов безопасными
+    методами, вне запроса (команды управления, фоновые задачи) чтение
+    выполняется из основной базы данных. Внутри транзакции основной базы
+    данных (atomic) чтение выполняется из нее: реплика не содержит
+    изменений, еще не зафиксированных транзакцией.
+    """
+
+    def db_for_read(self, model, **hints):
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return _read_database.get() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # реплики содержат те же данные, что и основная база данных
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if {obj1._state.db, obj2._state.db} <= databases:
+            return True
+        return None
+
+
+def choose_replica():
+    if not settings.DATABASE_REPLICAS:
+        return None
+    return random.choice(settings.DATABASE_REPLICAS)
+
+
+def set_read_database(alias):
+    """Устанавливает базу данных для чтения, возвращает токен для reset."""
+    return _read_database.set(alias)
+
+
+def reset_read_database(token):
+    _read_database.reset(token)
+
+
+@contextmanager
+def use_primary():
+    """Контекст чтения из основной базы данных."""
+    token = _read_database.set(None)
+    try:
+        yield
+    finally:
+        _read_database.reset(token)
+
+
+def is_recent(version):
+    """
+    Версия набора данных (время изменения в наносекундах) новее окна
+    DB_REPLICA_STICKY_SECONDS, реплики могут еще не содержать изменение.
+    """
+    return time.time_ns() - version < settings.DB_REPLICA_STICKY_SECONDS * 1e9
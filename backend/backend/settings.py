@@ -36,6 +36,8 @@ INSTALLED_APPS = [
 AUTH_USER_MODEL = 'users.User'
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
+    'api.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -65,16 +67,124 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'backend.wsgi.application'
 
+# Соединения с базой данных: DB_POOL_SIZE > 0 - пул соединений каждого
+# процесса (соединение возвращается в пул после запроса), иначе
+# соединение потока закрывается через DB_CONN_MAX_AGE секунд (0 - после
+# каждого запроса). Ограничение времени SQL-запроса - в миллисекундах
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 0))
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'backend.db.postgresql',
         'NAME': os.getenv('POSTGRES_DB', 'django'),
         'USER': os.getenv('POSTGRES_USER', 'django'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
         'HOST': os.getenv('DB_HOST', '127.0.0.1'),
-        'PORT': os.getenv('DB_PORT', 5432)
+        'PORT': os.getenv('DB_PORT', 5432),
+        'CONN_MAX_AGE': (
+            0 if DB_POOL_SIZE else int(os.getenv('DB_CONN_MAX_AGE', 0))
+        ),
+        'CONN_HEALTH_CHECKS': os.getenv(
+            'DB_CONN_HEALTH_CHECKS', 'True'
+        ).lower() == 'true',
+        'POOL_SIZE': DB_POOL_SIZE,
+        'POOL_TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+        'POOL_CHECK_INTERVAL': float(os.getenv('DB_POOL_CHECK_INTERVAL', 10)),
+        'OPTIONS': {
+            'options': '-c statement_timeout={}'.format(
+                int(os.getenv('DB_STATEMENT_TIMEOUT', 0))
+            ),
+        },
+    }
+}
+
+# Реплики для чтения: адреса 'host:port' через запятую. Запросы
+# безопасными методами читают из реплик, клиент после изменяющего
+# запроса читает из основной базы данных DB_REPLICA_STICKY_SECONDS секунд
+# (подписанная cookie, api.middleware.ReplicaMiddleware)
+DATABASE_REPLICAS = []
+for number, address in enumerate(
+    filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(', ')), start=1
+):
+    host, _, port = address.partition(':')
+    DATABASE_REPLICAS.append(f'replica_{number}')
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
     }
+DATABASE_ROUTERS = ['backend.db.router.ReplicaRouter']
+DB_REPLICA_STICKY_SECONDS = int(os.getenv('DB_REPLICA_STICKY_SECONDS', 5))
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Кэш ответов для неаутентифицированных пользователей.
+# Ключи ответов, снимков и индексов в памяти процесса содержат версию
+# набора данных из таблицы api.DataVersion, общей для всех процессов,
+# поэтому кэш процесса (LocMemCache) не отдает устаревшие данные дольше
+# DATA_VERSION_CHECK_INTERVAL секунд после изменения в другом процессе.
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 300))
+DATA_VERSION_CHECK_INTERVAL = float(
+    os.getenv('DATA_VERSION_CHECK_INTERVAL', 1)
+)
+
+# Выгрузка списка покупок
+SHOPPING_CART_PDF_FONT = os.getenv(
+    'SHOPPING_CART_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+
+# Метрики запросов (/api/_metrics/): доступ администраторам и с адресов
+# METRICS_ALLOWED_IPS, порог повторов SQL-запроса для отметки N+1
+METRICS_ALLOWED_IPS = os.getenv(
+    'METRICS_ALLOWED_IPS', '127.0.0.1, ::1'
+).split(', ')
+METRICS_REPEATED_QUERY_THRESHOLD = int(
+    os.getenv('METRICS_REPEATED_QUERY_THRESHOLD', 10)
+)
+
+# Режим сервера: wsgi (синхронные процессы gunicorn) или asgi (процессы
+# gunicorn с uvicorn), в режиме asgi представления API по умолчанию
+# выполняются в пуле из ASYNC_VIEW_WORKERS потоков каждого процесса
+SERVER_MODE = os.getenv('SERVER_MODE', 'wsgi')
+ASYNC_VIEWS = os.getenv(
+    'ASYNC_VIEWS', str(SERVER_MODE == 'asgi')
+).lower() == 'true'
+ASYNC_VIEW_WORKERS = int(os.getenv('ASYNC_VIEW_WORKERS', 10))
+
+# Лента подписок: рецепты авторов с меньшим количеством подписчиков
+# рассылаются в ленты при публикации, остальные выбираются при чтении
+FEED_FANOUT_THRESHOLD = int(os.getenv('FEED_FANOUT_THRESHOLD', 1000))
+FEED_LENGTH = int(os.getenv('FEED_LENGTH', 500))
+
+# Популярность рецептов: период полураспада в часах, периодичность
+# запуска команды decaypopularity в часах, интервал записи просмотров
+# в базу данных в секундах
+POPULARITY_HALF_LIFE = float(os.getenv('POPULARITY_HALF_LIFE', 72))
+POPULARITY_DECAY_INTERVAL = float(os.getenv('POPULARITY_DECAY_INTERVAL', 1))
+POPULARITY_VIEW_FLUSH_INTERVAL = float(
+    os.getenv('POPULARITY_VIEW_FLUSH_INTERVAL', 10)
+)
+
+# Обработка изображений рецептов: thread, process или sync
+IMAGE_PIPELINE_MODE = os.getenv('IMAGE_PIPELINE_MODE', 'thread')
+IMAGE_PIPELINE_WORKERS = int(os.getenv('IMAGE_PIPELINE_WORKERS', 2))
+IMAGE_VARIANTS_DIR = 'recipes/images/variants'
+IMAGE_VARIANT_SIZES = {
+    'small': (320, 320),
+    'medium': (640, 640),
 }
+IMAGE_VARIANT_QUALITY = 80
 
 AUTH_PASSWORD_VALIDATORS = [
     {
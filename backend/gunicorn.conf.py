@@ -0,0 +1,21 @@
+"""
+Настройки gunicorn.
+
+SERVER_MODE задает режим сервера: wsgi - синхронные процессы
+(backend.wsgi), asgi - процессы uvicorn (backend.asgi), в которых
+представления API выполняются в пуле потоков. Количество процессов
+задает переменная WEB_CONCURRENCY (по умолчанию 1), в режиме wsgi
+GUNICORN_THREADS > 1 включает процессы gthread с заданным количеством
+потоков. Пул соединений с базой данных (DB_POOL_SIZE) общий для потоков
+процесса, его размер обычно равен количеству потоков.
+"""
+import os
+
+bind = '0.0.0.0:8000'
+
+if os.getenv('SERVER_MODE', 'wsgi') == 'asgi':
+    wsgi_app = 'backend.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'backend.wsgi:application'
+    threads = int(os.getenv('GUNICORN_THREADS', 1))
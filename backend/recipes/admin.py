@@ -1,10 +1,11 @@
 from django import forms
 from django.contrib import admin
-from django.db.models import Count
+from django.utils import timezone
 
 from recipes import constants as c
 from recipes.models import (Basket, Favorite, Foodstuff, Ingredient, Recipe,
                             RecipeTag, Subscription, Tag)
+from recipes.signals import ingredients_changed
 
 
 class IngredientFormSet(forms.models.BaseInlineFormSet):
@@ -59,11 +60,21 @@ class RecipeAdmin(admin.ModelAdmin):
     list_filter = ('author__username', 'name', 'tags', 'pub_date',)
     inlines = (IngredientInline, TagInline)
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        if change:
+            Recipe.objects.filter(pk=form.instance.pk).update(
+                ingredients_modified=timezone.now()
+            )
+        ingredients_changed.send(
+            sender=Recipe, instance=form.instance, created=not change
+        )
+
     def trim_text(self, obj):
         return f'{obj.text[:c.TRIM_TEXT_FIELD]}'
 
     def favorite_count(self, obj):
-        return obj.favorite_set.aggregate(Count('user'))['user__count']
+        return obj.favorites_count
 
     def get_tags(self, obj):
         return ', '.join([str(tag) for tag in obj.tags.all()])
@@ -0,0 +1,82 @@
+from django.db import connection, transaction
+
+from recipes.models import Basket, Favorite, Subscription
+from recipes.signals import relations_bulk_added, relations_bulk_removed
+
+# модель записей пользователя: поле связанного объекта (рецепта, автора)
+RELATIONS = {
+    Favorite: 'recipe',
+    Basket: 'recipe',
+    Subscription: 'author',
+}
+
+# добавление записей существующих объектов, уже добавленные пропускаются
+INSERT_SQL = '''
+    INSERT INTO {table} (user_id, {column})
+    SELECT %s, id FROM {target} WHERE id IN ({ids})
+    ON CONFLICT DO NOTHING
+    RETURNING {column}
+'''
+DELETE_SQL = '''
+    DELETE FROM {table} WHERE user_id = %s AND {column} IN ({ids})
+    RETURNING {column}
+'''
+
+
+def fetch_column(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return {row[0] for row in cursor.fetchall()}
+
+
+def get_sql(sql, model, pks):
+    field = model._meta.get_field(RELATIONS[model])
+    return sql.format(
+        table=model._meta.db_table, column=field.column,
+        target=field.related_model._meta.db_table,
+        ids=', '.join(['%s'] * len(pks))
+    )
+
+
+def add(model, user, pks):
+    """
+    Добавляет пользователю записи модели model (избранное, корзина,
+    подписки) для рецептов или авторов pks.
+
+    Существование объектов проверяется одним запросом, записи
+    добавляются одним запросом INSERT ... ON CONFLICT DO NOTHING.
+    Сигналы post_save не отправляются, счетчики, ленты подписок и списки
+    покупок изменяются обработчиками сигнала relations_bulk_added.
+    Возвращает (существующие pks, добавленные pks).
+    """
+    target = model._meta.get_field(RELATIONS[model]).related_model
+    existing = set(
+        target.objects.filter(pk__in=pks).values_list('pk', flat=True)
+    )
+    pks = [pk for pk in pks if pk in existing]
+    if not pks:
+        return existing, set()
+    with transaction.atomic():
+        added = fetch_column(get_sql(INSERT_SQL, model, pks), [user.pk, *pks])
+        if added:
+            relations_bulk_added.send(
+                sender=model, user_id=user.pk, pks=sorted(added)
+            )
+    return existing, added
+
+
+def remove(model, user, pks):
+    """
+    Удаляет записи модели model пользователя для рецептов или авторов pks
+    одним запросом DELETE. Сигналы post_delete не отправляются,
+    отправляется relations_bulk_removed. Возвращает удаленные pks.
+    """
+    with transaction.atomic():
+        removed = fetch_column(
+            get_sql(DELETE_SQL, model, pks), [user.pk, *pks]
+        )
+        if removed:
+            relations_bulk_removed.send(
+                sender=model, user_id=user.pk, pks=sorted(removed)
+            )
+    return removed
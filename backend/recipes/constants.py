@@ -14,3 +14,10 @@ RECIPE_NAME = 200
 # models MinValueValidator
 RECIPE_COOKING_TIME = 1
 INGREDIENT_AMOUNT = 1
+
+# popularity: вес события в популярности рецепта
+POPULARITY_FAVORITE_WEIGHT = 3.0
+POPULARITY_BASKET_WEIGHT = 2.0
+POPULARITY_VIEW_WEIGHT = 0.1
+# популярность меньше порога при снижении обнуляется
+POPULARITY_MIN = 0.01
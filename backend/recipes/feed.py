@@ -0,0 +1,181 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Q
+
+from recipes.models import Recipe, Subscription, Timeline
+
+User = get_user_model()
+
+TABLE = Timeline._meta.db_table
+SUBSCRIPTION_TABLE = Subscription._meta.db_table
+
+# записи ленты, не вошедшие в FEED_LENGTH новейших записей пользователя
+TRIM_SQL = f'''
+    DELETE FROM {TABLE} WHERE id IN (
+        SELECT id FROM (
+            SELECT id, ROW_NUMBER() OVER (
+                PARTITION BY user_id ORDER BY pub_date DESC, recipe_id DESC
+            ) AS position
+            FROM {TABLE} {{where}}
+        ) AS ranked
+        WHERE position > %s
+    )
+'''
+SUBSCRIBERS_WHERE = f'''
+    WHERE user_id IN (
+        SELECT user_id FROM {SUBSCRIPTION_TABLE} WHERE author_id = %s
+    )
+'''
+FAN_OUT_SQL = f'''
+    INSERT INTO {TABLE} (user_id, recipe_id, author_id, pub_date)
+    SELECT user_id, %s, author_id, %s FROM {SUBSCRIPTION_TABLE}
+    WHERE author_id = %s
+'''
+SUBSCRIBE_SQL = f'''
+    INSERT INTO {TABLE} (user_id, recipe_id, author_id, pub_date)
+    SELECT %s, id, author_id, pub_date FROM (
+        SELECT recipe.id, recipe.author_id, recipe.pub_date,
+            ROW_NUMBER() OVER (
+                PARTITION BY recipe.author_id
+                ORDER BY recipe.pub_date DESC, recipe.id DESC
+            ) AS position
+        FROM {Recipe._meta.db_table} AS recipe
+        JOIN {User._meta.db_table} AS author ON author.id = recipe.author_id
+        WHERE recipe.author_id IN ({{authors}})
+            AND author.subscribers_count < %s
+    ) AS latest
+    WHERE position <= %s
+    ON CONFLICT DO NOTHING
+'''
+REBUILD_SQL = f'''
+    INSERT INTO {TABLE} (user_id, recipe_id, author_id, pub_date)
+    SELECT subscription.user_id, recipe.id, recipe.author_id, recipe.pub_date
+    FROM {SUBSCRIPTION_TABLE} AS subscription
+    JOIN {User._meta.db_table} AS author
+        ON author.id = subscription.author_id
+    JOIN {Recipe._meta.db_table} AS recipe
+        ON recipe.author_id = subscription.author_id
+    WHERE author.subscribers_count < %s
+'''
+
+
+def execute(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
+
+
+def is_fanout_author(author):
+    """Рецепты автора рассылаются в ленты подписчиков при публикации."""
+    return author.subscribers_count < settings.FEED_FANOUT_THRESHOLD
+
+
+def trim(where='', params=()):
+    """Оставляет в лентах пользователей FEED_LENGTH новейших записей."""
+    execute(TRIM_SQL.format(where=where), [*params, settings.FEED_LENGTH])
+
+
+def fan_out(recipe):
+    """
+    Добавляет рецепт в ленты подписчиков автора.
+
+    Записи добавляются одним запросом INSERT ... SELECT по таблице
+    подписок, список подписчиков в приложение не загружается.
+    """
+    if not is_fanout_author(recipe.author):
+        return
+    pub_date = connection.ops.adapt_datetimefield_value(recipe.pub_date)
+    if execute(FAN_OUT_SQL, [recipe.pk, pub_date, recipe.author_id]):
+        trim(SUBSCRIBERS_WHERE, [recipe.author_id])
+
+
+def subscribe(user_id, author):
+    """Добавляет в ленту пользователя последние рецепты автора."""
+    if not is_fanout_author(author):
+        return
+    recipes = Recipe.objects.filter(author=author).order_by(
+        '-pub_date', '-id'
+    ).values_list('id', 'pub_date')[:settings.FEED_LENGTH]
+    Timeline.objects.bulk_create(
+        [Timeline(user_id=user_id, recipe_id=recipe_id, author=author,
+                  pub_date=pub_date)
+         for recipe_id, pub_date in recipes],
+        ignore_conflicts=True
+    )
+    trim('WHERE user_id = %s', [user_id])
+
+
+def subscribe_authors(user_id, author_ids):
+    """
+    Добавляет в ленту пользователя последние рецепты авторов author_ids
+    одним запросом INSERT ... SELECT.
+    """
+    if not author_ids:
+        return
+    sql = SUBSCRIBE_SQL.format(authors=', '.join(['%s'] * len(author_ids)))
+    if execute(sql, [
+        user_id, *author_ids, settings.FEED_FANOUT_THRESHOLD,
+        settings.FEED_LENGTH
+    ]):
+        trim('WHERE user_id = %s', [user_id])
+
+
+def unsubscribe(user_id, *author_ids):
+    Timeline.objects.filter(user=user_id, author__in=author_ids).delete()
+
+
+def rebuild():
+    """Заполняет ленты всех пользователей заново."""
+    Timeline.objects.all().delete()
+    execute(REBUILD_SQL, [settings.FEED_FANOUT_THRESHOLD])
+    trim()
+    return Timeline.objects.count()
+
+
+def get_keyset_filter(position, id_field):
+    """Условие выборки записей, следующих за position (pub_date, id)."""
+    pub_date, pk = position
+    return Q(pub_date__lt=pub_date) | Q(
+        pub_date=pub_date, **{f'{id_field}__lt': pk}
+    )
+
+
+def get_feed_ids(user, size, position=None, recipes=None):
+    """
+    Возвращает идентификаторы size рецептов ленты подписок пользователя,
+    следующих за position (pub_date, id), в порядке публикации.
+
+    Рецепты авторов с количеством подписчиков меньше
+    FEED_FANOUT_THRESHOLD рассылаются в таблицу лент при публикации
+    (fan-out on write), страница выбирается из таблицы лент
+    пользователя по индексу (user, pub_date, recipe). Рецепты популярных
+    авторов выбираются при чтении (fan-in on read): не более size
+    рецептов после position, запрос выполняется только при подписке на
+    таких авторов. Две выборки объединяются в порядке публикации, рецепт,
+    попавший в ленту до того, как автор стал популярным, выводится
+    один раз.
+    recipes - queryset рецептов, которыми ограничивается лента (фильтры).
+    """
+    timeline = Timeline.objects.filter(user=user)
+    if recipes is not None:
+        timeline = timeline.filter(recipe__in=recipes.values('id'))
+    if position is not None:
+        timeline = timeline.filter(get_keyset_filter(position, 'recipe_id'))
+    rows = list(timeline.order_by('-pub_date', '-recipe_id').values_list(
+        'pub_date', 'recipe_id'
+    )[:size])
+    authors = list(Subscription.objects.filter(
+        user=user,
+        author__subscribers_count__gte=settings.FEED_FANOUT_THRESHOLD
+    ).values_list('author_id', flat=True))
+    if authors:
+        fan_in = (Recipe.objects if recipes is None else recipes).filter(
+            author__in=authors
+        )
+        if position is not None:
+            fan_in = fan_in.filter(get_keyset_filter(position, 'id'))
+        rows.extend(fan_in.order_by('-pub_date', '-id').values_list(
+            'pub_date', 'id'
+        )[:size])
+    return [pk for _, pk in sorted(set(rows), reverse=True)[:size]]
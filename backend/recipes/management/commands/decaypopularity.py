@@ -0,0 +1,73 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max, Min
+
+from recipes import popularity
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """
+    Снижает популярность рецептов со временем.
+
+    Команда запускается периодически (cron) каждые
+    POPULARITY_DECAY_INTERVAL часов: популярность умножается на
+    0.5 ** (--hours / POPULARITY_HALF_LIFE). Рецепты обновляются
+    пакетами по --batch-size идентификаторов, каждый пакет - отдельной
+    транзакцией, поэтому блокировки строк кратковременны.
+    --reset заполняет популярность заново по счетчикам избранного
+    и корзин, нужна после массовой загрузки данных.
+    """
+    help = 'Снижает популярность рецептов со временем.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours', type=float,
+            help='Время с предыдущего запуска в часах '
+                 '(по умолчанию POPULARITY_DECAY_INTERVAL)'
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Заполнить популярность по счетчикам'
+        )
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            self.stdout.write('Заполнение популярности рецептов:')
+            self.stdout.write('-' * 60)
+            with transaction.atomic():
+                updated = popularity.reset()
+            self.stdout.write(f'Обновлено рецептов: {updated} \n\n')
+            return
+        hours = options['hours']
+        if hours is None:
+            hours = settings.POPULARITY_DECAY_INTERVAL
+        if hours < 0 or options['batch_size'] < 1:
+            raise CommandError(
+                'hours не может быть отрицательным, batch-size должен '
+                'быть больше нуля.'
+            )
+        factor = popularity.get_decay_factor(hours)
+        self.stdout.write(
+            f'Снижение популярности рецептов за {hours:g} ч '
+            f'(множитель {factor:.4f}):'
+        )
+        self.stdout.write('-' * 60)
+        popularity.flush_views(force=True)
+        bounds = Recipe.objects.filter(popularity__gt=0).aggregate(
+            start=Min('id'), stop=Max('id')
+        )
+        updated = batches = 0
+        if bounds['start'] is not None:
+            for start in range(
+                bounds['start'], bounds['stop'] + 1, options['batch_size']
+            ):
+                updated += popularity.decay(
+                    start, start + options['batch_size'], factor
+                )
+                batches += 1
+        self.stdout.write(
+            f'Обновлено рецептов: {updated}, пакетов: {batches} \n\n'
+        )
@@ -0,0 +1,282 @@
+import io
+import random
+import time
+from bisect import bisect
+from datetime import timedelta
+from itertools import accumulate, islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from PIL import Image
+
+from recipes.models import (Basket, Favorite, Foodstuff, Ingredient, Recipe,
+                            RecipeTag, Subscription, Tag)
+from recipes.signals import foodstuff_bulk_loaded, recipes_bulk_loaded
+
+User = get_user_model()
+
+UNITS = ('г', 'кг', 'мл', 'л', 'шт.', 'ст. л.', 'ч. л.', 'по вкусу')
+TAGS_PER_RECIPE = (1, 3)
+COOKING_TIME = (5, 180)
+AMOUNT = (1, 1000)
+PUB_DATE_PERIOD = timedelta(days=365)
+# попыток на одну уникальную пару при генерации связей
+PAIR_ATTEMPTS = 3
+
+
+def zipf_cum_weights(size, skew):
+    """Накопленные веса распределения Ципфа для рангов 1..size."""
+    return list(accumulate(1 / rank ** skew for rank in range(1, size + 1)))
+
+
+class Command(BaseCommand):
+    """
+    Создает данные заданного объема для нагрузочного тестирования.
+
+    Пользователи, рецепты и связи между ними добавляются пакетами
+    bulk_create в одной транзакции. Популярность подчиняется закону
+    Ципфа (--skew): немногие авторы публикуют большую часть рецептов и
+    собирают большую часть подписчиков, немногие рецепты попадают
+    в большую часть записей избранного и корзин. При одинаковых
+    параметрах и --seed создаются одинаковые данные.
+    Избранное, корзины и подписки создаются только для новых
+    пользователей, счетчики пересчитываются командой recount, ленты
+    подписок заполняются командой rebuildfeed, списки покупок - командой
+    rebuildshoppinglists, популярность рецептов - командой
+    decaypopularity --reset.
+    """
+    help = 'Создает данные заданного объема для нагрузочного тестирования.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument(
+            '--ingredients', type=int, default=8,
+            help='Количество ингредиентов в рецепте'
+        )
+        parser.add_argument(
+            '--tags', type=int, default=10,
+            help='Минимальное количество тегов'
+        )
+        parser.add_argument(
+            '--foodstuffs', type=int, default=2000,
+            help='Минимальное количество продуктов'
+        )
+        parser.add_argument('--favorites', type=int, default=20000)
+        parser.add_argument('--baskets', type=int, default=5000)
+        parser.add_argument('--subscriptions', type=int, default=10000)
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Показатель распределения Ципфа популярности'
+        )
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument(
+            '--prefix', default='bench',
+            help='Префикс имен создаваемых пользователей'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Количество записей в одном пакете'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('batch-size должен быть больше нуля.')
+        if options['users'] < 2:
+            raise CommandError('users должен быть не меньше двух.')
+        self.options = options
+        self.random = random.Random(options['seed'])
+        self.stdout.write('Создание данных:')
+        self.stdout.write('-' * 60)
+        start = time.monotonic()
+        with transaction.atomic():
+            tags = self.create_tags()
+            foodstuffs = self.create_foodstuffs()
+            users = self.create_users()
+            recipes = self.create_recipes(users)
+            self.create_recipe_relations(recipes, tags, foodstuffs)
+            self.create_user_relations(users, recipes)
+            self.reset_sequences()
+            call_command('recount', stdout=self.stdout)
+            call_command('rebuildfeed', stdout=self.stdout)
+            call_command('rebuildshoppinglists', stdout=self.stdout)
+            call_command('decaypopularity', reset=True, stdout=self.stdout)
+            recipes_bulk_loaded.send(sender=Recipe)
+        self.stdout.write(
+            f'Данные созданы за {time.monotonic() - start:.1f} с \n\n'
+        )
+
+    def bulk_create(self, model, objs, ignore_conflicts=False):
+        """Добавляет записи из итератора objs пакетами."""
+        objs = iter(objs)
+        created = 0
+        while True:
+            batch = list(islice(objs, self.options['batch_size']))
+            if not batch:
+                break
+            model.objects.bulk_create(batch, ignore_conflicts=ignore_conflicts)
+            created += len(batch)
+        self.stdout.write(
+            f'{model._meta.verbose_name_plural}: добавлено записей: {created}'
+        )
+
+    def next_ids(self, model, count):
+        start = (model.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+        return range(start, start + count)
+
+    def reset_sequences(self):
+        # идентификаторы пользователей и рецептов задаются явно
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(
+                no_style(), [User, Recipe]
+            ):
+                cursor.execute(sql)
+
+    def create_tags(self):
+        count = self.options['tags']
+        self.bulk_create(Tag, (
+            Tag(
+                name=f'Тег {number}', slug=f'tag-{number}',
+                color=f'#{self.random.randrange(0x1000000):06x}'
+            )
+            for number in range(1, count + 1)
+        ), ignore_conflicts=True)
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def create_foodstuffs(self):
+        count = self.options['foodstuffs'] - Foodstuff.objects.count()
+        if count > 0:
+            self.bulk_create(Foodstuff, (
+                Foodstuff(
+                    name=f'Продукт {number}',
+                    measurement_unit=self.random.choice(UNITS)
+                )
+                for number in range(1, count + 1)
+            ), ignore_conflicts=True)
+            foodstuff_bulk_loaded.send(sender=Foodstuff)
+        return list(Foodstuff.objects.values_list('id', flat=True))
+
+    def create_users(self):
+        ids = self.next_ids(User, self.options['users'])
+        password = make_password(None)
+        prefix = self.options['prefix']
+        self.bulk_create(User, (
+            User(
+                id=user_id, username=f'{prefix}{user_id}',
+                email=f'{prefix}{user_id}@example.com',
+                first_name='Имя', last_name=f'Фамилия {user_id}',
+                password=password
+            )
+            for user_id in ids
+        ))
+        users = list(ids)
+        # ранг популярности автора не зависит от порядка создания
+        self.random.shuffle(users)
+        return users
+
+    def create_recipes(self, users):
+        count = self.options['recipes']
+        ids = self.next_ids(Recipe, count)
+        authors = self.random.choices(
+            users, k=count,
+            cum_weights=zipf_cum_weights(len(users), self.options['skew'])
+        )
+        image = self.create_image()
+        self.bulk_create(Recipe, (
+            Recipe(
+                id=recipe_id, author_id=author_id,
+                name=f'Рецепт {recipe_id}',
+                text=f'Описание рецепта {recipe_id}',
+                cooking_time=self.random.randint(*COOKING_TIME), image=image
+            )
+            for recipe_id, author_id in zip(ids, authors)
+        ))
+        # pub_date (auto_now_add) распределяется по периоду
+        # PUB_DATE_PERIOD в порядке создания рецептов
+        now = timezone.now()
+        step = PUB_DATE_PERIOD / max(count, 1)
+        Recipe.objects.bulk_update(
+            [Recipe(id=recipe_id, pub_date=now - step * (count - index))
+             for index, recipe_id in enumerate(ids)],
+            ['pub_date'], batch_size=self.options['batch_size']
+        )
+        recipes = list(ids)
+        self.random.shuffle(recipes)
+        return recipes
+
+    def create_image(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (640, 480), (200, 120, 60)).save(buffer, 'JPEG')
+        field = Recipe._meta.get_field('image')
+        return field.storage.save(
+            field.generate_filename(None, 'generated.jpg'),
+            ContentFile(buffer.getvalue())
+        )
+
+    def create_recipe_relations(self, recipes, tags, foodstuffs):
+        ingredients = min(self.options['ingredients'], len(foodstuffs))
+        self.bulk_create(RecipeTag, (
+            RecipeTag(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipes
+            for tag_id in self.random.sample(
+                tags, min(self.random.randint(*TAGS_PER_RECIPE), len(tags))
+            )
+        ))
+        self.bulk_create(Ingredient, (
+            Ingredient(
+                recipe_id=recipe_id, foodstuff_id=foodstuff_id,
+                amount=self.random.randint(*AMOUNT)
+            )
+            for recipe_id in recipes
+            for foodstuff_id in self.random.sample(foodstuffs, ingredients)
+        ))
+
+    def create_user_relations(self, users, recipes):
+        skew = self.options['skew']
+        recipe_weights = zipf_cum_weights(len(recipes), skew)
+        author_weights = zipf_cum_weights(len(users), skew)
+        for model, count in (
+            (Favorite, self.options['favorites']),
+            (Basket, self.options['baskets']),
+        ):
+            pairs = self.get_pairs(users, recipes, recipe_weights, count)
+            self.bulk_create(model, (
+                model(user_id=user_id, recipe_id=recipe_id)
+                for user_id, recipe_id in pairs
+            ))
+        pairs = self.get_pairs(
+            users, users, author_weights, self.options['subscriptions']
+        )
+        self.bulk_create(Subscription, (
+            Subscription(user_id=user_id, author_id=author_id)
+            for user_id, author_id in pairs
+        ))
+
+    def get_pairs(self, users, targets, cum_weights, count):
+        """
+        Возвращает до count уникальных пар (пользователь, объект).
+
+        Пользователь выбирается равномерно, объект - по весам cum_weights.
+        """
+        if not targets:
+            return set()
+        pairs = set()
+        total = cum_weights[-1]
+        for _ in range(count * PAIR_ATTEMPTS):
+            if len(pairs) >= count:
+                break
+            user_id = self.random.choice(users)
+            target = targets[min(
+                bisect(cum_weights, self.random.random() * total),
+                len(targets) - 1
+            )]
+            if user_id != target:
+                pairs.add((user_id, target))
+        return pairs
@@ -1,34 +1,199 @@
 import csv
+import io
+import json
+import time
 from pathlib import Path
 
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 
+from recipes import constants as c
 from recipes.models import Foodstuff
+from recipes.signals import foodstuff_bulk_loaded
+
+FIELDS = ('name', 'measurement_unit')
+JSON_CHUNK_SIZE = 64 * 1024
+MAX_ERROR_MESSAGES = 20
+
+
+def read_csv(file):
+    yield from csv.DictReader(file)
+
+
+def read_json(file):
+    """
+    Читает массив JSON-объектов по частям, не загружая файл целиком.
+
+    Поддерживается также формат JSON Lines (объекты через перевод строки).
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    eof = False
+    while True:
+        buffer = buffer.lstrip(' \t\r\n,[]')
+        if not buffer:
+            if eof:
+                return
+            chunk = file.read(JSON_CHUNK_SIZE)
+            eof = not chunk
+            buffer = chunk
+            continue
+        try:
+            obj, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            chunk = file.read(JSON_CHUNK_SIZE)
+            eof = not chunk
+            buffer += chunk
+            continue
+        buffer = buffer[end:]
+        yield obj
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+    '.jsonl': read_json,
+}
 
 
 class Command(BaseCommand):
-    """Импортирует записи ингредиентов в базу данных."""
-
-    def handle(self, *args, **kwargs):
-        FILE_NAME = 'ingredients.csv'
-        with open(
-            Path(Path.cwd().resolve(), 'data', FILE_NAME),
-            newline='\r\n',
-            encoding='utf-8'
-        ) as file:
-            reader = csv.DictReader(file)
-            self.stdout.write(f'Импорт данных из файла {FILE_NAME}:')
-            self.stdout.write('-' * 60)
-            # счетчики
-            success = 0
-            errors = 0
-            for row in reader:
-                try:
-                    success += Foodstuff.objects.get_or_create(**row)[1]
-                except Exception as e:
-                    self.stdout.write(f'Ошибка импорта: {e}')
-                    errors += 1
-            self.stdout.write(
-                f'Из файла {FILE_NAME} импортировано записей: {success}, '
-                f'ошибок импорта: {errors} \n\n'
+    """
+    Импортирует записи продуктов в базу данных.
+
+    Файл (csv или json) читается потоково, дубликаты по ограничению
+    unique_foodstuff отбрасываются в памяти, записи добавляются пакетами
+    в одной транзакции. Для PostgreSQL используется COPY во временную
+    таблицу и INSERT ... ON CONFLICT DO NOTHING.
+    """
+    help = 'Импортирует продукты из файла csv или json.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'files', nargs='*',
+            default=[settings.BASE_DIR / 'data' / 'ingredients.csv'],
+            help='Файлы для импорта, по умолчанию data/ingredients.csv'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Количество записей в одном пакете'
+        )
+        parser.add_argument(
+            '--no-copy', action='store_true',
+            help='Не использовать COPY для PostgreSQL'
+        )
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        if self.batch_size < 1:
+            raise CommandError('batch-size должен быть больше нуля.')
+        self.use_copy = (
+            connection.vendor == 'postgresql' and not options['no_copy']
+        )
+        for file_name in options['files']:
+            self.import_file(Path(file_name))
+
+    def import_file(self, path):
+        reader = READERS.get(path.suffix.lower())
+        if reader is None:
+            raise CommandError(f'Неподдерживаемый формат файла: {path}')
+        self.stdout.write(f'Импорт данных из файла {path.name}:')
+        self.stdout.write('-' * 60)
+        self.inserted = self.skipped = self.errors = 0
+        start = time.monotonic()
+        with open(path, newline='', encoding='utf-8') as file:
+            with transaction.atomic():
+                existing = set(Foodstuff.objects.values_list(*FIELDS))
+                count = Foodstuff.objects.count()
+                if self.use_copy:
+                    self.create_temp_table()
+                batch = []
+                for row in reader(file):
+                    key = self.clean_row(row)
+                    if key is None:
+                        continue
+                    if key in existing:
+                        self.skipped += 1
+                        continue
+                    existing.add(key)
+                    batch.append(key)
+                    if len(batch) >= self.batch_size:
+                        self.insert(batch)
+                        batch = []
+                if batch:
+                    self.insert(batch)
+                if not self.use_copy:
+                    # bulk_create с ignore_conflicts не возвращает
+                    # количество добавленных строк, оно определяется
+                    # по количеству строк таблицы до и после загрузки
+                    inserted = Foodstuff.objects.count() - count
+                    self.skipped += self.inserted - inserted
+                    self.inserted = inserted
+                foodstuff_bulk_loaded.send(sender=Foodstuff)
+        elapsed = time.monotonic() - start
+        processed = self.inserted + self.skipped + self.errors
+        self.stdout.write(
+            f'Из файла {path.name} импортировано записей: {self.inserted}, '
+            f'пропущено дубликатов: {self.skipped}, '
+            f'ошибок импорта: {self.errors}, '
+            f'{processed / elapsed if elapsed else processed:.0f} записей/с '
+            '\n\n'
+        )
+
+    def clean_row(self, row):
+        try:
+            key = tuple(row[field].strip() for field in FIELDS)
+            if not all(key):
+                raise ValueError('пустое значение')
+            if len(key[0]) > c.FOODSTUFF_NAME:
+                raise ValueError('слишком длинное наименование')
+            if len(key[1]) > c.FOODSTUFF_UNIT:
+                raise ValueError('слишком длинная единица измерения')
+        except (KeyError, TypeError, AttributeError, ValueError) as e:
+            self.errors += 1
+            if self.errors <= MAX_ERROR_MESSAGES:
+                self.stdout.write(f'Ошибка импорта: {e} в записи {row}')
+            return None
+        return key
+
+    def insert(self, batch):
+        if self.use_copy:
+            inserted = self.copy(batch)
+            self.inserted += inserted
+            self.skipped += len(batch) - inserted
+            return
+        Foodstuff.objects.bulk_create(
+            [Foodstuff(name=name, measurement_unit=unit)
+             for name, unit in batch],
+            batch_size=self.batch_size, ignore_conflicts=True
+        )
+        # уточняется после загрузки файла по количеству строк таблицы
+        self.inserted += len(batch)
+
+    def create_temp_table(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE import_foodstuff '
+                '(name text, measurement_unit text) ON COMMIT DROP'
+            )
+
+    def copy(self, batch):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(batch)
+        buffer.seek(0)
+        table = Foodstuff._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                'COPY import_foodstuff (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)', buffer
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT name, measurement_unit FROM import_foodstuff '
+                'ON CONFLICT DO NOTHING'
             )
+            inserted = cursor.rowcount
+            cursor.execute('TRUNCATE import_foodstuff')
+        return inserted
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes import feed
+
+
+class Command(BaseCommand):
+    """
+    Заполняет ленты подписок пользователей заново.
+
+    Нужна после массовой загрузки данных и изменения
+    FEED_FANOUT_THRESHOLD или FEED_LENGTH.
+    """
+    help = 'Заполняет ленты подписок пользователей заново.'
+
+    def handle(self, *args, **kwargs):
+        self.stdout.write('Заполнение лент подписок:')
+        self.stdout.write('-' * 60)
+        with transaction.atomic():
+            count = feed.rebuild()
+        self.stdout.write(f'Записей в лентах: {count} \n\n')
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes import shopping_list
+
+
+class Command(BaseCommand):
+    """
+    Заполняет списки покупок пользователей заново.
+
+    Нужна после массовой загрузки данных, изменения приведения единиц
+    (recipes.units) и ручного изменения данных в базе.
+    """
+    help = 'Заполняет списки покупок пользователей заново.'
+
+    def handle(self, *args, **kwargs):
+        self.stdout.write('Заполнение списков покупок:')
+        self.stdout.write('-' * 60)
+        with transaction.atomic():
+            count = shopping_list.rebuild()
+        self.stdout.write(f'Записей в списках покупок: {count} \n\n')
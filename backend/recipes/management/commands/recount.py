@@ -0,0 +1,32 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from recipes.signals import COUNTERS
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    """Пересчитывает денормализованные счетчики пользователей и рецептов."""
+
+    def handle(self, *args, **kwargs):
+        self.stdout.write('Пересчет счетчиков:')
+        self.stdout.write('-' * 60)
+        with transaction.atomic():
+            for source, (model, fk_field, counter) in COUNTERS.items():
+                count = (
+                    source.objects.filter(**{fk_field: OuterRef('pk')}).
+                    order_by().values(fk_field).
+                    annotate(count=Count('pk')).values('count')
+                )
+                updated = model.objects.update(**{counter: Coalesce(
+                    Subquery(count), Value(0), output_field=IntegerField()
+                )})
+                self.stdout.write(
+                    f'{model._meta.verbose_name_plural}.{counter}: '
+                    f'обновлено записей: {updated}'
+                )
+        self.stdout.write('\n')
@@ -0,0 +1,47 @@
+# Generated by Django 3.2.3 on 2026-10-18 02:52
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('Recipe', 'users', 'User', 'author_id', 'recipes_count'),
+    ('Subscription', 'users', 'User', 'author_id', 'subscribers_count'),
+    ('Favorite', 'recipes', 'Recipe', 'recipe_id', 'favorites_count'),
+    ('Basket', 'recipes', 'Recipe', 'recipe_id', 'in_baskets_count'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for source_name, app_label, model_name, fk_field, counter in COUNTERS:
+        source = apps.get_model('recipes', source_name)
+        model = apps.get_model(app_label, model_name)
+        count = (
+            source.objects.filter(**{fk_field: OuterRef('pk')}).order_by().
+            values(fk_field).annotate(count=Count('pk')).values('count')
+        )
+        model.objects.update(**{counter: Coalesce(
+            Subquery(count), Value(0), output_field=IntegerField()
+        )})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_auto_20230817_1302'),
+        ('users', '0004_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Добавлено в избранное'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_baskets_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Добавлено в корзину'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.3 on 2026-10-18 03:02
+
+from django.db import migrations, models
+import recipes.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(db_index=True, storage=recipes.storage.ContentAddressedStorage(reference_field='image', reference_model='recipes.Recipe'), upload_to='recipes/images/', verbose_name='Изображение'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.2.3 on 2026-10-18 03:39
+
+from django.db import migrations, models
+from django.db.models import F
+
+# веса на момент миграции (recipes.constants), изменение констант
+# не должно менять миграцию
+POPULARITY_FAVORITE_WEIGHT = 3.0
+POPULARITY_BASKET_WEIGHT = 2.0
+
+
+def fill_popularity(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Recipe.objects.update(popularity=(
+        F('favorites_count') * POPULARITY_FAVORITE_WEIGHT
+        + F('in_baskets_count') * POPULARITY_BASKET_WEIGHT
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_timeline'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='popularity',
+            field=models.FloatField(default=0, editable=False, verbose_name='Популярность'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-popularity', '-id'], name='recipe_popularity_id'),
+        ),
+        migrations.RunPython(fill_popularity, migrations.RunPython.noop),
+    ]
@@ -2,8 +2,10 @@ from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, RegexValidator
 from django.db import models
+from django.utils import timezone
 
 from recipes import constants as c
+from recipes.storage import recipe_image_storage
 
 User = get_user_model()
 
@@ -73,16 +75,47 @@ class Recipe(models.Model):
         auto_now_add=True, db_index=True, verbose_name='Дата публикации'
     )
     image = models.ImageField(
-        upload_to='recipes/images/', verbose_name='Изображение'
+        upload_to='recipes/images/', storage=recipe_image_storage,
+        db_index=True, verbose_name='Изображение'
+    )
+    image_variants = models.JSONField(
+        default=dict, blank=True, editable=False,
+        verbose_name='Уменьшенные копии изображения'
     )
     tags = models.ManyToManyField(
         Tag, through='RecipeTag', related_name='recipes', verbose_name='Теги'
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Добавлено в избранное'
+    )
+    in_baskets_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Добавлено в корзину'
+    )
+    popularity = models.FloatField(
+        default=0, editable=False, verbose_name='Популярность'
+    )
+    # изменение состава продуктов, по нему обновляется индекс
+    # ингредиентов (api.ingredient_index)
+    ingredients_modified = models.DateTimeField(
+        default=timezone.now, db_index=True, editable=False,
+        verbose_name='Дата изменения ингредиентов'
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
-        ordering = ('-pub_date',)
+        ordering = ('-pub_date', '-id')
+        indexes = [
+            models.Index(
+                fields=['author', '-pub_date'], name='recipe_author_pub_date'
+            ),
+            models.Index(
+                fields=['-pub_date', '-id'], name='recipe_pub_date_id'
+            ),
+            models.Index(
+                fields=['-popularity', '-id'], name='recipe_popularity_id'
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -155,6 +188,83 @@ class Subscription(models.Model):
         return f'пользователь:{self.user}, автор рецепта:{self.author}'
 
 
+class Timeline(models.Model):
+    """
+    Модель таблицы лента подписок.
+
+    Содержит рецепты авторов, на которых подписан пользователь,
+    с количеством подписчиков меньше FEED_FANOUT_THRESHOLD
+    (см. recipes.feed).
+    """
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        related_name='timeline', verbose_name='Пользователь'
+    )
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name='+',
+        verbose_name='Рецепт'
+    )
+    author = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='+',
+        verbose_name='Автор'
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        verbose_name = 'Лента подписок'
+        verbose_name_plural = 'Ленты подписок'
+        ordering = ('user', '-pub_date')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'], name='unique_timeline'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='timeline_user_pub_date_recipe'
+            ),
+        ]
+
+    def __str__(self):
+        return f'пользователь:{self.user_id}, рецепт:{self.recipe_id}'
+
+
+class ShoppingListItem(models.Model):
+    """
+    Модель таблицы список покупок.
+
+    Содержит суммарное количество каждого продукта в рецептах корзины
+    пользователя, единицы измерения приведены к базовым (recipes.units).
+    Обновляется при изменении корзины (см. recipes.shopping_list).
+    """
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        related_name='shopping_list', verbose_name='Пользователь'
+    )
+    name = models.CharField(
+        max_length=c.FOODSTUFF_NAME, verbose_name='Наименование'
+    )
+    measurement_unit = models.CharField(
+        max_length=c.FOODSTUFF_UNIT, verbose_name='Единица измерения'
+    )
+    amount = models.BigIntegerField(verbose_name='Количество')
+
+    class Meta:
+        verbose_name = 'Продукт списка покупок'
+        verbose_name_plural = 'Списки покупок'
+        ordering = ('user', 'name')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'name', 'measurement_unit'],
+                name='unique_shopping_list_item'
+            )
+        ]
+
+    def __str__(self):
+        return f'пользователь:{self.user_id}, продукт:{self.name}'
+
+
 class Ingredient(models.Model):
     """Модель таблицы ингредиенты."""
     foodstuff = models.ForeignKey(
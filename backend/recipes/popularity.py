@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Greatest
+
+from recipes import constants as c
+from recipes.models import Basket, Favorite, Recipe
+
+# модель события: вес в популярности рецепта
+WEIGHTS = {
+    Favorite: c.POPULARITY_FAVORITE_WEIGHT,
+    Basket: c.POPULARITY_BASKET_WEIGHT,
+}
+
+_views = Counter()
+_views_lock = threading.Lock()
+_flushed_at = time.monotonic()
+
+
+def increment(weight):
+    """Выражение изменения популярности на weight, не ниже нуля."""
+    return Greatest(F('popularity') + weight, Value(0.0))
+
+
+def record_view(recipe_id):
+    """
+    Учитывает просмотр рецепта.
+
+    Просмотры накапливаются в памяти процесса и записываются в базу
+    данных flush_views, чтобы просмотр не выполнял запрос UPDATE.
+    Учет приблизительный: просмотры, не записанные до завершения или
+    аварийной остановки процесса, теряются.
+    """
+    try:
+        recipe_id = int(recipe_id)
+    except (TypeError, ValueError):
+        return
+    with _views_lock:
+        _views[recipe_id] += 1
+
+
+def flush_views(force=False):
+    """
+    Записывает накопленные просмотры в популярность рецептов.
+
+    Вызывается после завершения каждого запроса, в том числе GET
+    (recipes.signals.views_flushed). Без force просмотры записываются
+    не чаще одного раза в POPULARITY_VIEW_FLUSH_INTERVAL секунд. Рецепты
+    с одинаковым количеством просмотров обновляются одним запросом.
+    """
+    global _flushed_at
+    with _views_lock:
+        now = time.monotonic()
+        if not force and (
+            not _views
+            or now - _flushed_at < settings.POPULARITY_VIEW_FLUSH_INTERVAL
+        ):
+            return 0
+        views = _views.copy()
+        _views.clear()
+        _flushed_at = now
+    by_count = defaultdict(list)
+    for recipe_id, count in views.items():
+        by_count[count].append(recipe_id)
+    for count, ids in by_count.items():
+        Recipe.objects.filter(pk__in=ids).update(
+            popularity=increment(count * c.POPULARITY_VIEW_WEIGHT)
+        )
+    return sum(views.values())
+
+
+def get_decay_factor(hours):
+    """Множитель снижения популярности за hours часов."""
+    return 0.5 ** (hours / settings.POPULARITY_HALF_LIFE)
+
+
+def decay(start, stop, factor):
+    """
+    Умножает на factor популярность рецептов с id в [start, stop).
+
+    Популярность, которая после снижения станет меньше POPULARITY_MIN,
+    обнуляется.
+    """
+    return Recipe.objects.filter(
+        id__gte=start, id__lt=stop, popularity__gt=0
+    ).update(popularity=Case(
+        When(popularity__lt=c.POPULARITY_MIN / factor, then=Value(0.0)),
+        default=F('popularity') * factor,
+    ))
+
+
+def reset():
+    """Заполняет популярность рецептов по счетчикам избранного и корзин."""
+    return Recipe.objects.update(popularity=(
+        F('favorites_count') * c.POPULARITY_FAVORITE_WEIGHT
+        + F('in_baskets_count') * c.POPULARITY_BASKET_WEIGHT
+    ))
@@ -0,0 +1,174 @@
+import re
+
+from django.db import connections
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from recipes.models import Recipe
+
+SEARCH_CONFIG = 'russian'
+SEARCH_MIGRATION = ('recipes', '0008_recipe_search')
+# веса названия и текста рецепта для bm25 (SQLite)
+FTS_WEIGHTS = (10.0, 1.0)
+
+TABLE = Recipe._meta.db_table
+FTS_TABLE = f'{TABLE}_fts'
+WORD = re.compile(r'\w+')
+
+# миграция 0008_recipe_search содержит копию SQL на момент ее создания,
+# изменения объектов поиска оформляются новой миграцией
+POSTGRESQL_INSTALL = (
+    f'ALTER TABLE {TABLE} ADD COLUMN IF NOT EXISTS search_vector tsvector',
+    f'''CREATE OR REPLACE FUNCTION {TABLE}_search_vector_update()
+    RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('{SEARCH_CONFIG}',
+                                  coalesce(NEW.name, '')), 'A') ||
+            setweight(to_tsvector('{SEARCH_CONFIG}',
+                                  coalesce(NEW.text, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql''',
+    f'DROP TRIGGER IF EXISTS {TABLE}_search_vector ON {TABLE}',
+    f'''CREATE TRIGGER {TABLE}_search_vector
+    BEFORE INSERT OR UPDATE OF name, text ON {TABLE}
+    FOR EACH ROW EXECUTE FUNCTION {TABLE}_search_vector_update()''',
+    f'''CREATE INDEX IF NOT EXISTS recipe_search_vector
+    ON {TABLE} USING gin (search_vector)''',
+)
+POSTGRESQL_REBUILD = (
+    f'UPDATE {TABLE} SET name = name',
+)
+POSTGRESQL_UNINSTALL = (
+    f'DROP TRIGGER IF EXISTS {TABLE}_search_vector ON {TABLE}',
+    f'DROP FUNCTION IF EXISTS {TABLE}_search_vector_update()',
+    f'ALTER TABLE {TABLE} DROP COLUMN IF EXISTS search_vector',
+)
+
+SQLITE_INSTALL = (
+    f'''CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, text, content='{TABLE}', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )''',
+    f'''CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert
+    AFTER INSERT ON {TABLE} BEGIN
+        INSERT INTO {FTS_TABLE} (rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete
+    AFTER DELETE ON {TABLE} BEGIN
+        INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update
+    AFTER UPDATE OF name, text ON {TABLE} BEGIN
+        INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, name, text)
+        VALUES ('delete', old.id, old.name, old.text);
+        INSERT INTO {FTS_TABLE} (rowid, name, text)
+        VALUES (new.id, new.name, new.text);
+    END''',
+)
+SQLITE_REBUILD = (
+    f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('rebuild')",
+)
+SQLITE_UNINSTALL = (
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_insert',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_delete',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_update',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+)
+
+# vendor: (установка, перестроение индекса, удаление)
+SEARCH_SQL = {
+    'postgresql': (
+        POSTGRESQL_INSTALL, POSTGRESQL_REBUILD, POSTGRESQL_UNINSTALL
+    ),
+    'sqlite': (SQLITE_INSTALL, SQLITE_REBUILD, SQLITE_UNINSTALL),
+}
+
+
+def execute(connection, statements):
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+def install_search(connection, rebuild=False):
+    """
+    Создает объекты базы данных полнотекстового поиска рецептов.
+
+    PostgreSQL: столбец search_vector (tsvector, конфигурация russian)
+    с GIN-индексом, заполняемый триггером по названию (вес A) и тексту
+    (вес B). SQLite: таблица FTS5 с внешним содержимым и триггерами
+    синхронизации. Операция идемпотентна.
+    """
+    if connection.vendor not in SEARCH_SQL:
+        return
+    install, rebuild_sql, _ = SEARCH_SQL[connection.vendor]
+    execute(connection, install)
+    if rebuild:
+        execute(connection, rebuild_sql)
+
+
+def uninstall_search(connection):
+    if connection.vendor in SEARCH_SQL:
+        execute(connection, SEARCH_SQL[connection.vendor][2])
+
+
+def search_recipes(queryset, query):
+    """
+    Возвращает рецепты, соответствующие поисковому запросу query.
+
+    Рецепты аннотируются релевантностью search_rank (больше - выше).
+    PostgreSQL: websearch_to_tsquery и ts_rank по search_vector,
+    приведенный к float8: значение real не совпадает с float Python
+    после передачи в курсоре, и рецепт на границе страницы выводился
+    повторно или пропускался.
+    SQLite: слова запроса ищутся как префиксы в таблице FTS5,
+    релевантность - bm25 с весами FTS_WEIGHTS. Для других баз данных
+    выполняется поиск подстроки без ранжирования.
+    """
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        tsquery = f"websearch_to_tsquery('{SEARCH_CONFIG}', %s)"
+        return queryset.filter(RawSQL(
+            f'{TABLE}.search_vector @@ {tsquery}', (query,),
+            output_field=BooleanField()
+        )).annotate(search_rank=RawSQL(
+            f'ts_rank({TABLE}.search_vector, {tsquery})::float8', (query,),
+            output_field=FloatField()
+        ))
+    no_rank = Value(0.0, output_field=FloatField())
+    if vendor != 'sqlite':
+        return queryset.filter(
+            Q(name__icontains=query) | Q(text__icontains=query)
+        ).annotate(search_rank=no_rank)
+    words = WORD.findall(query.lower())
+    if not words:
+        return queryset.annotate(search_rank=no_rank).none()
+    match = ' '.join(f'"{word}"*' for word in words)
+    weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+    return queryset.filter(RawSQL(
+        f'{TABLE}.id IN (SELECT rowid FROM {FTS_TABLE} '
+        f'WHERE {FTS_TABLE} MATCH %s)', (match,),
+        output_field=BooleanField()
+    )).annotate(search_rank=RawSQL(
+        f'(SELECT -bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} '
+        f'WHERE {FTS_TABLE} MATCH %s AND rowid = {TABLE}.id)', (match,),
+        output_field=FloatField()
+    ))
+
+
+def reinstall_search(using, **kwargs):
+    """
+    Восстанавливает триггеры поиска после миграций.
+
+    SQLite пересоздает таблицу при изменении ее структуры, триггеры
+    таблицы при этом удаляются.
+    """
+    connection = connections[using]
+    recorder = MigrationRecorder(connection)
+    if SEARCH_MIGRATION in recorder.applied_migrations():
+        install_search(connection)
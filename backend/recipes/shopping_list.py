@@ -0,0 +1,148 @@
+from collections import defaultdict
+
+from django.db.models import Sum
+
+from recipes import units
+from recipes.feed import execute
+from recipes.models import Basket, Ingredient, ShoppingListItem
+
+TABLE = ShoppingListItem._meta.db_table
+
+# добавление количеств продуктов: одна строка VALUES на продукт
+UPSERT_SQL = f'''
+    INSERT INTO {TABLE} (user_id, name, measurement_unit, amount)
+    VALUES {{values}}
+    ON CONFLICT (user_id, name, measurement_unit)
+    DO UPDATE SET amount = {TABLE}.amount + excluded.amount
+'''
+DELETE_EMPTY_SQL = f'''
+    DELETE FROM {TABLE} WHERE user_id IN ({{users}}) AND amount <= 0
+'''
+BATCH_SIZE = 1000
+
+
+def aggregate(rows):
+    """
+    Суммирует строки (ключ, продукт, единица, количество) по ключу
+    и продукту с приведением единиц.
+    """
+    amounts = defaultdict(int)
+    for key, name, unit, amount in rows:
+        unit, amount = units.normalize(unit, amount)
+        amounts[key, name, unit] += amount
+    return amounts
+
+
+def get_recipe_amounts(*recipe_ids):
+    """
+    Возвращает суммарные количества продуктов рецептов
+    {(продукт, единица): количество}.
+    """
+    rows = Ingredient.objects.filter(recipe__in=recipe_ids).values_list(
+        'foodstuff__name', 'foodstuff__measurement_unit', 'amount'
+    )
+    return {
+        (name, unit): amount
+        for (_, name, unit), amount in aggregate(
+            (None, *row) for row in rows
+        ).items()
+    }
+
+
+def change(user_ids, amounts, sign):
+    """
+    Добавляет к спискам покупок пользователей user_ids количества
+    amounts {(продукт, единица): количество}, умноженные на sign.
+
+    Количества добавляются запросами INSERT ... ON CONFLICT по BATCH_SIZE
+    строк, продукты с нулевым количеством удаляются одним запросом.
+    """
+    if not user_ids or not amounts:
+        return
+    rows = [
+        (user_id, name, unit, sign * amount)
+        for user_id in user_ids
+        for (name, unit), amount in amounts.items()
+    ]
+    for start in range(0, len(rows), BATCH_SIZE):
+        batch = rows[start:start + BATCH_SIZE]
+        execute(
+            UPSERT_SQL.format(
+                values=', '.join(['(%s, %s, %s, %s)'] * len(batch))
+            ),
+            [value for row in batch for value in row]
+        )
+    if sign < 0:
+        execute(
+            DELETE_EMPTY_SQL.format(users=', '.join(['%s'] * len(user_ids))),
+            list(user_ids)
+        )
+
+
+def add_recipe(user_ids, *recipe_ids):
+    if user_ids and recipe_ids:
+        change(user_ids, get_recipe_amounts(*recipe_ids), 1)
+
+
+def remove_recipe(user_ids, *recipe_ids):
+    if user_ids and recipe_ids:
+        change(user_ids, get_recipe_amounts(*recipe_ids), -1)
+
+
+def rebuild(users=None):
+    """
+    Заполняет списки покупок пользователей users (всех при None) заново
+    по корзинам и ингредиентам рецептов.
+    """
+    items = ShoppingListItem.objects.all()
+    ingredients = Ingredient.objects.filter(recipe__basket__isnull=False)
+    if users is not None:
+        items = items.filter(user__in=users)
+        ingredients = ingredients.filter(recipe__basket__user__in=users)
+    items.delete()
+    rows = ingredients.values_list(
+        'recipe__basket__user', 'foodstuff__name',
+        'foodstuff__measurement_unit'
+    ).annotate(amount=Sum('amount')).order_by()
+    objs = [
+        ShoppingListItem(
+            user_id=user_id, name=name, measurement_unit=unit, amount=amount
+        )
+        for (user_id, name, unit), amount in aggregate(
+            rows.iterator()
+        ).items()
+    ]
+    ShoppingListItem.objects.bulk_create(objs, batch_size=BATCH_SIZE)
+    return len(objs)
+
+
+def get_recipe_users(recipe_id):
+    """Возвращает пользователей, у которых рецепт в корзине."""
+    return list(
+        Basket.objects.filter(recipe=recipe_id).values_list(
+            'user_id', flat=True
+        )
+    )
+
+
+def get_foodstuff_users(foodstuff_id):
+    """Возвращает пользователей, у которых продукт в рецептах корзины."""
+    return list(
+        Basket.objects.filter(
+            recipe__ingredients__foodstuff=foodstuff_id
+        ).values_list('user_id', flat=True).distinct()
+    )
+
+
+def get_items(user):
+    """
+    Возвращает строки списка покупок (продукт, единица, количество).
+
+    Строки читаются из таблицы списков покупок, количество строк равно
+    количеству разных продуктов, ингредиенты рецептов не читаются.
+    """
+    rows = ShoppingListItem.objects.filter(user=user).values_list(
+        'name', 'measurement_unit', 'amount'
+    ).order_by('name', 'measurement_unit')
+    for name, unit, amount in rows.iterator():
+        yield (name, *units.humanize(unit, amount))
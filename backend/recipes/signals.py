@@ -0,0 +1,212 @@
+import threading
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.core.signals import request_finished
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import Signal, receiver
+
+from recipes import feed, popularity, shopping_list
+from recipes.models import Basket, Favorite, Foodstuff, Recipe, Subscription
+
+User = get_user_model()
+
+# отправляется после массовой загрузки продуктов, при которой
+# сигналы post_save не отправляются
+foodstuff_bulk_loaded = Signal()
+# отправляется после массового добавления рецептов и связанных записей
+recipes_bulk_loaded = Signal()
+# отправляется после изменения ингредиентов рецепта, сигналы модели
+# Ingredient не используются, чтобы ингредиенты удалялись одним запросом;
+# created - рецепт создан, foodstuffs_changed=False - изменилось только
+# количество продуктов
+ingredients_changed = Signal()
+# отправляются после добавления и удаления записей избранного, корзины
+# и подписок пользователя user_id одним запросом (recipes.batch), pks -
+# идентификаторы рецептов или авторов добавленных и удаленных записей
+relations_bulk_added = Signal()
+relations_bulk_removed = Signal()
+
+# модель-источник: (модель со счетчиком, поле внешнего ключа, поле счетчика)
+COUNTERS = {
+    Recipe: (User, 'author_id', 'recipes_count'),
+    Subscription: (User, 'author_id', 'subscribers_count'),
+    Favorite: (Recipe, 'recipe_id', 'favorites_count'),
+    Basket: (Recipe, 'recipe_id', 'in_baskets_count'),
+}
+
+_deleting = threading.local()
+
+
+@contextmanager
+def deleting(instance):
+    """
+    Отключает обновление счетчиков instance на время его удаления.
+
+    При каскадном удалении связанных записей (избранное, корзина,
+    рецепты автора) счетчики удаляемого объекта не обновляются.
+    """
+    key = (type(instance), instance.pk)
+    objects = _deleting.__dict__.setdefault('objects', set())
+    objects.add(key)
+    try:
+        yield
+    finally:
+        objects.discard(key)
+
+
+def is_deleting(model, pk):
+    """Объект model с первичным ключом pk удаляется (deleting)."""
+    return (model, pk) in getattr(_deleting, 'objects', ())
+
+
+def update_counters(sender, pks, delta):
+    """
+    Изменяет на delta счетчики объектов pks, связанных с записями
+    модели sender, одним запросом.
+
+    Популярность рецептов (recipes.popularity) изменяется тем же запросом.
+    """
+    model, _, counter = COUNTERS[sender]
+    pks = [pk for pk in pks if not is_deleting(model, pk)]
+    if not pks:
+        return
+    fields = {counter: F(counter) + delta}
+    weight = popularity.WEIGHTS.get(sender)
+    if weight is not None:
+        fields['popularity'] = popularity.increment(weight * delta)
+    model.objects.filter(pk__in=pks).update(**fields)
+
+
+def update_counter(instance, delta):
+    """Изменяет на delta счетчик связанного с instance объекта."""
+    _, fk_field, _ = COUNTERS[type(instance)]
+    update_counters(type(instance), [getattr(instance, fk_field)], delta)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Subscription)
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=Basket)
+def increment_counter(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        update_counter(instance, 1)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Subscription)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=Basket)
+def decrement_counter(sender, instance, **kwargs):
+    update_counter(instance, -1)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_published(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        feed.fan_out(instance)
+
+
+@receiver(post_save, sender=Subscription)
+def subscribed(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        feed.subscribe(instance.user_id, instance.author)
+
+
+@receiver(post_delete, sender=Subscription)
+def unsubscribed(sender, instance, **kwargs):
+    feed.unsubscribe(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Basket)
+def basket_added(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        shopping_list.add_recipe([instance.user_id], instance.recipe_id)
+
+
+@receiver(pre_delete, sender=Basket)
+def basket_removed(sender, instance, **kwargs):
+    # до удаления записей: при удалении рецепта его ингредиенты
+    # удаляются в той же операции
+    if not is_deleting(Recipe, instance.recipe_id):
+        shopping_list.remove_recipe([instance.user_id], instance.recipe_id)
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_removed(sender, instance, **kwargs):
+    # при удалении рецепта в контексте deleting списки покупок всех
+    # пользователей изменяются вместе, а не для каждой записи корзины
+    if is_deleting(Recipe, instance.pk) and instance.in_baskets_count:
+        shopping_list.remove_recipe(
+            shopping_list.get_recipe_users(instance.pk), instance.pk
+        )
+
+
+@receiver(relations_bulk_added, sender=Subscription)
+@receiver(relations_bulk_added, sender=Favorite)
+@receiver(relations_bulk_added, sender=Basket)
+def bulk_increment_counters(sender, pks, **kwargs):
+    update_counters(sender, pks, 1)
+
+
+@receiver(relations_bulk_removed, sender=Subscription)
+@receiver(relations_bulk_removed, sender=Favorite)
+@receiver(relations_bulk_removed, sender=Basket)
+def bulk_decrement_counters(sender, pks, **kwargs):
+    update_counters(sender, pks, -1)
+
+
+@receiver(relations_bulk_added, sender=Subscription)
+def bulk_subscribed(sender, user_id, pks, **kwargs):
+    feed.subscribe_authors(user_id, pks)
+
+
+@receiver(relations_bulk_removed, sender=Subscription)
+def bulk_unsubscribed(sender, user_id, pks, **kwargs):
+    feed.unsubscribe(user_id, *pks)
+
+
+@receiver(relations_bulk_added, sender=Basket)
+def basket_bulk_added(sender, user_id, pks, **kwargs):
+    shopping_list.add_recipe([user_id], *pks)
+
+
+@receiver(relations_bulk_removed, sender=Basket)
+def basket_bulk_removed(sender, user_id, pks, **kwargs):
+    shopping_list.remove_recipe([user_id], *pks)
+
+
+@receiver(ingredients_changed, sender=Recipe)
+def recipe_ingredients_changed(sender, instance, created=False, **kwargs):
+    # нового рецепта нет в корзинах, счетчик корзин исключает запрос
+    # пользователей для рецептов, которых нет в корзинах
+    if created or not instance.in_baskets_count:
+        return
+    users = shopping_list.get_recipe_users(instance.pk)
+    if users:
+        shopping_list.rebuild(users)
+
+
+@receiver(post_save, sender=Foodstuff)
+def foodstuff_saved(sender, instance, created, raw=False, **kwargs):
+    if created or raw:
+        return
+    users = shopping_list.get_foodstuff_users(instance.pk)
+    if users:
+        shopping_list.rebuild(users)
+
+
+@receiver(pre_delete, sender=Foodstuff)
+def foodstuff_deleted(sender, instance, **kwargs):
+    # ингредиенты с продуктом удаляются каскадно, списки покупок
+    # заполняются заново после удаления
+    users = shopping_list.get_foodstuff_users(instance.pk)
+    if users:
+        transaction.on_commit(lambda: shopping_list.rebuild(users))
+
+
+@receiver(request_finished)
+def views_flushed(sender, **kwargs):
+    popularity.flush_views()
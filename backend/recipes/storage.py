@@ -0,0 +1,100 @@
+import hashlib
+import posixpath
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import connection, transaction
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Файловое хранилище с адресацией по содержимому.
+
+    Имя файла - SHA-256 содержимого, файлы распределяются по вложенным
+    каталогам по первым символам хеша: <каталог>/ab/cd/abcd...ef.png.
+    Одинаковые файлы хранятся в одном экземпляре, повторная загрузка
+    существующего файла не выполняет запись.
+    Количество ссылок на файл определяется по полю reference_field модели
+    reference_model (поле может содержать lookup), файл удаляется только
+    при отсутствии ссылок.
+
+    Сохранение и удаление файла выполняются под блокировкой его имени
+    до конца транзакции (lock): удаление ожидает фиксации рецепта,
+    который ссылается на уже существующий файл, и проверяет ссылки
+    после нее.
+    """
+
+    def __init__(self, reference_model=None, reference_field=None, **kwargs):
+        super().__init__(**kwargs)
+        self.reference_model = reference_model
+        self.reference_field = reference_field
+
+    def get_content_name(self, name, content):
+        sha256 = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for chunk in content.chunks(HASH_CHUNK_SIZE):
+            sha256.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        digest = sha256.hexdigest()
+        directory, file_name = posixpath.split(name)
+        extension = posixpath.splitext(file_name)[1].lower()
+        return posixpath.join(
+            directory, digest[:2], digest[2:4], f'{digest}{extension}'
+        )
+
+    @contextmanager
+    def lock(self, name):
+        """
+        Блокирует имя файла до конца транзакции (pg_advisory_xact_lock),
+        вне транзакции она начинается. В других базах данных блокировка
+        и транзакция не выполняются.
+        """
+        if connection.vendor != 'postgresql':
+            yield
+            return
+        key = int.from_bytes(
+            hashlib.sha256(name.encode()).digest()[:8], 'big', signed=True
+        )
+        with transaction.atomic(savepoint=False):
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_xact_lock(%s)', [key])
+            yield
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.get_content_name(name, content)
+        with self.lock(name):
+            if self.exists(name):
+                return name
+            return self._save(name, content)
+
+    def reference_count(self, name):
+        if self.reference_model is None:
+            return 0
+        model = apps.get_model(self.reference_model)
+        return model.objects.filter(**{self.reference_field: name}).count()
+
+    def delete(self, name):
+        with self.lock(name):
+            if self.reference_count(name):
+                return
+            super().delete(name)
+
+
+recipe_image_storage = ContentAddressedStorage(
+    reference_model='recipes.Recipe', reference_field='image'
+)
+# уменьшенные копии изображений: ссылки хранятся в JSON image_variants
+recipe_image_variant_storage = ContentAddressedStorage(
+    reference_model='recipes.Recipe',
+    reference_field='image_variants__icontains'
+)
@@ -0,0 +1,212 @@
+import io
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from recipes import batch, popularity
+from recipes.models import (Basket, Favorite, Foodstuff, Ingredient, Recipe,
+                            ShoppingListItem)
+from recipes.signals import deleting, update_counters
+
+User = get_user_model()
+
+
+def create_user(username):
+    return User.objects.create_user(
+        username=username, email=f'{username}@example.com', password='pass'
+    )
+
+
+class QueriesTest(TestCase):
+    """
+    Количество SQL-запросов массовых операций не зависит от количества
+    записей.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.users = [create_user(f'user{i}') for i in range(10)]
+        cls.foodstuffs = [
+            Foodstuff.objects.create(name=f'продукт{i}', measurement_unit='г')
+            for i in range(3)
+        ]
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.author, name=f'рецепт{i}', text='текст',
+                cooking_time=5, image='recipes/images/image.png'
+            )
+            for i in range(10)
+        ]
+        Ingredient.objects.bulk_create(
+            Ingredient(recipe=recipe, foodstuff=foodstuff, amount=10)
+            for recipe in cls.recipes
+            for foodstuff in cls.foodstuffs
+        )
+
+    def count_queries(self, func, *args):
+        with CaptureQueriesContext(connection) as context:
+            func(*args)
+        return len(context)
+
+    def get_pks(self, count):
+        return [recipe.pk for recipe in self.recipes[:count]]
+
+    def test_update_counters(self):
+        with self.assertNumQueries(1):
+            update_counters(Favorite, self.get_pks(10), 1)
+        self.assertEqual(
+            set(Recipe.objects.values_list('favorites_count', flat=True)),
+            {1}
+        )
+
+    def test_batch_favorites(self):
+        user, other = self.users[:2]
+        # рецепты, точка сохранения, добавление записей, счетчики,
+        # освобождение точки сохранения
+        with self.assertNumQueries(5):
+            batch.add(Favorite, user, self.get_pks(2))
+        self.assertEqual(
+            self.count_queries(batch.add, Favorite, other, self.get_pks(10)), 5
+        )
+        # точка сохранения, удаление записей, счетчики, освобождение
+        # точки сохранения
+        with self.assertNumQueries(4):
+            batch.remove(Favorite, other, self.get_pks(10))
+
+    def test_batch_baskets(self):
+        user, other = self.users[:2]
+        queries = self.count_queries(batch.add, Basket, user, self.get_pks(2))
+        self.assertEqual(
+            self.count_queries(batch.add, Basket, other, self.get_pks(10)),
+            queries
+        )
+        self.assertEqual(
+            self.count_queries(batch.remove, Basket, user, self.get_pks(2)),
+            self.count_queries(batch.remove, Basket, other, self.get_pks(10))
+        )
+        self.assertFalse(ShoppingListItem.objects.exists())
+
+    def delete_recipe(self, recipe):
+        recipe.refresh_from_db()
+        with deleting(recipe):
+            recipe.delete()
+
+    def test_delete_recipe_in_baskets(self):
+        first, second = self.recipes[:2]
+        for recipe, users in ((first, self.users[:2]), (second, self.users)):
+            for user in users:
+                batch.add(Basket, user, [recipe.pk])
+        queries = self.count_queries(self.delete_recipe, first)
+        self.assertEqual(
+            self.count_queries(self.delete_recipe, second), queries
+        )
+        self.assertFalse(ShoppingListItem.objects.exists())
+
+
+class ImportDataTest(TestCase):
+    """Команда importdata: количество добавленных и пропущенных записей."""
+
+    def test_counts(self):
+        Foodstuff.objects.create(name='соль', measurement_unit='г')
+        path = Path(tempfile.mkdtemp()) / 'foodstuffs.csv'
+        path.write_text(
+            'name,measurement_unit\nсоль,г\nперец,г\nперец,г\nмука,кг\n',
+            encoding='utf-8'
+        )
+        stdout = io.StringIO()
+        call_command('importdata', str(path), '--no-copy', stdout=stdout)
+        self.assertIn(
+            'импортировано записей: 2, пропущено дубликатов: 2',
+            stdout.getvalue()
+        )
+        self.assertEqual(Foodstuff.objects.count(), 3)
+
+
+class ImageStorageTest(TestCase):
+    """Файл изображения удаляется вместе с последним ссылающимся рецептом."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def create_recipe(self, name):
+        return Recipe.objects.create(
+            author=self.author, name=name, text='текст', cooking_time=5,
+            image=ContentFile(b'image', 'image.png')
+        )
+
+    def delete_recipe(self, recipe):
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+
+    def test_shared_image(self):
+        first = self.create_recipe('первый')
+        second = self.create_recipe('второй')
+        self.assertEqual(first.image.name, second.image.name)
+        storage = first.image.storage
+        self.delete_recipe(first)
+        self.assertTrue(storage.exists(second.image.name))
+        self.delete_recipe(second)
+        self.assertFalse(storage.exists(second.image.name))
+
+
+@override_settings(POPULARITY_HALF_LIFE=72)
+class DecayPopularityTest(TestCase):
+    """Команда decaypopularity: снижение популярности и обнуление."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = create_user('author')
+        cls.recipes = [
+            Recipe.objects.create(
+                author=author, name=f'рецепт{i}', text='текст',
+                cooking_time=5, image='recipes/images/image.png',
+                popularity=value
+            )
+            for i, value in enumerate((8.0, 0.015, 0.0))
+        ]
+
+    def setUp(self):
+        popularity._views.clear()
+        self.addCleanup(popularity._views.clear)
+
+    def get_popularity(self):
+        return [
+            Recipe.objects.get(pk=recipe.pk).popularity
+            for recipe in self.recipes
+        ]
+
+    def test_decay(self):
+        # накопленные просмотры записываются до снижения
+        popularity.record_view(self.recipes[2].pk)
+        stdout = io.StringIO()
+        call_command(
+            'decaypopularity', '--hours', '72', '--batch-size', '1',
+            stdout=stdout
+        )
+        first, second, third = self.get_popularity()
+        self.assertEqual(first, 4.0)
+        # популярность меньше POPULARITY_MIN после снижения обнуляется
+        self.assertEqual(second, 0.0)
+        self.assertAlmostEqual(third, 0.05)
+        self.assertIn('Обновлено рецептов: 3, пакетов: 3', stdout.getvalue())
+
+    def test_negative_hours(self):
+        with self.assertRaises(CommandError):
+            call_command('decaypopularity', '--hours', '-1')
+        self.assertEqual(self.get_popularity(), [8.0, 0.015, 0.0])
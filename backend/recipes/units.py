@@ -0,0 +1,59 @@
+# написание единицы: единица из data/ingredients.csv
+ALIASES = {
+    'гр': 'г',
+    'гр.': 'г',
+    'грамм': 'г',
+    'килограмм': 'кг',
+    'литр': 'л',
+    'миллилитр': 'мл',
+    'шт': 'шт.',
+    'штук': 'шт.',
+    'штука': 'шт.',
+    'ст.л.': 'ст. л.',
+    'ст. ложка': 'ст. л.',
+    'столовая ложка': 'ст. л.',
+    'ч.л.': 'ч. л.',
+    'ч. ложка': 'ч. л.',
+    'чайная ложка': 'ч. л.',
+}
+# единица: (базовая единица, количество базовых единиц в единице)
+CONVERSIONS = {
+    'кг': ('г', 1000),
+    'л': ('мл', 1000),
+}
+# базовая единица: (единица для вывода больших количеств, множитель)
+DISPLAY_UNITS = {
+    'г': ('кг', 1000),
+    'мл': ('л', 1000),
+}
+
+
+def clean_unit(unit):
+    """Нормализует написание единицы: пробелы, регистр, сокращения."""
+    unit = ' '.join(unit.split()).lower()
+    return ALIASES.get(unit, unit)
+
+
+def normalize(unit, amount):
+    """
+    Возвращает (базовая единица, количество в базовой единице).
+
+    Единицы массы и объема приводятся к граммам и миллилитрам, чтобы
+    количества одного продукта в г и кг, мл и л суммировались. Ложки
+    и стаканы не переводятся в миллилитры: их объем зависит от продукта.
+    """
+    unit = clean_unit(unit)
+    base_unit, factor = CONVERSIONS.get(unit, (unit, 1))
+    return base_unit, amount * factor
+
+
+def humanize(unit, amount):
+    """
+    Возвращает (единица, количество) для вывода: от 1000 г - в кг,
+    от 1000 мл - в л.
+    """
+    large_unit, factor = DISPLAY_UNITS.get(unit, (None, None))
+    if large_unit is None or amount < factor:
+        return unit, amount
+    amount = round(amount / factor, 3)
+    return large_unit, int(amount) if amount == int(amount) else amount
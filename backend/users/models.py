@@ -13,3 +13,9 @@ class User(AbstractUser):
             'unique': 'Пользователь с такой почтой уже существует.',
         },
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Количество рецептов'
+    )
+    subscribers_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Количество подписчиков'
+    )